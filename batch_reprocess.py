@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+生产任务单离线批量重新生成脚本
+
+不经过 Web 服务，直接对一个目录下的 PO PDF 批量运行 PDFExtractor + ExcelProcessor，
+适用于模板修改后需要重新生成大量任务单的场景。
+
+用法示例：
+    python batch_reprocess.py pdfs/ --customer 522 --task-orders orders.csv \
+        --order-date 2025-08-01 --delivery-date 2025-08-08
+
+任务单号映射文件支持：
+    - JSON 对象：{"文件名.pdf": "TW25040782(1)BC", ...}
+    - CSV 文件：包含 filename, task_order_no 两列
+
+输出目录下会生成 manifest.json / manifest.csv，记录每个文件的生成参数、耗时和失败原因；
+再次运行时会跳过已成功处理、生成参数（客户号、任务单号、日期）相同且输出文件仍存在的PDF，可中断后继续。
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import CACHE_DIR, EXTRACTION_CACHE_TTL, INFERENCE_TORCH_THREADS, MARKER_CONFIG_OVERRIDES, OUTPUT_DIR
+from utils.artifact_store import create_artifact_store, store_key
+from utils.excel_processor import ExcelProcessor
+from utils.extraction_cache import ExtractionCache
+from utils.inference_profile import (
+    InferenceProfile, PRESETS, apply_torch_threads, build_inference_profile, pin_current_worker
+)
+from utils.pdf_extractor import PDFExtractor
+from utils.template_locator import get_excel_template_path
+
+MANIFEST_JSON = "manifest.json"
+MANIFEST_CSV = "manifest.csv"
+# 生成参数：与 manifest 中的记录不同时需要重新生成
+PARAM_FIELDS = ["customer_code", "task_order_no", "order_date", "delivery_date"]
+MANIFEST_FIELDS = [
+    "filename", "sha256", *PARAM_FIELDS, "status", "outputs",
+    "extract_seconds", "throttle_seconds", "excel_seconds", "total_seconds", "error", "finished_time"
+]
+
+# 每个工作进程内的 PDFExtractor / ExcelProcessor，只在进程启动时初始化一次
+_worker_state = {}
+
+
+def default_workers() -> int:
+    """根据机器核数确定默认进程数，marker 推理本身是多线程的，每个进程预留约4个核心"""
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+def load_task_orders(mapping_path: Optional[str]) -> Dict[str, str]:
+    """读取 文件名 -> 任务单号 的映射文件（JSON 或 CSV）"""
+    if not mapping_path:
+        return {}
+
+    path = Path(mapping_path)
+    if path.suffix.lower() == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("任务单号 JSON 文件必须是 {文件名: 任务单号} 格式")
+        return {str(k): str(v).strip() for k, v in data.items()}
+
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return {row["filename"]: row["task_order_no"].strip() for row in csv.DictReader(f)}
+
+
+def load_manifest(output_dir: Path) -> Dict[str, Dict[str, Any]]:
+    """读取已有的 manifest，用于断点续跑"""
+    manifest_path = output_dir / MANIFEST_JSON
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return {record["filename"]: record for record in json.load(f)}
+
+
+def save_manifest(output_dir: Path, records: Dict[str, Dict[str, Any]]):
+    """写入 manifest.json 和 manifest.csv（先写临时文件再替换，中断时不会损坏）"""
+    rows = sorted(records.values(), key=lambda r: r["filename"])
+
+    tmp_json = output_dir / f"{MANIFEST_JSON}.tmp"
+    with open(tmp_json, "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_json, output_dir / MANIFEST_JSON)
+
+    tmp_csv = output_dir / f"{MANIFEST_CSV}.tmp"
+    with open(tmp_csv, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({**row, "outputs": ";".join(row.get("outputs") or [])})
+    os.replace(tmp_csv, output_dir / MANIFEST_CSV)
+
+
+def is_completed(record: Optional[Dict[str, Any]], sha256: str, params: Dict[str, str]) -> bool:
+    """PDF 内容和生成参数均未变化、上次处理成功且输出文件仍存在时，视为已完成"""
+    if not record or record.get("status") != "completed" or record.get("sha256") != sha256:
+        return False
+    if any(record.get(field) != value for field, value in params.items()):
+        return False
+    return all(Path(p).exists() for p in record.get("outputs") or [])
+
+
+def new_record(filename: str, sha256: str, params: Dict[str, str], error: str = "") -> Dict[str, Any]:
+    """manifest 记录（初始为失败状态，处理成功后更新）"""
+    return {
+        "filename": filename,
+        "sha256": sha256,
+        **params,
+        "status": "error",
+        "outputs": [],
+        "extract_seconds": None,
+        "throttle_seconds": None,
+        "excel_seconds": None,
+        "total_seconds": None,
+        "error": error,
+        "finished_time": datetime.now().isoformat() if error else None,
+    }
+
+
+def init_worker(cache_ttl: Optional[int], use_cache: bool, profile: InferenceProfile, worker_counter):
+    """工作进程初始化：绑定核心、设置 torch 线程数，加载 marker 模型和 Excel 处理类"""
+    if profile.core_sets:
+        with worker_counter.get_lock():
+            index = worker_counter.value
+            worker_counter.value += 1
+        pin_current_worker(profile.core_sets[index % len(profile.core_sets)])
+    apply_torch_threads(profile)
+
+    # 与 Web 服务使用同一产物存储中的缓存；存储客户端不能跨进程传递，在每个进程中创建
+    cache = ExtractionCache(create_artifact_store().sub_store(store_key(CACHE_DIR)), ttl=cache_ttl) if use_cache else None
+    _worker_state["pdf_extractor"] = PDFExtractor(cache=cache, inference_profile=profile)
+    _worker_state["excel_processor"] = ExcelProcessor()
+
+
+def process_one(pdf_path: str, sha256: str, params: Dict[str, str], templates: Dict[str, str], template_reference,
+                output_dir: str) -> Dict[str, Any]:
+    """在工作进程中处理单个PDF，返回 manifest 记录"""
+    pdf_extractor = _worker_state["pdf_extractor"]
+    excel_processor = _worker_state["excel_processor"]
+    pdf_name = Path(pdf_path).stem
+    record = new_record(Path(pdf_path).name, sha256, params)
+
+    start = time.perf_counter()
+    try:
+        pdf_info, template_2_info = pdf_extractor.process(
+            pdf_path, templates, template_reference, sha256,
+            throttle_callback=lambda seconds: record.update(throttle_seconds=round(seconds, 3))
+        )
+        record["extract_seconds"] = round(time.perf_counter() - start, 3)
+
+        excel_start = time.perf_counter()
+        # 以PDF文件名作为任务标识，输出文件夹为 客户号_文件名，重复运行时覆盖同一位置
+        saved_paths = excel_processor.process(pdf_info, template_2_info, params["task_order_no"], params["order_date"],
+                                              params["delivery_date"], output_dir, pdf_name, params["customer_code"],
+                                              pdf_name)
+        record["excel_seconds"] = round(time.perf_counter() - excel_start, 3)
+        record["outputs"] = sorted(saved_paths.values())
+        record["status"] = "completed"
+    except Exception as e:
+        record["error"] = str(e)
+
+    record["total_seconds"] = round(time.perf_counter() - start, 3)
+    record["finished_time"] = datetime.now().isoformat()
+    return record
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="离线批量重新生成生产任务单")
+    parser.add_argument("pdf_dir", help="PO PDF 所在目录")
+    parser.add_argument("--customer", required=True, help="客户号，对应 company_templates/<客户号>")
+    parser.add_argument("--task-orders", help="文件名 -> 任务单号 映射文件（JSON 或 CSV）")
+    parser.add_argument("--default-task-order-no", help="映射文件中没有的PDF使用的任务单号")
+    parser.add_argument("--order-date", default=datetime.now().strftime("%Y-%m-%d"), help="制单日期，默认今天")
+    parser.add_argument("--delivery-date", required=True, help="交货期")
+    parser.add_argument("--output-dir", default=str(OUTPUT_DIR / "reprocess"), help="输出目录")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="进程数，默认按CPU核数确定")
+    parser.add_argument("--profile", choices=list(PRESETS), default="throughput",
+                        help="CPU 推理配置，默认 throughput：按进程数分配线程并绑定核心")
+    parser.add_argument("--no-cache", action="store_true", help="不使用抽取结果缓存")
+    parser.add_argument("--force", action="store_true", help="忽略 manifest，全部重新处理")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """主函数"""
+    args = parse_args(argv)
+
+    pdf_dir = Path(args.pdf_dir)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    pdf_paths = sorted(p for p in pdf_dir.iterdir() if p.is_file() and p.suffix.lower() == ".pdf")
+    if not pdf_paths:
+        print(f"目录 {pdf_dir} 中没有PDF文件")
+        return 1
+
+    task_orders = load_task_orders(args.task_orders)
+    templates = get_excel_template_path(args.customer)
+    # 模板中的客户货号只加载一次，所有进程共享
+    template_reference = PDFExtractor.get_customer_codes_reference(templates)
+
+    records = {} if args.force else load_manifest(output_dir)
+    jobs = []
+    skipped = 0  # manifest 中已成功的文件
+    missing_task_order = 0  # 缺少任务单号、直接记为失败的文件
+    for pdf_path in pdf_paths:
+        sha256 = ExtractionCache.file_sha256(pdf_path)
+        params = {
+            "customer_code": args.customer,
+            "task_order_no": task_orders.get(pdf_path.name, args.default_task_order_no) or "",
+            "order_date": args.order_date,
+            "delivery_date": args.delivery_date,
+        }
+        if not params["task_order_no"]:
+            records[pdf_path.name] = new_record(pdf_path.name, sha256, params, error="缺少任务单号")
+            missing_task_order += 1
+            print(f"❌ {pdf_path.name}: 缺少任务单号")
+            continue
+
+        if not args.force and is_completed(records.get(pdf_path.name), sha256, params):
+            skipped += 1
+            continue
+        jobs.append((str(pdf_path), sha256, params))
+
+    profile = build_inference_profile(args.profile, args.workers, INFERENCE_TORCH_THREADS,
+                                      marker_overrides=MARKER_CONFIG_OVERRIDES)
+    print(f"共 {len(pdf_paths)} 个PDF，待处理 {len(jobs)} 个，跳过 {skipped} 个，缺少任务单号 {missing_task_order} 个，"
+          f"进程数 {args.workers}")
+    print(f"CPU 推理配置: {json.dumps(profile.describe(), ensure_ascii=False)}")
+    save_manifest(output_dir, records)
+
+    start = time.perf_counter()
+    failed = 0  # 处理失败的文件，不含缺少任务单号的文件
+    if jobs:
+        with ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=init_worker,
+            initargs=(EXTRACTION_CACHE_TTL, not args.no_cache, profile, multiprocessing.Value("i", 0))
+        ) as executor:
+            futures = {}
+            for index, (pdf_path, sha256, params) in enumerate(jobs):
+                try:
+                    future = executor.submit(process_one, pdf_path, sha256, params, templates, template_reference,
+                                             str(output_dir))
+                except BrokenProcessPool as e:
+                    # 进程池已损坏（如工作进程初始化失败），尚未提交的文件直接记为失败
+                    for pdf_path, sha256, params in jobs[index:]:
+                        records[Path(pdf_path).name] = new_record(Path(pdf_path).name, sha256, params,
+                                                                  error=f"工作进程异常退出: {e}")
+                        failed += 1
+                        print(f"❌ {Path(pdf_path).name}: 工作进程异常退出")
+                    save_manifest(output_dir, records)
+                    break
+                futures[future] = (pdf_path, sha256, params)
+            for done_count, future in enumerate(as_completed(futures), start=1):
+                try:
+                    record = future.result()
+                except BrokenProcessPool as e:
+                    # 工作进程异常退出时未完成的文件都会失败，逐个记录到 manifest，不中断整个运行
+                    pdf_path, sha256, params = futures[future]
+                    record = new_record(Path(pdf_path).name, sha256, params, error=f"工作进程异常退出: {e}")
+                records[record["filename"]] = record
+                # 每完成一个就写一次 manifest，中断后可从此处继续
+                save_manifest(output_dir, records)
+
+                if record["status"] != "completed":
+                    failed += 1
+                    print(f"[{done_count}/{len(jobs)}] ❌ {record['filename']}: {record['error']}")
+                else:
+                    print(f"[{done_count}/{len(jobs)}] ✅ {record['filename']} ({record['total_seconds']:.1f}秒)")
+
+    duration = time.perf_counter() - start
+    print("-" * 50)
+    print(f"处理完成：成功 {len(jobs) - failed} 个，失败 {failed + missing_task_order} 个，跳过 {skipped} 个，"
+          f"耗时 {duration:.1f}秒")
+    print(f"清单文件: {output_dir / MANIFEST_JSON}")
+    return 1 if failed or missing_task_order else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
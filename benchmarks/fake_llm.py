@@ -0,0 +1,169 @@
+"""
+本地模拟的 dashscope 文本生成服务
+按合成 PO 的固定格式从提示词中"抽取"信息，并按配置的延迟返回，用于基准测试和压测，不消耗真实 API 额度。
+
+单独运行：
+    python -m benchmarks.fake_llm --port 18080 --latency 1.5 --jitter 0.3
+然后设置 AI_API_URL=http://127.0.0.1:18080/api/v1 启动应用
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+# 与 benchmarks.synthetic.write_po_pdf 生成的产品行对应：行号  货号  Synthetic product N  数量
+# marker 可能把产品行转换为 markdown 表格，因此只按 "描述关键字 + 货号 + 行末数量" 宽松匹配
+ITEM_MARKER = "Synthetic product"
+ITEM_CODE_PATTERN = re.compile(r"\b([A-Z]{2,}\d{3,}[A-Z]?)\b")
+QUANTITY_PATTERN = re.compile(r"(\d[\d,]*)\D*$")
+PO_NO_PATTERN = re.compile(r"PURCHASE ORDER NUMBER:\s*(\w+)")
+ORDER_MARKER = "## 待处理采购订单："
+
+
+def fake_extract(prompt: str) -> Dict:
+    """从提示词中的 PO 文本里抽取 po_no 和产品信息"""
+    order_text = prompt.split(ORDER_MARKER, 1)[-1]
+    po_match = PO_NO_PATTERN.search(order_text)
+    return {
+        "po_no": po_match.group(1) if po_match else "",
+        "product_info": [
+            {"cust_item_code": code_match.group(1), "quantity": int(quantity_match.group(1).replace(",", ""))}
+            for line in order_text.splitlines() if ITEM_MARKER in line
+            for code_match, quantity_match in [(ITEM_CODE_PATTERN.search(line), QUANTITY_PATTERN.search(line))]
+            if code_match and quantity_match
+        ],
+    }
+
+
+class FakeLLMServer:
+    """
+    模拟 dashscope Generation 接口的 HTTP 服务
+
+    Args:
+        host / port: 监听地址，port 为 0 时自动分配
+        latency: 每次请求的基础延迟（秒）
+        jitter: 延迟的随机波动范围（秒）
+        seconds_per_1k_output_tokens: 按输出长度额外增加的延迟，模拟长输出更慢
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 1.0, jitter: float = 0.0,
+                 seconds_per_1k_output_tokens: float = 0.0, seed: Optional[int] = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.seconds_per_1k_output_tokens = seconds_per_1k_output_tokens
+        self.request_count = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._httpd.server_address[:2]
+
+    @property
+    def base_url(self) -> str:
+        """dashscope.base_http_api_url 应设置的地址"""
+        host, port = self.address
+        return f"http://{host}:{port}/api/v1"
+
+    def _delay(self, output_tokens: int) -> float:
+        with self._lock:
+            self.request_count += 1
+            jitter = self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        return max(0.0, self.latency + jitter + self.seconds_per_1k_output_tokens * output_tokens / 1000)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    payload = json.loads(body)
+                    messages = payload["input"]["messages"]
+                    prompt = "\n".join(m.get("content", "") for m in messages)
+                except (ValueError, KeyError, TypeError):
+                    self._reply(400, {"code": "InvalidParameter", "message": "invalid request body"})
+                    return
+
+                content = json.dumps(fake_extract(prompt), ensure_ascii=False)
+                # 粗略估算 token 数：约 2 个字符 1 个 token
+                input_tokens = len(prompt) // 2
+                output_tokens = len(content) // 2
+                time.sleep(server._delay(output_tokens))
+                self._reply(200, {
+                    "request_id": str(uuid.uuid4()),
+                    "output": {
+                        "choices": [{
+                            "finish_reason": "stop",
+                            "message": {"role": "assistant", "content": content},
+                        }]
+                    },
+                    "usage": {
+                        "input_tokens": input_tokens,
+                        "output_tokens": output_tokens,
+                        "total_tokens": input_tokens + output_tokens,
+                    },
+                })
+
+            def _reply(self, status: int, data: Dict):
+                raw = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, format, *args):
+                # 压测时请求量很大，不输出访问日志
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeLLMServer":
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    """命令行启动模拟服务"""
+    parser = argparse.ArgumentParser(description="本地模拟 dashscope 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=1.0, help="基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机波动（秒）")
+    parser.add_argument("--per-1k-output-tokens", type=float, default=0.0, help="每1000输出token额外延迟（秒）")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(args.host, args.port, args.latency, args.jitter, args.per_1k_output_tokens, seed=None)
+    print(f"模拟 LLM 服务已启动: AI_API_URL={server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+HTTP 服务压测工具
+
+按设定的到达模式（匀速 / 月底集中提交）向本地运行的应用提交 PO，
+每个提交依次执行 上传 -> 轮询状态 -> 下载，统计各接口的吞吐量和 p50/p95/p99 延迟，
+同时定期采样 /admin/runtime 的事件循环延迟、队列深度和内存，用于确定 MAX_CONCURRENT_TASKS 和工作进程数。
+
+典型用法（应用指向模拟 LLM 服务，避免消耗 API 额度）：
+    python -m benchmarks.fake_llm --port 18080 --latency 2 --jitter 0.5
+    ADMIN_TOKEN=loadtest AI_API_URL=http://127.0.0.1:18080/api/v1 MAX_CONCURRENT_TASKS=10 python run.py
+    python -m benchmarks.loadtest --setup-customer --admin-token loadtest --pattern steady --rate 0.5 --duration 300
+    python -m benchmarks.loadtest --setup-customer --admin-token loadtest --pattern burst --rate 0.1 --burst-size 40 --burst-every 120
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.synthetic import make_item_codes, make_po_info, write_customer_templates, write_po_pdf
+
+BENCHMARK_DIR = Path(__file__).parent
+DEFAULT_RESULTS = BENCHMARK_DIR / "results" / "loadtest.json"
+LOADTEST_CUSTOMER = "LOADTEST"
+
+
+@dataclass
+class RequestRecord:
+    """一次 HTTP 请求的结果"""
+    endpoint: str
+    start: float
+    latency: float
+    status_code: int
+
+
+@dataclass
+class LoadTestState:
+    """压测过程中收集的所有数据"""
+    started_at: float = field(default_factory=time.perf_counter)
+    requests: List[RequestRecord] = field(default_factory=list)
+    task_durations: List[float] = field(default_factory=list)
+    task_outcomes: Dict[str, int] = field(default_factory=dict)
+    runtime_samples: List[Dict[str, Any]] = field(default_factory=list)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def count_outcome(self, outcome: str):
+        self.task_outcomes[outcome] = self.task_outcomes.get(outcome, 0) + 1
+
+
+def arrival_offsets(pattern: str, duration: float, rate: float, burst_size: int, burst_every: float,
+                    seed: int) -> List[float]:
+    """
+    生成提交时间点（相对压测开始的秒数）
+
+    - steady：按 rate（个/秒）的泊松过程到达
+    - burst：在 steady 的基础上，每 burst_every 秒同时到达 burst_size 个，模拟月底集中下单
+    """
+    rng = random.Random(seed)
+    offsets = []
+    if rate > 0:
+        t = rng.expovariate(rate)
+        while t < duration:
+            offsets.append(t)
+            t += rng.expovariate(rate)
+    if pattern == "burst":
+        t = 0.0
+        while t < duration:
+            # 一次集中提交在 1 秒内陆续到达
+            offsets.extend(t + rng.uniform(0, 1) for _ in range(burst_size))
+            t += burst_every
+    return sorted(offsets)
+
+
+async def timed_request(client: httpx.AsyncClient, state: LoadTestState, endpoint: str, method: str, url: str,
+                        **kwargs) -> Optional[httpx.Response]:
+    """发送请求并记录延迟，连接失败时状态码记为 0"""
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        status_code = response.status_code
+    except httpx.HTTPError:
+        response = None
+        status_code = 0
+    state.requests.append(RequestRecord(endpoint, start - state.started_at, time.perf_counter() - start, status_code))
+    return response
+
+
+async def run_session(client: httpx.AsyncClient, state: LoadTestState, index: int, pdf_path: Path,
+                      customer_code: str, poll_interval: float, task_timeout: float):
+    """一次完整的用户提交：上传 -> 轮询状态直到完成 -> 下载"""
+    session_start = time.perf_counter()
+    # 每次提交使用不同的任务单号，避免被服务端识别为重复提交
+    form = {
+        "task_order_no": f"LT{index:08d}(1)BC",
+        "order_date": "2025-01-01",
+        "delivery_date": "2025-01-08",
+        "customer_code": customer_code,
+    }
+    with open(pdf_path, "rb") as f:
+        response = await timed_request(client, state, "upload", "POST", "/upload", data=form,
+                                       files={"pdf_file": (pdf_path.name, f, "application/pdf")})
+    if response is None or response.status_code != 200:
+        state.count_outcome("upload_failed")
+        return
+    task_id = response.json()["task_id"]
+
+    deadline = session_start + task_timeout
+    status = "processing"
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(poll_interval)
+        response = await timed_request(client, state, "status", "GET", f"/status/{task_id}")
+        if response is not None and response.status_code == 200:
+            status = response.json().get("status", "processing")
+            if status in ("completed", "error"):
+                break
+    else:
+        state.count_outcome("timeout")
+        return
+
+    if status == "error":
+        state.count_outcome("error")
+        return
+
+    response = await timed_request(client, state, "download", "GET", f"/download/{task_id}")
+    if response is None or response.status_code != 200:
+        state.count_outcome("download_failed")
+        return
+    state.task_durations.append(time.perf_counter() - session_start)
+    state.count_outcome("completed")
+
+
+async def sample_runtime(client: httpx.AsyncClient, state: LoadTestState, interval: float, admin_token: Optional[str]):
+    """定期采样服务端运行状态"""
+    headers = {"X-Admin-Token": admin_token} if admin_token else {}
+    while True:
+        try:
+            response = await client.get("/admin/runtime", headers=headers)
+            if response.status_code == 200:
+                state.runtime_samples.append({"t": round(state.elapsed(), 2), **response.json()})
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def latency_summary(values: List[float]) -> Dict[str, Any]:
+    """延迟统计（毫秒）"""
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2),
+        "mean_ms": round(statistics.fmean(values) * 1000, 2),
+    }
+
+
+def summarize(state: LoadTestState, wall_time: float) -> Dict[str, Any]:
+    """汇总各接口延迟、吞吐量和服务端运行状态"""
+    endpoints: Dict[str, Any] = {}
+    for endpoint in sorted({r.endpoint for r in state.requests}):
+        records = [r for r in state.requests if r.endpoint == endpoint]
+        endpoints[endpoint] = {
+            **latency_summary([r.latency for r in records]),
+            "errors": sum(1 for r in records if r.status_code == 0 or r.status_code >= 400),
+            "throughput_rps": round(len(records) / wall_time, 3),
+        }
+
+    def series_max(key, sub=None):
+        values = [(s[key][sub] if sub else s[key]) for s in state.runtime_samples]
+        values = [v for v in values if v is not None]
+        return max(values) if values else None
+
+    return {
+        "wall_time_s": round(wall_time, 2),
+        "tasks": state.task_outcomes,
+        "task_throughput_per_min": round(state.task_outcomes.get("completed", 0) / wall_time * 60, 2),
+        "task_duration": latency_summary(state.task_durations),
+        "endpoints": endpoints,
+        "server": {
+            "samples": len(state.runtime_samples),
+            "max_event_loop_lag_ms": series_max("event_loop_lag", "max_ms"),
+            "max_queue_depth": series_max("queue_depth"),
+            "max_active_workers": series_max("active_workers"),
+            "max_rss_bytes": series_max("rss_bytes"),
+            # 服务端是否开启抽取结果缓存（开启且 PDF 有重复时，部分任务的耗时不含解析和 AI 调用）
+            "extraction_cache": state.runtime_samples[0].get("extraction_cache") if state.runtime_samples else None,
+        },
+    }
+
+
+def print_summary(summary: Dict[str, Any]):
+    print("-" * 90)
+    print(f"总耗时 {summary['wall_time_s']}s，任务结果 {summary['tasks']}，"
+          f"完成吞吐量 {summary['task_throughput_per_min']} 个/分钟")
+    duration = summary["task_duration"]
+    if duration["count"]:
+        print(f"端到端耗时：p50 {duration['p50_ms'] / 1000:.1f}s  p95 {duration['p95_ms'] / 1000:.1f}s  "
+              f"p99 {duration['p99_ms'] / 1000:.1f}s")
+    print(f"{'接口':<12}{'请求数':>8}{'错误':>6}{'rps':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for endpoint, stats in summary["endpoints"].items():
+        print(f"{endpoint:<12}{stats['count']:>8}{stats['errors']:>6}{stats['throughput_rps']:>8}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    inputs = summary["inputs"]
+    server = summary["server"]
+    cache_text = {True: "开启", False: "关闭", None: "未知"}[server["extraction_cache"]]
+    print(f"输入：{inputs['tasks']} 个任务使用 {inputs['unique_pdfs']} 份不同的 PDF，服务端抽取结果缓存{cache_text}")
+    if server["samples"]:
+        rss = server["max_rss_bytes"]
+        rss_text = f"{rss / 1024 / 1024:.0f}MB" if rss else "未知"
+        print(f"服务端：事件循环最大延迟 {server['max_event_loop_lag_ms']}ms，最大队列深度 {server['max_queue_depth']}，"
+              f"最大工作线程占用 {server['max_active_workers']}，最大内存 {rss_text}")
+    else:
+        print("服务端：未采样到 /admin/runtime（检查服务端是否设置 ADMIN_TOKEN 及 --admin-token）")
+
+
+def prepare_inputs(args, task_count: int) -> List[Path]:
+    """
+    准备压测用的 PDF；--setup-customer 时同时在模板目录下生成匹配的客户模板
+
+    默认每个任务生成一份不同的 PDF（PO 号不同），避免命中服务端的抽取结果缓存和重复提交合并，
+    压测的是 PDF 解析 + AI 调用的完整流程；--pdf-variants 大于 0 时只生成该数量的 PDF 循环使用
+    """
+    if args.pdf:
+        return [Path(p) for p in args.pdf]
+
+    work_dir = BENCHMARK_DIR / "results" / "loadtest_inputs"
+    codes = make_item_codes(args.template_items, seed=args.seed)
+    if args.setup_customer:
+        write_customer_templates(args.templates_root, args.customer_code, None, codes)
+        print(f"已生成压测客户模板: {Path(args.templates_root) / args.customer_code}")
+
+    rng = random.Random(args.seed)
+    pdf_paths = []
+    for index in range(args.pdf_variants or task_count):
+        po_info = make_po_info(rng.sample(codes, min(args.items, len(codes))), po_no=f"46{index:08d}", seed=index)
+        pdf_paths.append(write_po_pdf(po_info, work_dir / f"po_{index}.pdf"))
+    return pdf_paths
+
+
+async def run_load_test(args) -> Dict[str, Any]:
+    offsets = arrival_offsets(args.pattern, args.duration, args.rate, args.burst_size, args.burst_every, args.seed)
+    pdf_paths = prepare_inputs(args, len(offsets))
+    print(f"计划提交 {len(offsets)} 个任务（{args.pattern}，{args.duration}s），使用 {len(pdf_paths)} 份不同的 PDF")
+    if len(pdf_paths) < len(offsets):
+        print("注意：PDF 少于任务数，重复的 PDF 在服务端开启抽取结果缓存时会跳过解析和 AI 调用，"
+              "压测完整流程需以 EXTRACTION_CACHE_ENABLED=false 启动服务")
+
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.request_timeout, limits=limits) as client:
+        state = LoadTestState()
+        sampler = asyncio.create_task(sample_runtime(client, state, args.sample_interval, args.admin_token))
+
+        async def delayed_session(index: int, offset: float):
+            await asyncio.sleep(max(0.0, offset - state.elapsed()))
+            await run_session(client, state, index, pdf_paths[index % len(pdf_paths)], args.customer_code,
+                              args.poll_interval, args.task_timeout)
+
+        await asyncio.gather(*(delayed_session(i, offset) for i, offset in enumerate(offsets)))
+        wall_time = state.elapsed()
+        sampler.cancel()
+
+    summary = summarize(state, wall_time)
+    summary["inputs"] = {"tasks": len(offsets), "unique_pdfs": min(len(pdf_paths), len(offsets))}
+    return {
+        "meta": {"timestamp": datetime.now().isoformat(), "args": vars(args)},
+        "summary": summary,
+        "runtime_samples": state.runtime_samples,
+        "requests": [r.__dict__ for r in state.requests],
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="生产任务单服务压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--pattern", choices=["steady", "burst"], default="steady", help="到达模式")
+    parser.add_argument("--duration", type=float, default=120, help="提交持续时间（秒）")
+    parser.add_argument("--rate", type=float, default=0.5, help="匀速到达速率（个/秒）")
+    parser.add_argument("--burst-size", type=int, default=30, help="burst 模式下每次集中提交的数量")
+    parser.add_argument("--burst-every", type=float, default=60, help="burst 模式下集中提交的间隔（秒）")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="状态轮询间隔（秒），与前端一致")
+    parser.add_argument("--task-timeout", type=float, default=900, help="单个任务的最长等待时间（秒）")
+    parser.add_argument("--request-timeout", type=float, default=60, help="单个请求超时（秒）")
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="服务端运行状态采样间隔（秒）")
+    parser.add_argument("--admin-token", help="服务端的 ADMIN_TOKEN，用于采样 /admin/runtime")
+    parser.add_argument("--customer-code", default=LOADTEST_CUSTOMER)
+    parser.add_argument("--pdf", nargs="*", help="使用已有的 PDF 文件，不生成合成数据")
+    parser.add_argument("--setup-customer", action="store_true", help="在模板目录下生成与合成 PDF 匹配的客户模板")
+    parser.add_argument("--templates-root", default="company_templates", help="应用的客户模板目录")
+    parser.add_argument("--template-items", type=int, default=100, help="合成模板中的产品数")
+    parser.add_argument("--items", type=int, default=20, help="每个合成 PO 中的产品数")
+    parser.add_argument("--pdf-variants", type=int, default=0,
+                        help="生成的不同 PDF 数量，0 表示每个任务一份（不命中服务端缓存）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=str(DEFAULT_RESULTS), help="结果 JSON 路径")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """主函数"""
+    args = parse_args(argv)
+    report = asyncio.run(run_load_test(args))
+    print_summary(report["summary"])
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已保存: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
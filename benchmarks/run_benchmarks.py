@@ -0,0 +1,355 @@
+"""
+生产任务单流水线基准测试
+
+使用合成的 PO PDF / 模板和本地模拟的 LLM 服务，分别测量各环节以及端到端耗时，
+结果写入 JSON，并可与保存的基线对比以发现性能回退。
+
+用法：
+    python -m benchmarks.run_benchmarks                          # 运行全部用例
+    python -m benchmarks.run_benchmarks --quick                  # 小规模快速运行
+    python -m benchmarks.run_benchmarks --only excel             # 只运行名称包含 excel 的用例
+    python -m benchmarks.run_benchmarks --save-baseline          # 将本次结果保存为基线
+    python -m benchmarks.run_benchmarks --threshold 0.2          # 中位数比基线慢 20% 以上视为回退
+
+未安装 marker 或 dashscope 时，parse_pdf 和端到端用例自动跳过，其余用例不依赖二者。
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.synthetic import make_item_codes, make_po_info, write_customer_templates, write_po_pdf
+
+BENCHMARK_DIR = Path(__file__).parent
+DEFAULT_BASELINE = BENCHMARK_DIR / "baseline.json"
+DEFAULT_RESULTS = BENCHMARK_DIR / "results" / "latest.json"
+
+# 规模参数：PO 中的产品数、模板中的产品工作表数
+ITEM_COUNTS = [1, 50, 500]
+SHEET_COUNTS = [20, 200]
+QUICK_ITEM_COUNTS = [1, 50]
+QUICK_SHEET_COUNTS = [20]
+
+# 绝对差值低于该值（秒）时不判定为回退，避免毫秒级用例的计时噪声
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def measure(func: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None,
+            warmup: int = 1) -> Dict[str, Any]:
+    """
+    多次运行并统计耗时
+
+    setup 的返回值作为 func 的参数传入，setup 本身不计时（如每轮重新加载工作簿）
+    """
+    def run_once() -> float:
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg) if setup else func()
+        return time.perf_counter() - start
+
+    for _ in range(warmup):
+        run_once()
+    timings = sorted(run_once() for _ in range(repeat))
+    return {
+        "runs": repeat,
+        "min": timings[0],
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "p95": timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))],
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+class BenchmarkSuite:
+    """基准测试用例集合，所有合成数据生成在临时工作目录中"""
+
+    def __init__(self, work_dir: Path, item_counts: List[int], sheet_counts: List[int], repeat: int,
+                 only: Optional[str], llm_latency: float):
+        self.work_dir = work_dir
+        self.item_counts = item_counts
+        self.sheet_counts = sheet_counts
+        self.repeat = repeat
+        self.only = only
+        self.llm_latency = llm_latency
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, name: str, func: Callable, repeat: Optional[int] = None, setup: Optional[Callable] = None,
+               warmup: int = 1):
+        if self.only and self.only not in name:
+            return
+        stats = measure(func, repeat or self.repeat, setup, warmup)
+        self.results[name] = stats
+        print(f"{name:<60} median {stats['median'] * 1000:10.2f} ms   p95 {stats['p95'] * 1000:10.2f} ms")
+
+    def skip(self, name: str, reason: str):
+        if self.only and self.only not in name:
+            return
+        self.results[name] = {"skipped": reason}
+        print(f"{name:<60} 跳过: {reason}")
+
+    def templates_for(self, name: str, sheet_count: int, dual: bool = False, with_tl: bool = False) -> Dict[str, str]:
+        """生成 sheet_count 个产品的模板；dual 时广美、广线各一半，with_tl 时广线中四分之一为 TL 货号"""
+        codes = make_item_codes(sheet_count, seed=sheet_count)
+        gm_codes = codes[: sheet_count // 2] if dual else None
+        gx_codes = codes[sheet_count // 2:] if dual else codes
+        tl_codes = gx_codes[: max(1, len(gx_codes) // 4)] if with_tl else None
+        return write_customer_templates(self.work_dir / "company_templates", name, gm_codes, gx_codes, tl_codes)
+
+    def run_pure_python(self):
+        """不依赖 marker / 模板文件的纯计算环节"""
+        from utils.excel_processor import ExcelProcessor
+        from utils.pdf_extractor import PDFExtractor
+
+        processor = ExcelProcessor()
+        for item_count in self.item_counts:
+            codes = make_item_codes(item_count, seed=item_count)
+            po_info = make_po_info(codes)
+            raw_json = f"```json\n{json.dumps(po_info, ensure_ascii=False, indent=2)}\n```"
+            self.record(f"convert_json_2_dict[items={item_count}]",
+                        lambda: PDFExtractor.convert_json_2_dict(raw_json), repeat=self.repeat * 20)
+
+            for sheet_count in self.sheet_counts:
+                template_codes = make_item_codes(max(sheet_count, item_count), seed=item_count)
+                self.record(f"generate_task_order_no[items={item_count},sheets={sheet_count}]",
+                            lambda: processor.generate_task_order_no(po_info, "TW25040782(1)BC", None, template_codes),
+                            repeat=self.repeat * 20)
+                tl_codes = template_codes[: len(template_codes) // 4]
+                bc_codes = template_codes[len(template_codes) // 4:]
+                self.record(f"generate_task_order_no[items={item_count},sheets={sheet_count},tl]",
+                            lambda: processor.generate_task_order_no(po_info, "TW25040782(1)BC", tl_codes, bc_codes),
+                            repeat=self.repeat * 20)
+
+    def run_excel(self):
+        """Excel 填充与保存环节"""
+        from openpyxl import load_workbook
+        from utils.excel_processor import ExcelProcessor
+        from utils.pdf_extractor import PDFExtractor
+
+        processor = ExcelProcessor()
+        compact_processor = ExcelProcessor(compact_mode="rows")
+        output_dir = str(self.work_dir / "outputs")
+
+        for sheet_count in self.sheet_counts:
+            templates = self.templates_for(f"gm{sheet_count}", sheet_count)
+            codes = PDFExtractor.extract_customer_codes_from_excel(templates["GX"])
+            for item_count in self.item_counts:
+                if item_count > sheet_count:
+                    continue
+                po_info = make_po_info(make_item_codes(sheet_count, seed=sheet_count)[:item_count])
+
+                self.record(
+                    f"process_GM_template[items={item_count},sheets={sheet_count}]",
+                    lambda wb: processor.process_GM_template(wb, po_info, "2025-01-01", "2025-01-08", "TW25040782(1)BC",
+                                                             "BENCH", output_dir, codes, "gm"),
+                    setup=lambda: load_workbook(templates["GX"], data_only=False),
+                )
+                self.record(
+                    f"process_GM_template[items={item_count},sheets={sheet_count},compact]",
+                    lambda wb: compact_processor.process_GM_template(wb, po_info, "2025-01-01", "2025-01-08",
+                                                                     "TW25040782(1)BC", "BENCH", output_dir, codes,
+                                                                     "gm_compact"),
+                    setup=lambda: load_workbook(templates["GX"], data_only=False),
+                )
+
+        for sheet_count in self.sheet_counts:
+            for dual, with_tl in [(False, False), (False, True), (True, False), (True, True)]:
+                variant = f"{'dual' if dual else 'single'}{',tl' if with_tl else ''}"
+                name = f"t{sheet_count}{'d' if dual else 's'}{'t' if with_tl else ''}"
+                templates = self.templates_for(name, sheet_count, dual, with_tl)
+                _, template_2_info = PDFExtractor.get_customer_codes_reference(templates)
+                self.record(f"get_customer_codes_reference[sheets={sheet_count},{variant}]",
+                            lambda: PDFExtractor.get_customer_codes_reference(templates))
+
+                all_codes = make_item_codes(sheet_count, seed=sheet_count)
+                for item_count in self.item_counts:
+                    if item_count > sheet_count:
+                        continue
+                    # 从模板货号中均匀抽取，双模板时同时覆盖广美和广线
+                    step = max(1, sheet_count // item_count)
+                    po_info = make_po_info(all_codes[::step][:item_count])
+                    self.record(
+                        f"ExcelProcessor.process[items={item_count},sheets={sheet_count},{variant}]",
+                        lambda: processor.process(po_info, template_2_info, "TW25040782(1)BC", "2025-01-01",
+                                                  "2025-01-08", output_dir, "bench", "BENCH", name),
+                    )
+
+    def run_marker(self):
+        """依赖 marker 模型的 PDF 解析与端到端流程"""
+        parse_cases = [f"parse_pdf[{kind},items={n}]" for kind in ("text", "scanned") for n in self.item_counts]
+        e2e_cases = [f"end_to_end[items={n}]" for n in self.item_counts]
+        try:
+            from utils.excel_processor import ExcelProcessor
+            from utils.pdf_extractor import MARKER_AVAILABLE, PDFExtractor
+            import dashscope
+        except ImportError as e:
+            for name in parse_cases + e2e_cases:
+                self.skip(name, f"缺少依赖 {e.name}")
+            return
+        if not MARKER_AVAILABLE:
+            for name in parse_cases + e2e_cases:
+                self.skip(name, "缺少依赖 marker")
+            return
+
+        if self.only and not any(self.only in name for name in parse_cases + e2e_cases + ["PDFExtractor.__init__"]):
+            return
+
+        # 模型加载只做一次，单独计时
+        start = time.perf_counter()
+        extractor = PDFExtractor(cache=None)
+        elapsed = time.perf_counter() - start
+        self.results["PDFExtractor.__init__"] = {"runs": 1, "min": elapsed, "median": elapsed, "mean": elapsed,
+                                                 "p95": elapsed, "stdev": 0.0}
+        processor = ExcelProcessor()
+
+        pdf_dir = self.work_dir / "pdfs"
+        for item_count in self.item_counts:
+            po_info = make_po_info(make_item_codes(item_count, seed=item_count))
+            for kind in ("text", "scanned"):
+                pdf_path = write_po_pdf(po_info, pdf_dir / f"{kind}_{item_count}.pdf", scanned=(kind == "scanned"))
+                self.record(f"parse_pdf[{kind},items={item_count}]", lambda: extractor.parse_pdf(str(pdf_path)),
+                            repeat=max(1, self.repeat // 2), warmup=0)
+
+        original_url = dashscope.base_http_api_url
+        with FakeLLMServer(latency=self.llm_latency) as fake_llm:
+            dashscope.base_http_api_url = fake_llm.base_url
+            try:
+                sheet_count = max(self.sheet_counts + self.item_counts)
+                templates = self.templates_for("e2e", sheet_count, dual=True)
+                all_codes = make_item_codes(sheet_count, seed=sheet_count)
+                for item_count in self.item_counts:
+                    step = max(1, len(all_codes) // item_count)
+                    po_info = make_po_info(all_codes[::step][:item_count])
+                    pdf_path = write_po_pdf(po_info, pdf_dir / f"e2e_{item_count}.pdf")
+
+                    def end_to_end():
+                        pdf_info, template_2_info = extractor.process(str(pdf_path), templates)
+                        processor.process(pdf_info, template_2_info, "TW25040782(1)BC", "2025-01-01", "2025-01-08",
+                                          str(self.work_dir / "outputs"), "bench", "BENCH", f"e2e{item_count}")
+
+                    self.record(f"end_to_end[items={item_count}]", end_to_end,
+                                repeat=max(1, self.repeat // 2), warmup=0)
+            finally:
+                dashscope.base_http_api_url = original_url
+
+    def run(self, skip_marker: bool = False):
+        self.run_pure_python()
+        self.run_excel()
+        if skip_marker:
+            for name in ["parse_pdf", "end_to_end"]:
+                self.skip(name, "--skip-marker")
+        else:
+            self.run_marker()
+        return self.results
+
+
+def git_commit() -> str:
+    """当前代码版本，便于对比结果时确认"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=BENCHMARK_DIR.parent, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """与基线对比中位数，返回回退的用例说明"""
+    regressions = []
+    print("-" * 100)
+    print(f"{'用例':<60}{'基线(ms)':>12}{'本次(ms)':>12}{'变化':>10}")
+    for name, stats in sorted(results.items()):
+        base = baseline.get(name)
+        if not base or "median" not in base or "median" not in stats:
+            continue
+        ratio = stats["median"] / base["median"] if base["median"] else 1.0
+        flag = ""
+        if ratio > 1 + threshold and stats["median"] - base["median"] > MIN_REGRESSION_SECONDS:
+            flag = "  ⚠ 回退"
+            regressions.append(f"{name}: {base['median'] * 1000:.2f}ms -> {stats['median'] * 1000:.2f}ms")
+        print(f"{name:<60}{base['median'] * 1000:>12.2f}{stats['median'] * 1000:>12.2f}{(ratio - 1) * 100:>9.1f}%{flag}")
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="生产任务单流水线基准测试")
+    parser.add_argument("--quick", action="store_true", help="小规模快速运行")
+    parser.add_argument("--repeat", type=int, default=5, help="每个用例的运行次数")
+    parser.add_argument("--only", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--skip-marker", action="store_true", help="跳过依赖 marker 模型的用例")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="模拟 LLM 的响应延迟（秒）")
+    parser.add_argument("--output", default=str(DEFAULT_RESULTS), help="结果 JSON 路径")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="基线 JSON 路径")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--threshold", type=float, default=0.2, help="中位数变慢超过该比例视为回退")
+    parser.add_argument("--keep-work-dir", action="store_true", help="保留合成数据目录，便于排查")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """主函数"""
+    args = parse_args(argv)
+    work_dir = Path(tempfile.mkdtemp(prefix="production_bench_"))
+    suite = BenchmarkSuite(
+        work_dir,
+        QUICK_ITEM_COUNTS if args.quick else ITEM_COUNTS,
+        QUICK_SHEET_COUNTS if args.quick else SHEET_COUNTS,
+        args.repeat,
+        args.only,
+        args.llm_latency,
+    )
+    try:
+        results = suite.run(skip_marker=args.skip_marker)
+    finally:
+        if args.keep_work_dir:
+            print(f"合成数据目录: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quick": args.quick,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已保存: {output_path}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"基线已更新: {baseline_path}")
+        return 0
+
+    if baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"发现 {len(regressions)} 个性能回退：")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("未发现性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
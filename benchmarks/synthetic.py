@@ -0,0 +1,149 @@
+"""
+基准测试用的合成数据
+生成可复现的 PO PDF（文本层 / 扫描件）和广美/广线 Excel 模板，结构与真实模板一致：
+- 主表：E1 制单日期、B2 交货期、B3 PO号，"客户货号" 行之后为产品行（A 货号、D 数量、G 任务单号），以 "合计" 结束
+- 每个产品一个同名工作表
+- 可选 TL 工作表："客户货号" 开始、"封箱/打包方式" 结束
+"""
+
+import random
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from openpyxl import Workbook
+
+# 每页 PDF 放置的产品行数
+ITEMS_PER_PAGE = 40
+
+
+def make_item_codes(count: int, prefix: str = "SY", seed: int = 0) -> List[str]:
+    """生成 count 个不重复的客户货号，格式与真实货号相近（如 SY0012A）"""
+    rng = random.Random(seed)
+    suffixes = ["", "A", "B"]
+    return [f"{prefix}{index:04d}{rng.choice(suffixes)}" for index in range(count)]
+
+
+def make_po_info(item_codes: List[str], po_no: str = "4600000001", seed: int = 0) -> Dict:
+    """生成与 AI 抽取结果格式一致的 PO 信息"""
+    rng = random.Random(seed)
+    return {
+        "po_no": po_no,
+        "product_info": [
+            {"cust_item_code": code, "quantity": rng.randint(1, 200) * 10}
+            for code in item_codes
+        ],
+    }
+
+
+def write_po_pdf(po_info: Dict, output_path: Union[str, Path], scanned: bool = False, dpi: int = 150) -> Path:
+    """
+    生成 PO PDF
+
+    Args:
+        po_info: make_po_info 的返回值
+        output_path: 输出路径
+        scanned: 为 True 时将每页渲染为图片后重新生成，没有文本层，模拟扫描件
+        dpi: 扫描件的渲染分辨率
+    """
+    import fitz
+
+    output_path = Path(output_path)
+    items = po_info["product_info"]
+    doc = fitz.open()
+    for page_start in range(0, max(len(items), 1), ITEMS_PER_PAGE):
+        page = doc.new_page()
+        y = 60
+        page.insert_text((50, y), "PURCHASE ORDER", fontsize=16)
+        y += 24
+        page.insert_text((50, y), f"PURCHASE ORDER NUMBER: {po_info['po_no']}", fontsize=11)
+        y += 24
+        page.insert_text((50, y), "Line   EPM Part        Description          Quantity", fontsize=10)
+        for line_no, item in enumerate(items[page_start:page_start + ITEMS_PER_PAGE], start=page_start + 1):
+            y += 16
+            page.insert_text(
+                (50, y),
+                f"{line_no:<6} {item['cust_item_code']:<15} Synthetic product {line_no:<4} {item['quantity']:>8,}",
+                fontsize=10,
+            )
+
+    if scanned:
+        scanned_doc = fitz.open()
+        for page in doc:
+            pixmap = page.get_pixmap(dpi=dpi)
+            new_page = scanned_doc.new_page(width=page.rect.width, height=page.rect.height)
+            new_page.insert_image(new_page.rect, pixmap=pixmap)
+        doc.close()
+        doc = scanned_doc
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    doc.save(str(output_path))
+    doc.close()
+    return output_path
+
+
+def write_template(item_codes: List[str], output_path: Union[str, Path], tl_codes: Optional[List[str]] = None) -> Path:
+    """
+    生成任务单模板
+
+    Args:
+        item_codes: 主表中的客户货号（含 TL 货号），每个货号同时生成一个产品工作表
+        output_path: 输出路径，文件名需包含 "广美" 或 "广线"
+        tl_codes: 不为 None 时生成 TL 工作表，包含这些货号
+    """
+    output_path = Path(output_path)
+    wb = Workbook()
+    main_sheet = wb.active
+    main_sheet.title = "主表"
+    main_sheet["A1"] = "制单日期"
+    main_sheet["E1"] = "2025-01-01"
+    main_sheet["A2"] = "交货期"
+    main_sheet["B2"] = "2025-01-08"
+    main_sheet["A3"] = "PO NO"
+    main_sheet["B3"] = ""
+    main_sheet.append(["客户货号", "品名", "规格", "数量", "单重", "总重", "任务单号"])
+
+    first_row = main_sheet.max_row + 1
+    for code in item_codes:
+        row_idx = main_sheet.max_row + 1
+        main_sheet.append([code, "合成品名", "规格", 0, 0.5, f"=D{row_idx}*E{row_idx}", ""])
+    last_row = main_sheet.max_row
+    main_sheet.append(["合计", "", "", f"=SUM(D{first_row}:D{last_row})", "", f"=SUM(F{first_row}:F{last_row})", ""])
+
+    for code in item_codes:
+        sheet = wb.create_sheet(code)
+        sheet["A1"] = "客户货号"
+        sheet["B1"] = code
+        sheet["A2"] = "数量"
+        sheet["B2"] = f"=SUMIF(主表!A:A,\"{code}\",主表!D:D)"
+        for row_idx in range(3, 30):
+            sheet.cell(row=row_idx, column=1, value=f"工序 {row_idx - 2}")
+            sheet.cell(row=row_idx, column=2, value="合成工艺说明")
+
+    if tl_codes is not None:
+        tl_sheet = wb.create_sheet("TL")
+        tl_sheet.append(["TL 任务单"])
+        tl_sheet.append(["客户货号", "数量"])
+        for code in tl_codes:
+            tl_sheet.append([code, 0])
+        tl_sheet.append(["封箱/打包方式", "纸箱"])
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    wb.save(output_path)
+    return output_path
+
+
+def write_customer_templates(root: Union[str, Path], customer_code: str, gm_codes: Optional[List[str]],
+                             gx_codes: List[str], tl_codes: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    按 company_templates/<客户号>/ 的目录结构生成客户模板
+
+    Returns:
+        与 get_excel_template_path 相同格式的模板字典 {'GX': path, 'GM': path}
+    """
+    customer_dir = Path(root) / customer_code
+    templates = {
+        "GX": str(write_template(gx_codes, customer_dir / f"{customer_code}_广线_任务单.xlsx", tl_codes))
+    }
+    if gm_codes:
+        templates["GM"] = str(write_template(gm_codes, customer_dir / f"{customer_code}_广美_任务单.xlsx"))
+    return templates
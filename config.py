@@ -2,6 +2,7 @@
 系统配置文件
 """
 
+import json
 import os
 from pathlib import Path
 
@@ -12,19 +13,74 @@ OUTPUT_DIR = BASE_DIR / "outputs"
 TEMPLATE_DIR = BASE_DIR / "templates"
 STATIC_DIR = BASE_DIR / "static"
 
+# 产物存储配置（上传的PDF、生成的任务单、抽取结果缓存）
+# local：本地目录，ARTIFACT_STORE_DIR 指向多个节点共同挂载的共享目录时即可多节点共享；
+# s3：S3 兼容对象存储，S3_ENDPOINT_URL 可指向 MinIO 等本地替代服务
+ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "local")
+ARTIFACT_STORE_DIR = Path(os.getenv("ARTIFACT_STORE_DIR", str(BASE_DIR)))  # 默认为应用目录，与原有文件布局一致
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+
 # 文件上传配置
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 ALLOWED_PDF_EXTENSIONS = {".pdf"}
 ALLOWED_EXCEL_EXTENSIONS = {".xlsx", ".xls"}
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 上传文件分块写入大小（1MB）
+PDF_MAGIC_BYTES = b"%PDF-"  # PDF 文件头标识
+PDF_MAGIC_SEARCH_RANGE = 1024  # 在文件前 1KB 内查找 PDF 文件头
+MULTIPART_OVERHEAD_BYTES = 64 * 1024  # multipart 表单字段及边界的额外开销
+
+# 批量处理配置
+MAX_BATCH_FILES = 200  # 单个批次最多包含的PDF数量
+MAX_BATCH_SIZE = 500 * 1024 * 1024  # 单个批次上传总大小上限（500MB）
+ZIP_MAGIC_BYTES = b"PK\x03\x04"  # ZIP 文件头标识
 
 # 处理配置
 PROCESSING_TIMEOUT = 300  # 5分钟超时
 STATUS_CHECK_INTERVAL = 2  # 状态检查间隔（秒）
+SSE_KEEPALIVE_INTERVAL = 15  # SSE 心跳间隔（秒），同时从本进程的任务状态重新同步
+
+# 任务阶段 -> (提示信息, 进度百分比)
+TASK_STAGES = {
+    "queued": ("等待处理...", 10),
+    "parsing": ("正在解析PDF...", 30),
+    "extracting": ("正在AI提取PO信息...", 60),
+    "generating": ("正在生成生产任务单...", 85),
+    "completed": ("处理完成", 100),
+    "error": ("处理失败", 100),
+}
+
+# 客户货号匹配：PO 货号先精确匹配，再按规范化（全角转半角、去空白、忽略大小写）匹配；
+# 大于 0 时对仍未匹配的货号做模糊匹配，取相似度不低于该值（0~100）的最相近模板货号。默认关闭，避免匹配到错误的货号
+CODE_FUZZY_MATCH_THRESHOLD = float(os.getenv("CODE_FUZZY_MATCH_THRESHOLD", "0"))
+
+# 精简输出：off（默认，未涉及的工作表和行只隐藏）、sheets（删除未被引用的隐藏产品工作表）、
+# rows（再删除主表 / TL 中隐藏的行，引用无法安全改写时该工作表的行保持隐藏）
+COMPACT_OUTPUT_MODE = os.getenv("COMPACT_OUTPUT_MODE", "off")
+# 按客户覆盖精简模式，格式 "客户号:模式,客户号:模式"
+COMPACT_OUTPUT_CUSTOMERS = {
+    code.strip(): mode.strip()
+    for code, mode in (item.split(":") for item in os.getenv("COMPACT_OUTPUT_CUSTOMERS", "").split(",") if ":" in item)
+}
+
+# 模板类型名称（任务单文件可按模板类型单独下载）
+TEMPLATE_TYPE_NAMES = {"GM": "广美", "GX": "广线"}
 
 # AI接口配置（可选）
 AI_API_URL = os.getenv("AI_API_URL", None)
 AI_API_KEY = os.getenv("AI_API_KEY", None)
 
+# AI接口限流（同一台机器上所有工作线程和进程共用额度，额度不足时排队等待而不是失败）
+LLM_RPS = float(os.getenv("LLM_RPS", "0"))  # 每秒请求数上限，0 表示不限制
+LLM_TPM = float(os.getenv("LLM_TPM", "0"))  # 每分钟 token 数上限（输入+输出），0 表示不限制
+LLM_CHARS_PER_TOKEN = 2.0  # 按字符数估算 prompt 的 token 数，调用后按实际用量修正
+LLM_OUTPUT_TOKENS_ESTIMATE = 800  # 调用前预估的输出 token 数
+LLM_RATE_LIMIT_STATE_FILE = Path(os.getenv("LLM_RATE_LIMIT_STATE_FILE", "/tmp/production_llm_rate_limit.json"))
+LLM_THROTTLE_RETRIES = 3  # 仍被服务商限流时的重试次数
+LLM_THROTTLE_BACKOFF = 5  # 被服务商限流后，所有进程暂停调用的时间（秒），每次重试加倍
+
 # Excel模板配置
 EXCEL_MAIN_SHEET = "主表"
 EXCEL_PO_CELL = "B3"
@@ -61,6 +117,9 @@ SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 
 # 缓存配置
 CACHE_TTL = 3600  # 1小时
+CACHE_DIR = BASE_DIR / "cache"  # 抽取结果缓存目录（Web 服务与命令行批量处理共用）
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "True").lower() == "true"
+EXTRACTION_CACHE_TTL = 7 * 24 * 3600  # 抽取结果缓存有效期（7天）
 
 # 文件清理配置
 CLEANUP_INTERVAL_HOURS = 1  # 清理间隔（小时）
@@ -69,12 +128,54 @@ CLEANUP_CHECK_INTERVAL = 3600  # 清理检查间隔（秒）
 CLEANUP_ERROR_RETRY_INTERVAL = 300  # 清理错误重试间隔（秒）
 
 # 性能配置
-MAX_CONCURRENT_TASKS = 10
+MAX_CONCURRENT_TASKS = int(os.getenv("MAX_CONCURRENT_TASKS", "10"))
 TASK_QUEUE_SIZE = 100
 
+# 调度配置
+MAX_TASKS_PER_CUSTOMER = int(os.getenv("MAX_TASKS_PER_CUSTOMER", "4"))  # 单个客户同时处理的任务数上限
+# 客户权重，格式 "客户号:权重,客户号:权重"，未配置的客户权重为 1；权重越大分到的处理线程越多
+CUSTOMER_WEIGHTS = {
+    code.strip(): float(weight)
+    for code, weight in (item.split(":") for item in os.getenv("CUSTOMER_WEIGHTS", "").split(",") if ":" in item)
+}
+if any(not weight > 0 for weight in CUSTOMER_WEIGHTS.values()):
+    raise ValueError(f"CUSTOMER_WEIGHTS 中的权重必须大于 0: {os.getenv('CUSTOMER_WEIGHTS')}")
+TASK_PRIORITIES = {"normal": 0, "rush": 10}  # 上传时可选的优先级，加急单先于所有普通任务处理
+DEFAULT_TASK_SECONDS = 60  # 还没有已完成任务时，估算排队等待时间使用的单任务耗时（秒）
+
+# 预解析配置（选择 PDF 后立即上传并在后台解析，提交表单时认领）
+PREPARSE_PRIORITY = -10  # 预解析为推测性工作，优先级低于所有已提交的任务
+PREPARSE_TTL = 1800  # 上传后超过该时间（秒）仍未提交表单的预解析视为放弃，删除文件和解析结果
+PREPARSE_CLEANUP_INTERVAL = 300  # 放弃的预解析清理检查间隔（秒）
+
+# CPU 推理配置（marker PDF 解析）
+# 预设：default（torch/marker 默认值）、throughput（多任务并发，按并发数分配线程并绑定核心）、latency（单任务最快）
+INFERENCE_PROFILE = os.getenv("INFERENCE_PROFILE", "default")
+INFERENCE_TORCH_THREADS = int(os.getenv("INFERENCE_TORCH_THREADS")) if os.getenv("INFERENCE_TORCH_THREADS") else None  # 覆盖每个工作线程的 torch 线程数
+INFERENCE_PIN_WORKERS = {"true": True, "false": False}.get(os.getenv("INFERENCE_PIN_WORKERS", "").lower())  # 覆盖是否将工作线程绑定到独立核心
+# 覆盖 marker 配置，JSON 格式，如 {"highres_image_dpi": 192, "recognition_batch_size": 32}
+MARKER_CONFIG_OVERRIDES = json.loads(os.getenv("MARKER_CONFIG", "{}"))
+
+# 工作进程回收配置（需通过 supervisor.py 启动，回收时由监督进程重新启动工作进程）
+MEMORY_SAMPLE_INTERVAL = 0.2  # 任务处理期间的内存采样间隔（秒），用于记录任务运行期间的峰值内存
+WORKER_MAX_TASKS = int(os.getenv("WORKER_MAX_TASKS", "0"))  # 处理多少个任务后回收，0 表示不按任务数回收
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", "0"))  # 任务结束后常驻内存超过该值（MB）时回收，0 表示不按内存回收
+WORKER_DRAIN_TIMEOUT = 1800  # 排空时等待已接受任务完成的最长时间（秒），超时后未完成的任务标记为失败
+WORKER_DRAIN_CHECK_INTERVAL = 1  # 排空时检查任务是否全部完成的间隔（秒）
+WORKER_DRAIN_RETRY_AFTER = 30  # 排空期间拒绝新任务时，建议客户端重试的等待时间（秒）
+STATUS_SNAPSHOT_FILE = BASE_DIR / "status_snapshot.json"  # 工作进程退出时保存任务状态，重新启动后恢复
+SUPERVISOR_RESTART_DELAY = 5  # 工作进程异常退出后，监督进程重新启动前的等待时间（秒）
+
 # 监控配置
 ENABLE_METRICS = os.getenv("ENABLE_METRICS", "False").lower() == "true"
 METRICS_PORT = int(os.getenv("METRICS_PORT", "9090"))
+METRICS_DISK_USAGE_INTERVAL = 60  # 磁盘占用指标刷新间隔（秒）
+EVENT_LOOP_LAG_INTERVAL = 0.5  # 事件循环延迟采样间隔（秒）
+EVENT_LOOP_LAG_WINDOW = 120  # 运行状态接口统计最近多少个延迟采样
+
+# 性能剖析配置
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # 随机抽样剖析的任务比例（0~1）
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", None)  # 管理接口令牌，需通过 X-Admin-Token 请求头访问；未设置时管理接口不开放
 
 # 国际化配置
 DEFAULT_LANGUAGE = "zh-CN"
@@ -99,6 +200,6 @@ FEATURES = {
     "status_tracking": True,
     "file_cleanup": True,
     "user_authentication": False,  # 未来功能
-    "batch_processing": False,     # 未来功能
+    "batch_processing": True,
     "template_management": False,  # 未来功能
 } 
\ No newline at end of file
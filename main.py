@@ -1,30 +1,65 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, BackgroundTasks, Header
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
+from pydantic import BaseModel
 import os
 import json
 import uuid
+import hashlib
+import random
+import secrets
+import signal
+import threading
 from datetime import datetime, timedelta
 import shutil
 from pathlib import Path
 from openpyxl import load_workbook
 import asyncio
-from typing import Optional, Union, List, Dict
+import functools
+import zipfile
+import aiofiles
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union, List, Dict, Any
 import logging
+from urllib.parse import quote
 
 # 导入配置和自定义模块
 from config import *
 from utils.excel_processor import ExcelProcessor
-from utils.pdf_extractor import PDFExtractor
+from utils.pdf_extractor import PDFExtractor, llm_rate_limiter
+from utils.extraction_cache import ExtractionCache
+from utils.template_locator import get_excel_template_path
+from utils.task_events import TaskEventBroker
+from utils import metrics
+from utils.profiler import profile_task, span
+from utils.runtime_monitor import EventLoopLagMonitor, TaskMemoryTracker, current_rss_bytes, peak_rss_bytes
+from utils.scheduler import FairTaskScheduler
+from utils.inference_profile import WorkerPinner, apply_torch_threads, build_inference_profile
+from utils.preparse import PreparseJob
+from utils.artifact_store import create_artifact_store, store_key
+from utils.worker_recycler import WorkerRecycler, load_status_snapshot, save_status_snapshot
 
 # 配置日志
 logging.basicConfig(level=getattr(logging, LOG_LEVEL), format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
-# 初始化 pdf 抽取类
-pdf_extractor = PDFExtractor()
+# CPU 推理配置：按并发任务数分配 torch 线程，需在加载 marker 模型之前设置
+inference_profile = build_inference_profile(
+    INFERENCE_PROFILE, MAX_CONCURRENT_TASKS, INFERENCE_TORCH_THREADS, INFERENCE_PIN_WORKERS, MARKER_CONFIG_OVERRIDES
+)
+apply_torch_threads(inference_profile)
+
+# 产物存储：上传的PDF、生成的任务单和抽取结果缓存，多个节点共享同一存储时任意节点都可以提供下载
+artifact_store = create_artifact_store()
+
+# 初始化 pdf 抽取类（启用缓存时，相同内容的 PDF 不重复解析和调用 AI）
+extraction_cache = (
+    ExtractionCache(artifact_store.sub_store(store_key(CACHE_DIR)), ttl=EXTRACTION_CACHE_TTL)
+    if EXTRACTION_CACHE_ENABLED else None
+)
+pdf_extractor = PDFExtractor(cache=extraction_cache, inference_profile=inference_profile)
 # 初始化 Excel 处理类
 excel_processor = ExcelProcessor()
 
@@ -47,111 +82,605 @@ templates = Jinja2Templates(directory="templates")
 # 全局变量存储处理状态
 processing_status = {}
 
-def get_excel_template_path(customer_code: str) -> Dict[str, str]:
+# 提交指纹 / Idempotency-Key -> 任务ID，用于识别重复提交
+submission_index = {}
+
+# 任务进度事件广播，供 SSE 实时推送
+task_event_broker = TaskEventBroker()
+
+# 批次ID -> 批次信息（包含的任务ID等）
+batch_status = {}
+
+# 任务ID -> 模板信息（模板路径 + 客户货号），供修改后重新生成使用，不随状态返回给前端
+task_template_info = {}
+
+# 预解析ID -> 提前上传、尚未被表单提交认领的 PDF（PreparseJob）
+preparse_jobs = {}
+
+# 后台处理线程池，OCR/AI/Excel 均在此执行，避免阻塞事件循环，同时限制并发任务数
+# 推理配置开启核心绑定时，每个工作线程启动时绑定到各自的核心
+processing_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TASKS, thread_name_prefix="task-worker",
+                                         initializer=WorkerPinner(inference_profile))
+
+# 按客户公平调度任务到处理线程池，支持加急优先级和单客户并发上限
+task_scheduler = FairTaskScheduler(
+    processing_executor, MAX_CONCURRENT_TASKS, MAX_TASKS_PER_CUSTOMER, CUSTOMER_WEIGHTS, DEFAULT_TASK_SECONDS,
+    on_queue_change=lambda snapshot: publish_queue_positions(snapshot)
+)
+
+# 当前排队中的任务ID，用于在任务开始处理后清除排队信息
+queued_task_ids = set()
+
+# 事件循环延迟监控，阻塞事件循环的操作会直接体现为接口延迟
+event_loop_monitor = EventLoopLagMonitor(EVENT_LOOP_LAG_INTERVAL, EVENT_LOOP_LAG_WINDOW)
+
+# 任务运行期间的峰值内存采样，结果记录到任务状态
+task_memory = TaskMemoryTracker(MEMORY_SAMPLE_INTERVAL)
+
+# 处理任务数或常驻内存超过阈值时排空并退出，由 supervisor.py 重新启动工作进程
+worker_recycler = WorkerRecycler(WORKER_MAX_TASKS, WORKER_MAX_RSS_MB * 1024 * 1024)
+
+async def save_upload_file(upload_file: UploadFile, dest_path: Path, max_size: int = MAX_FILE_SIZE,
+                           allowed_extensions=ALLOWED_PDF_EXTENSIONS, magic_bytes: bytes = PDF_MAGIC_BYTES) -> Dict[str, Any]:
     """
-    根据客户号获取Excel模板路径
-    
+    分块异步保存上传的文件，一次读取同时完成大小限制、文件头校验和哈希计算
+
     Args:
-        customer_code: 客户号
-        
+        upload_file: 上传的文件对象
+        dest_path: 保存路径
+        max_size: 允许的最大文件大小（字节）
+        allowed_extensions: 允许的扩展名，默认仅PDF
+        magic_bytes: 文件头标识，默认PDF文件头
+
     Returns:
-        模板字典 {'GX': 'path1', 'GM': 'path2'} 或 {'GX': 'path1'}
-        
+        文件信息 {'size': 文件大小, 'sha256': 文件内容哈希}
+
     Raises:
-        ValueError: 当客户号对应的模板目录不存在或没有找到有效模板时
+        HTTPException: 扩展名或文件头不合法（400）或文件超过大小限制（413）时
     """
-    template_dir = Path("company_templates") / customer_code
-    
-    if not template_dir.exists():
-        raise ValueError(f"客户号 {customer_code} 对应的模板目录不存在")
-    
-    templates = {}
-    for file_path in template_dir.glob("*.xlsx"):
-        if "广美" in file_path.name:
-            templates['GM'] = str(file_path)
-        elif "广线" in file_path.name:
-            templates['GX'] = str(file_path)
-    
-    if not templates:
-        raise ValueError(f"客户号 {customer_code} 对应的模板目录中没有找到有效的模板文件")
-    
-    return templates
+    if Path(upload_file.filename or "").suffix.lower() not in allowed_extensions:
+        raise HTTPException(status_code=400, detail=f"不支持的文件类型，仅支持: {', '.join(sorted(allowed_extensions))}")
+
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(dest_path, "wb") as buffer:
+            first_chunk = True
+            while True:
+                chunk = await upload_file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                # 从第一个分块中嗅探 PDF 文件头
+                if first_chunk:
+                    if magic_bytes not in chunk[:PDF_MAGIC_SEARCH_RANGE]:
+                        raise HTTPException(status_code=400, detail=f"上传的文件 {upload_file.filename} 不是有效的{Path(upload_file.filename).suffix.lstrip('.').upper()}文件")
+                    first_chunk = False
+
+                # 超过大小限制立即中止，不再读取剩余内容
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(status_code=413, detail=f"文件大小超过限制 ({max_size // (1024 * 1024)}MB)")
+
+                hasher.update(chunk)
+                await buffer.write(chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=400, detail="上传的文件为空")
+
+    except Exception:
+        # 删除写了一半的文件
+        dest_path.unlink(missing_ok=True)
+        raise
+
+    return {"size": size, "sha256": hasher.hexdigest()}
+
+def compute_submission_fingerprint(pdf_sha256: str, task_order_no: str, order_date: str,
+                                   delivery_date: str, customer_code: str) -> str:
+    """根据PDF内容哈希和表单字段计算提交指纹，相同的输入得到相同的指纹"""
+    fields = [pdf_sha256, task_order_no.strip(), order_date.strip(), delivery_date.strip(), customer_code.strip()]
+    return hashlib.sha256("\x1f".join(fields).encode("utf-8")).hexdigest()
+
+def find_existing_task(index_key: str) -> Optional[str]:
+    """
+    查找与指纹或 Idempotency-Key 对应的已有任务
+
+    处理中或已完成的任务可被复用；失败或已被清理的任务不复用，允许重新提交
+    """
+    task_id = submission_index.get(index_key)
+    if task_id is None:
+        return None
+
+    status = processing_status.get(task_id)
+    if status is None or status["status"] == "error":
+        del submission_index[index_key]
+        return None
+
+    return task_id
+
+def duplicate_response(task_id: str) -> Dict[str, Any]:
+    """重复提交时直接返回已有任务，不再产生新的处理"""
+    logger.info(f"检测到重复提交，复用任务 {task_id}")
+    return {"task_id": task_id, "status": processing_status[task_id]["status"], "duplicate": True}
+
+def init_task_status(task_id: str, task_upload_dir: Path, pdf_file_info: Dict[str, Any], fingerprint: str, **extra):
+    """初始化任务状态，并登记提交指纹"""
+    processing_status[task_id] = {
+        "status": "processing", 
+        "stage": "queued",
+        "message": TASK_STAGES["queued"][0],
+        "progress": TASK_STAGES["queued"][1],
+        "upload_dir": str(task_upload_dir),
+        "pdf_sha256": pdf_file_info["sha256"],
+        "pdf_size": pdf_file_info["size"],
+        "fingerprint": fingerprint,
+        "created_time": datetime.now().isoformat(),
+        "can_cleanup": False,
+        **extra
+    }
+    submission_index[fingerprint] = task_id
+
+def should_profile(requested: bool = False) -> bool:
+    """请求显式要求剖析，或按 PROFILE_SAMPLE_RATE 随机抽中时，对任务开启性能剖析"""
+    return requested or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+def update_task_status(task_id: str, **fields):
+    """更新任务状态，并向订阅该任务的 SSE 连接推送最新状态（可在处理线程中调用）"""
+    status = processing_status.get(task_id)
+    if status is None:
+        return
+    status.update(fields)
+    task_event_broker.publish(task_id, dict(status))
+
+def update_task_stage(task_id: str, stage: str, message: Optional[str] = None, **fields):
+    """进入新的处理阶段"""
+    default_message, progress = TASK_STAGES[stage]
+    update_task_status(task_id, stage=stage, message=message or default_message, progress=progress, **fields)
+
+def mark_artifact_ready(task_id: str, template_type: str, file_path: str):
+    """
+    某个模板的任务单已保存：写入产物存储并记录到任务状态中，无需等待其他模板即可下载；
+    同时更新存储中的任务清单，其他节点据此提供下载
+    """
+    status = processing_status.get(task_id)
+    if status is None:
+        return
+    path = Path(file_path)
+    key = store_key(path)
+    artifact_store.put_file(key, path)
+    artifacts = dict(status.get("artifacts", {}))
+    artifacts[template_type] = {
+        "status": "ready",
+        "file_name": path.name,
+        "size": path.stat().st_size,
+        "path": str(path),
+        "key": key,
+        "ready_time": datetime.now().isoformat(),
+    }
+    update_task_status(task_id, artifacts=artifacts,
+                       message=f"{TEMPLATE_TYPE_NAMES.get(template_type, template_type)}任务单已生成，可先下载")
+    manifest = {
+        "task_id": task_id,
+        "customer_code": status.get("generation_params", {}).get("customer_code", ""),
+        "artifacts": artifacts,
+    }
+    artifact_store.put_bytes(task_manifest_key(task_id), json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+
+def task_manifest_key(task_id: str) -> str:
+    """任务清单（各模板任务单的存储键）在产物存储中的位置"""
+    return f"{store_key(OUTPUT_DIR)}/_manifests/{task_id}.json"
+
+def load_task_manifest(task_id: str) -> Optional[Dict[str, Any]]:
+    """任务的客户号和各模板任务单：本节点处理的任务读取任务状态，其他节点处理的任务读取存储中的清单"""
+    status = processing_status.get(task_id)
+    if status is not None:
+        return {
+            "customer_code": status.get("generation_params", {}).get("customer_code", ""),
+            "artifacts": status.get("artifacts", {}),
+        }
+    data = artifact_store.get_bytes(task_manifest_key(task_id))
+    if data is not None:
+        return json.loads(data.decode("utf-8"))
+    # 早于任务清单的历史任务，从本地输出文件夹查找
+    task_dir = find_task_output_dir(task_id)
+    if task_dir is None:
+        return None
+    return {
+        "customer_code": task_dir.name.split('_')[0],
+        "artifacts": {
+            file_path.name: {"status": "ready", "file_name": file_path.name, "key": store_key(file_path)}
+            for file_path in sorted(task_dir.glob("*.xlsx"))
+        },
+    }
+
+def parse_priority(priority: str) -> int:
+    """校验上传时填写的优先级，返回调度使用的优先级数值"""
+    if priority not in TASK_PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"优先级必须为: {', '.join(TASK_PRIORITIES)}")
+    return TASK_PRIORITIES[priority]
+
+def publish_queue_positions(snapshot: Dict[str, Dict[str, Any]]):
+    """排队情况变化后，更新各排队任务的排队位置和预计等待时间"""
+    for task_id in queued_task_ids - snapshot.keys():
+        update_task_status(task_id, queue_position=None, estimated_wait_seconds=None)
+    for task_id, queue_info in snapshot.items():
+        status = processing_status.get(task_id)
+        if status is None or all(status.get(key) == value for key, value in queue_info.items()):
+            continue
+        fields = dict(queue_info)
+        if status.get("stage") == "queued":
+            fields["message"] = (f"排队中，第 {queue_info['queue_position']} 位，"
+                                 f"预计等待 {queue_info['estimated_wait_seconds']:.0f} 秒...")
+        update_task_status(task_id, **fields)
+    queued_task_ids.clear()
+    queued_task_ids.update(snapshot)
+
+def resolve_task_codes(task_id: str, pdf_info: Dict[str, Any], template_2_info: Dict[str, Any]):
+    """匹配 PO 货号与模板货号，并将匹配报告记录到任务状态"""
+    code_resolution = excel_processor.resolve_codes(pdf_info, template_2_info)
+    code_report = code_resolution.report()
+    if code_report["unmatched"] or code_report["ambiguous"] or code_report["corrected"]:
+        logger.warning(f"任务 {task_id} 货号匹配: 未匹配 {code_report['unmatched']}，"
+                       f"多模板重复 {code_report['ambiguous']}，经修正 {code_report['corrected']}")
+    update_task_status(task_id, code_report=code_report)
+    return code_resolution
+
+def verify_admin_token(x_admin_token: Optional[str]):
+    """校验管理接口令牌；未设置 ADMIN_TOKEN 时管理接口不开放（返回 404）"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="无权访问")
+
+def find_task_output_dir(task_id: str) -> Optional[Path]:
+    """根据任务ID查找输出文件夹（文件夹名为 客户号_任务ID）"""
+    if not OUTPUT_DIR.exists():
+        return None
+    for d in OUTPUT_DIR.iterdir():
+        if d.is_dir() and d.name.endswith(f"_{task_id}"):
+            return d
+    return None
+
+def build_zip(zip_path: str, entries: List[tuple]):
+    """将 (文件路径, ZIP内路径) 列表打包为ZIP文件"""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for file_path, arcname in entries:
+            zip_file.write(file_path, arcname)
+
+def build_store_zip(zip_path: str, entries: List[tuple]):
+    """将 (存储键, ZIP内路径) 列表打包为ZIP文件，文件内容从产物存储流式读取"""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for key, arcname in entries:
+            with zip_file.open(arcname, 'w') as dest:
+                for chunk in artifact_store.iter_chunks(key):
+                    dest.write(chunk)
+
+async def artifact_response(key: str, filename: str, media_type: str):
+    """返回产物存储中的文件：本地存储直接返回文件，其他存储分块流式转发"""
+    local_path = artifact_store.local_path(key)
+    if local_path is not None:
+        if not local_path.exists():
+            raise HTTPException(status_code=404, detail="文件不存在")
+        return FileResponse(path=local_path, filename=filename, media_type=media_type)
+
+    info = await asyncio.get_running_loop().run_in_executor(None, artifact_store.stat, key)
+    if info is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return StreamingResponse(
+        artifact_store.iter_chunks(key),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+            "Content-Length": str(info.size),
+        }
+    )
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """
+    在读取请求体之前，根据 Content-Length 拒绝超出大小限制的上传；
+    工作进程排空（即将回收）期间拒绝新的上传，客户端稍后重试时由新的工作进程处理
+    """
+    size_limits = {"/upload": MAX_FILE_SIZE, "/preparse": MAX_FILE_SIZE, "/batch/upload": MAX_BATCH_SIZE}
+    max_size = size_limits.get(request.url.path)
+    if request.method == "POST" and max_size is not None:
+        if worker_recycler.draining:
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "服务正在重启，请稍后重试"},
+                headers={"Retry-After": str(WORKER_DRAIN_RETRY_AFTER)}
+            )
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_size + MULTIPART_OVERHEAD_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"文件大小超过限制 ({max_size // (1024 * 1024)}MB)"}
+            )
+    return await call_next(request)
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     """主页面"""
     return templates.TemplateResponse("index.html", {"request": request})
 
+@app.post("/preparse")
+async def preparse_file(
+    request: Request,
+    pdf_file: UploadFile = File(...),
+    customer_code: str = Form("")
+):
+    """
+    提前上传PDF：选择文件后立即上传并在后台解析，用户填写表单期间完成 OCR
+
+    返回 preparse_id，提交 /upload 时携带即可认领解析结果；超过 PREPARSE_TTL 未认领的预解析会被清理
+    """
+    preparse_id = str(uuid.uuid4())
+    preparse_dir = UPLOAD_DIR / f"preparse_{preparse_id}"
+    preparse_dir.mkdir(exist_ok=True)
+    pdf_path = preparse_dir / "pdf_file.pdf"
+    try:
+        with metrics.track_stage("upload", customer_code):
+            pdf_file_info = await save_upload_file(pdf_file, pdf_path)
+    except HTTPException as e:
+        logger.warning(f"预解析上传被拒绝: {e.detail}")
+        shutil.rmtree(preparse_dir, ignore_errors=True)
+        raise
+    except Exception as e:
+        logger.error(f"预解析上传失败: {str(e)}")
+        shutil.rmtree(preparse_dir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
+
+    job = PreparseJob(preparse_id, preparse_dir, pdf_path, pdf_file.filename, pdf_file_info, customer_code)
+    preparse_jobs[preparse_id] = job
+    # 预解析按提交的客户分队列（未填写客户号时按客户端地址），某个客户大量提前上传时不影响其他客户的预解析
+    queue_key = f"preparse:{customer_code or (request.client.host if request.client else '')}"
+    asyncio.create_task(run_preparse(job, queue_key))
+    logger.info(f"预解析 {preparse_id} 已添加到后台处理队列，上传目录: {preparse_dir}")
+    return {"preparse_id": preparse_id, "status": job.state}
+
+@app.get("/preparse/{preparse_id}")
+async def get_preparse_status(preparse_id: str):
+    """获取预解析状态（已被认领的预解析不再返回）"""
+    job = preparse_jobs.get(preparse_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="预解析不存在或已过期")
+    return job.describe()
+
+async def run_preparse(job: PreparseJob, queue_key: str):
+    """
+    预解析经调度器以最低优先级在处理线程池执行：只使用已提交任务用不到的处理线程。
+    各客户的预解析在 queue_key 对应的调度队列中排队（与该客户已提交的任务分开，不占用其任务的并发额度），
+    客户之间公平轮流，每个客户同时进行的预解析数受单客户并发上限限制
+    """
+    parse = functools.partial(
+        pdf_extractor.parse_pdf_cached, str(job.pdf_path), job.pdf_file_info["sha256"], job.customer_code
+    )
+    try:
+        await task_scheduler.run(f"preparse_{job.preparse_id}", queue_key, PREPARSE_PRIORITY,
+                                 functools.partial(job.run, parse))
+    except Exception as e:
+        logger.error(f"预解析 {job.preparse_id} 调度失败: {e}")
+        return
+    if job.state == "parsed":
+        logger.info(f"预解析 {job.preparse_id} 完成，耗时: {job.parse_seconds:.1f}秒")
+    elif job.state == "error":
+        logger.warning(f"预解析 {job.preparse_id} 失败，提交后将重新解析: {job.error}")
+
 @app.post("/upload")
 async def upload_files(
     background_tasks: BackgroundTasks,
-    pdf_file: UploadFile = File(...),
+    pdf_file: Optional[UploadFile] = File(None),
     task_order_no: str = Form(...),
     order_date: str = Form(...),
     delivery_date: str = Form(...),
-    customer_code: str = Form(...)
+    customer_code: str = Form(...),
+    profile: bool = Form(False),
+    priority: str = Form("normal"),
+    preparse_id: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    x_profile: Optional[str] = Header(None, alias="X-Profile")
 ):
-    """上传文件并处理"""
+    """
+    上传文件并处理
+
+    priority 为 rush 时作为加急单优先调度；profile 表单字段或 X-Profile: 1 请求头可对该任务开启性能剖析；
+    提供 preparse_id 时认领 /preparse 提前上传的 PDF，无需再次上传文件，已完成的解析结果直接用于本任务
+    """
+    priority_value = parse_priority(priority)
+    task_upload_dir = None
+    idempotency_index_key = f"idempotency:{idempotency_key}" if idempotency_key else None
     try:
+        # 携带相同 Idempotency-Key 的请求，无需保存文件直接返回已有任务
+        if idempotency_index_key:
+            existing_task_id = find_existing_task(idempotency_index_key)
+            if existing_task_id:
+                return duplicate_response(existing_task_id)
+
         # 生成唯一任务ID
         task_id = str(uuid.uuid4())
         
-        # 为每个任务创建独立的文件夹
-        task_upload_dir = UPLOAD_DIR / f"task_{task_id}"
-        task_upload_dir.mkdir(exist_ok=True)
+        preparse_job = None
+        if preparse_id:
+            # 认领提前上传的PDF，文件已保存并计算过哈希
+            preparse_job = preparse_jobs.get(preparse_id)
+            if preparse_job is None:
+                raise HTTPException(status_code=404, detail="预解析不存在或已过期，请重新上传PDF")
+            pdf_file_info = preparse_job.pdf_file_info
+            file_name = preparse_job.file_name
+        elif pdf_file is not None:
+            # 为每个任务创建独立的文件夹
+            task_upload_dir = UPLOAD_DIR / f"task_{task_id}"
+            task_upload_dir.mkdir(exist_ok=True)
+            
+            # 分块保存上传的PDF文件，同时校验大小和文件头，并计算内容哈希
+            pdf_path = task_upload_dir / "pdf_file.pdf"
+            with metrics.track_stage("upload", customer_code):
+                pdf_file_info = await save_upload_file(pdf_file, pdf_path)
+            file_name = pdf_file.filename
+        else:
+            raise HTTPException(status_code=400, detail="请上传PDF文件")
         
-        # 保存上传的PDF文件
-        pdf_path = task_upload_dir / "pdf_file.pdf"
-        with open(pdf_path, "wb") as buffer:
-            shutil.copyfileobj(pdf_file.file, buffer)
+        # 相同PDF + 相同表单字段的提交，挂到已有任务上
+        fingerprint = compute_submission_fingerprint(
+            pdf_file_info["sha256"], task_order_no, order_date, delivery_date, customer_code
+        )
+        existing_task_id = find_existing_task(fingerprint)
+        if existing_task_id:
+            if task_upload_dir is not None:
+                shutil.rmtree(task_upload_dir, ignore_errors=True)
+            if idempotency_index_key:
+                submission_index[idempotency_index_key] = existing_task_id
+            return duplicate_response(existing_task_id)
         
         # 以字典形式，根据客户号获取Excel模板路径
         templates_2_path = get_excel_template_path(customer_code)
         
         # 获取PDF文件名（不含扩展名）
-        pdf_name = Path(pdf_file.filename).stem
+        pdf_name = Path(file_name).stem
+        
+        if preparse_job is not None:
+            # 预解析目录直接作为任务上传目录，之后随任务一起清理
+            preparse_jobs.pop(preparse_id, None)
+            task_upload_dir = preparse_job.upload_dir
+            pdf_path = preparse_job.pdf_path
         
         # 初始化任务状态
-        processing_status[task_id] = {
-            "status": "processing", 
-            "message": "正在处理...",
-            "upload_dir": str(task_upload_dir),
-            "created_time": datetime.now().isoformat(),
-            "can_cleanup": False
-        }
+        init_task_status(task_id, task_upload_dir, pdf_file_info, fingerprint, priority=priority,
+                         preparse_id=preparse_id,
+                         profiling=should_profile(profile or x_profile in ("1", "true")))
+        if idempotency_index_key:
+            submission_index[idempotency_index_key] = task_id
         
         # 使用 BackgroundTasks 异步处理文件
         background_tasks.add_task(
             process_files,
             task_id, pdf_path, templates_2_path,
-            task_order_no, order_date, delivery_date, pdf_name, customer_code
+            task_order_no, order_date, delivery_date, pdf_name, customer_code,
+            priority=priority_value, preparse_job=preparse_job
         )
         
         logger.info(f"任务 {task_id} 已添加到后台处理队列，上传目录: {task_upload_dir}")
         return {"task_id": task_id, "status": "processing"}
     
+    except HTTPException as e:
+        logger.warning(f"文件上传被拒绝: {e.detail}")
+        if task_upload_dir is not None:
+            shutil.rmtree(task_upload_dir, ignore_errors=True)
+        raise
     except Exception as e:
         logger.error(f"文件上传失败: {str(e)}")
+        if task_upload_dir is not None:
+            shutil.rmtree(task_upload_dir, ignore_errors=True)
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
 async def process_files(task_id: str, pdf_path: Path, templates: Dict[str, str], 
-                       task_order_no: str, order_date: str, delivery_date: str, pdf_name: str, customer_code: str):
-    """ 后台处理文件 """
+                       task_order_no: str, order_date: str, delivery_date: str, pdf_name: str, customer_code: str,
+                       template_reference=None, priority: int = 0, preparse_job: Optional[PreparseJob] = None):
+    """ 后台处理文件：经公平调度器排队后在处理线程池执行，不阻塞事件循环 """
+    # 排队深度在这里增减：任务开始执行时，或未开始就结束（调度出错、被取消）时恰好减一次
+    dequeued = threading.Lock()
+
+    def leave_queue():
+        if dequeued.acquire(blocking=False):
+            metrics.dec_queue_depth()
+
+    def start_task():
+        leave_queue()
+        run_task(task_id, pdf_path, templates, task_order_no, order_date, delivery_date, pdf_name, customer_code,
+                 template_reference, preparse_job)
+
+    metrics.inc_queue_depth()
+    try:
+        await task_scheduler.run(task_id, customer_code, priority, start_task)
+    finally:
+        leave_queue()
+        # 任务数或常驻内存超过阈值时开始排空，已接受的任务处理完成后回收工作进程
+        drain_reason = worker_recycler.task_finished()
+        if drain_reason:
+            asyncio.create_task(drain_and_recycle(drain_reason))
+
+def run_task(task_id: str, *args):
+    """
+    在处理线程中运行任务，任务运行期间的内存（开始、峰值、结束）记录到任务状态的 memory 中；
+    任务开启了性能剖析时，剖析整个处理过程并将产物保存到任务目录
+    """
+    status = processing_status[task_id]
+    profile_dir = Path(status["upload_dir"]) / "profile"
+    processed = False
+    memory_usage, profile_artifacts = None, []
+    try:
+        with task_memory.track() as memory_usage:
+            with profile_task(task_id, profile_dir, enabled=status.get("profiling", False)) as profile_artifacts:
+                processed = True
+                run_processing(task_id, *args)
+    except Exception as e:
+        # run_processing 自身会捕获处理异常并更新状态，这里只可能是剖析或内存采样出错，不能影响任务本身
+        logger.error(f"任务 {task_id} 剖析或内存采样出错: {e}")
+        if not processed:
+            run_processing(task_id, *args)
+    if memory_usage is not None:
+        update_task_status(task_id, memory=memory_usage)
+
+    if profile_artifacts:
+        logger.info(f"任务 {task_id} 性能剖析结果已保存至: {profile_dir}")
+        update_task_status(task_id, profile_artifacts=profile_artifacts)
+
+def run_processing(task_id: str, pdf_path: Path, templates: Dict[str, str], 
+                   task_order_no: str, order_date: str, delivery_date: str, pdf_name: str, customer_code: str,
+                   template_reference=None, preparse_job: Optional[PreparseJob] = None):
+    """ 处理单个任务：PDF信息提取 + 生成生产任务单（在处理线程池中运行） """
     # 记录开始时间
     start_time = datetime.now()
+    metrics.inc_active_workers()
     
     try:
         logger.info(f"开始处理任务 {task_id}")
-        processing_status[task_id]["message"] = "正在提取PDF信息..."
         
-        # 1. 提取PDF信息
-        pdf_info, template_2_info = pdf_extractor.process(str(pdf_path), templates)
+        # 上传的PDF写入产物存储（本地存储根目录为应用目录时即原文件，不复制）
+        artifact_store.put_file(store_key(pdf_path), pdf_path)
+        
+        # 1. 提取PDF信息（提前上传的PDF：预解析已开始时等待其完成，尚未开始时取消预解析由本任务解析）
+        with span("pdf_extract"):
+            pdf_markdown = None
+            if preparse_job is not None:
+                update_task_stage(task_id, "parsing")
+                pdf_markdown = preparse_job.take_markdown()
+                if pdf_markdown is not None:
+                    logger.info(f"任务 {task_id} 使用预解析结果，跳过PDF解析")
+            pdf_info, template_2_info = pdf_extractor.process(
+                str(pdf_path), templates, template_reference, processing_status[task_id].get("pdf_sha256"),
+                progress_callback=lambda stage: update_task_stage(task_id, stage),
+                customer_code=customer_code, pdf_markdown=pdf_markdown,
+                # AI 调用因限流排队等待的时间记录到任务状态
+                throttle_callback=lambda seconds: update_task_status(task_id, llm_throttle_seconds=round(seconds, 2))
+            )
         logger.info(f"任务 {task_id} PDF信息提取完成")
         
-        processing_status[task_id]["message"] = "正在生成生产任务单..."
+        # 保存抽取结果和生成参数，修改后可直接重新生成 Excel，无需再次解析和调用 AI
+        task_template_info[task_id] = template_2_info
+        update_task_stage(
+            task_id, "generating",
+            artifacts={template_type: {"status": "pending"} for template_type in template_2_info},
+            extracted_info=pdf_info,
+            generation_params={
+                "task_order_no": task_order_no,
+                "order_date": order_date,
+                "delivery_date": delivery_date,
+                "customer_code": customer_code,
+                "pdf_name": pdf_name,
+            }
+        )
         
-        # 2. 将抽取后的信息插入 Excel模板，并保存到输出路径
-        saved_file_paths = excel_processor.process(pdf_info, template_2_info, task_order_no, order_date, delivery_date, str(OUTPUT_DIR), pdf_name, customer_code, task_id)
+        # 2. PO 货号匹配到模板货号，匹配报告（未匹配、经修正的货号）记录到任务状态
+        code_resolution = resolve_task_codes(task_id, pdf_info, template_2_info)
+        
+        # 3. 将抽取后的信息插入 Excel模板，并保存到输出路径
+        with span("excel_generate"):
+            saved_file_paths = excel_processor.process(
+                pdf_info, template_2_info, task_order_no, order_date, delivery_date, str(OUTPUT_DIR), pdf_name,
+                customer_code, task_id, artifact_callback=functools.partial(mark_artifact_ready, task_id),
+                code_resolution=code_resolution
+            )
         
         # 计算处理时长
         end_time = datetime.now()
@@ -165,13 +694,14 @@ async def process_files(task_id: str, pdf_path: Path, templates: Dict[str, str],
         else:
             saved_file_path = saved_file_paths
         
-        processing_status[task_id].update({
-            "status": "completed", 
-            "message": f"处理完成 (耗时: {processing_duration:.1f}秒)",
-            "output_file": saved_file_path,
-            "completed_time": datetime.now().isoformat(),
-            "processing_duration": processing_duration
-        })
+        update_task_stage(
+            task_id, "completed",
+            message=f"处理完成 (耗时: {processing_duration:.1f}秒)",
+            status="completed",
+            output_file=saved_file_path,
+            completed_time=datetime.now().isoformat(),
+            processing_duration=processing_duration
+        )
         
         logger.info(f"任务 {task_id} 处理完成，文件保存至: {saved_file_path}，耗时: {processing_duration:.1f}秒")
         
@@ -182,12 +712,150 @@ async def process_files(task_id: str, pdf_path: Path, templates: Dict[str, str],
         
         error_msg = f"处理失败: {str(e)}"
         logger.error(f"任务 {task_id} {error_msg}，耗时: {processing_duration:.1f}秒")
-        processing_status[task_id].update({
-            "status": "error", 
-            "message": f"{error_msg} (耗时: {processing_duration:.1f}秒)",
-            "completed_time": datetime.now().isoformat(),
-            "processing_duration": processing_duration
-        })
+        update_task_stage(
+            task_id, "error",
+            message=f"{error_msg} (耗时: {processing_duration:.1f}秒)",
+            status="error",
+            completed_time=datetime.now().isoformat(),
+            processing_duration=processing_duration
+        )
+    finally:
+        metrics.dec_active_workers()
+
+class RegenerateRequest(BaseModel):
+    """修改抽取结果 / 表单字段后重新生成，未提供的字段沿用原值"""
+    po_no: Optional[str] = None
+    product_info: Optional[List[Dict[str, Any]]] = None  # 整体替换产品列表
+    quantities: Optional[Dict[str, Union[int, str]]] = None  # 按客户货号修改数量
+    task_order_no: Optional[str] = None
+    order_date: Optional[str] = None
+    delivery_date: Optional[str] = None
+
+def apply_regenerate_request(pdf_info: Dict[str, Any], params: Dict[str, str],
+                             request: RegenerateRequest) -> tuple:
+    """在原抽取结果和生成参数上应用修改，返回新的 (pdf_info, params)"""
+    new_pdf_info = {
+        "po_no": request.po_no if request.po_no is not None else pdf_info.get("po_no", ""),
+        "product_info": [dict(item) for item in (request.product_info or pdf_info["product_info"])],
+    }
+    for item in new_pdf_info["product_info"]:
+        if "cust_item_code" not in item or "quantity" not in item:
+            raise HTTPException(status_code=400, detail="产品信息必须包含 cust_item_code 和 quantity")
+
+    if request.quantities:
+        items_by_code = {item["cust_item_code"]: item for item in new_pdf_info["product_info"]}
+        unknown_codes = [code for code in request.quantities if code not in items_by_code]
+        if unknown_codes:
+            raise HTTPException(status_code=400, detail=f"PO中不存在以下客户货号: {', '.join(unknown_codes)}")
+        for code, quantity in request.quantities.items():
+            items_by_code[code]["quantity"] = quantity
+
+    # 数量按 Excel 填写时的方式（int）转换，不合法时返回 400，而不是在生成阶段失败
+    invalid_codes = []
+    for item in new_pdf_info["product_info"]:
+        try:
+            quantity = int(item["quantity"])
+        except (TypeError, ValueError):
+            quantity = -1
+        if quantity < 0 or isinstance(item["quantity"], bool):
+            invalid_codes.append(f"{item['cust_item_code']}={item['quantity']!r}")
+        else:
+            item["quantity"] = quantity
+    if invalid_codes:
+        raise HTTPException(status_code=400, detail=f"以下货号的数量不是非负整数: {', '.join(invalid_codes)}")
+
+    new_params = dict(params)
+    for field_name in ("task_order_no", "order_date", "delivery_date"):
+        value = getattr(request, field_name)
+        if value is not None:
+            new_params[field_name] = value
+    return new_pdf_info, new_params
+
+def regenerate_excel(task_id: str, pdf_info: Dict[str, Any], template_2_info: Dict[str, Any],
+                     params: Dict[str, str]) -> Dict[str, str]:
+    """
+    仅重新执行 Excel 生成阶段
+
+    先生成到任务上传目录下的临时目录，成功后移入输出目录（同名文件直接覆盖），
+    全部移入后再删除文件名已变化的旧文件；生成或移入失败时原有文件保持不变
+    """
+    staging_root = Path(processing_status[task_id]["upload_dir"]) / "regenerate"
+    shutil.rmtree(staging_root, ignore_errors=True)
+    try:
+        code_resolution = resolve_task_codes(task_id, pdf_info, template_2_info)
+        staged_paths = excel_processor.process(pdf_info, template_2_info, params["task_order_no"], params["order_date"],
+                                               params["delivery_date"], str(staging_root), params["pdf_name"],
+                                               params["customer_code"], task_id, code_resolution=code_resolution)
+
+        output_dir = find_task_output_dir(task_id) or OUTPUT_DIR / f"{params['customer_code']}_{task_id}"
+        output_dir.mkdir(parents=True, exist_ok=True)
+        old_keys = {artifact.get("key") for artifact in processing_status[task_id].get("artifacts", {}).values()}
+        old_files = set(output_dir.glob("*.xlsx"))
+        saved_paths = {}
+        for template_type, staged_path in staged_paths.items():
+            saved_paths[template_type] = shutil.move(staged_path, str(output_dir / Path(staged_path).name))
+            mark_artifact_ready(task_id, template_type, saved_paths[template_type])
+        # 任务单号或PO号变化时文件名也会变化，新文件全部就绪后再删除旧文件名（本地和存储中）
+        for old_file in old_files - {Path(path) for path in saved_paths.values()}:
+            old_file.unlink(missing_ok=True)
+        for key in old_keys - {store_key(path) for path in saved_paths.values()} - {None}:
+            artifact_store.delete(key)
+        return saved_paths
+    finally:
+        shutil.rmtree(staging_root, ignore_errors=True)
+
+@app.post("/regenerate/{task_id}")
+async def regenerate_task(task_id: str, request: RegenerateRequest):
+    """
+    修改抽取结果（PO号、产品数量）或表单字段（任务单号、日期）后重新生成Excel
+
+    复用任务保存的抽取结果，只执行 Excel 生成阶段，不再解析PDF和调用AI
+    """
+    status = processing_status.get(task_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if status["status"] == "processing" or status.get("regenerating"):
+        raise HTTPException(status_code=409, detail="任务正在处理中，请稍后再试")
+    if "extracted_info" not in status or task_id not in task_template_info:
+        raise HTTPException(status_code=400, detail="任务没有可用的抽取结果，请重新上传")
+
+    pdf_info, params = apply_regenerate_request(status["extracted_info"], status["generation_params"], request)
+    if "(1)" not in params["task_order_no"]:
+        raise HTTPException(status_code=400, detail="任务单号必须包含 '(1)'")
+
+    update_task_status(task_id, regenerating=True)
+    start_time = datetime.now()
+    try:
+        # Excel 生成耗时很短，使用默认线程池，不排在处理线程池中等待 OCR/AI 任务
+        loop = asyncio.get_running_loop()
+        with metrics.track_stage("regenerate", params["customer_code"]):
+            saved_paths = await loop.run_in_executor(
+                None, regenerate_excel, task_id, pdf_info, task_template_info[task_id], params
+            )
+    except Exception as e:
+        logger.error(f"任务 {task_id} 重新生成失败: {e}")
+        update_task_status(task_id, regenerating=False)
+        raise HTTPException(status_code=500, detail=f"重新生成失败: {str(e)}")
+
+    processing_duration = (datetime.now() - start_time).total_seconds()
+    update_task_stage(
+        task_id, "completed",
+        message=f"重新生成完成 (耗时: {processing_duration:.2f}秒)",
+        status="completed",
+        regenerating=False,
+        extracted_info=pdf_info,
+        generation_params=params,
+        output_file=params["customer_code"],
+        regenerated_time=datetime.now().isoformat(),
+        regenerate_count=status.get("regenerate_count", 0) + 1,
+        # 重新生成的文件需要重新下载，下载后再开始计算清理时间
+        can_cleanup=False,
+        download_time=None
+    )
+    logger.info(f"任务 {task_id} 重新生成完成，耗时: {processing_duration:.2f}秒")
+    return {"task_id": task_id, "status": "completed",
+            "files": {template_type: Path(path).name for template_type, path in saved_paths.items()},
+            "processing_duration": processing_duration}
 
 @app.get("/status/{task_id}")
 async def get_status(task_id: str):
@@ -197,37 +865,74 @@ async def get_status(task_id: str):
     
     return processing_status[task_id]
 
+@app.get("/events/{task_id}")
+async def stream_status(task_id: str, request: Request):
+    """
+    以 Server-Sent Events 推送任务进度
+
+    连接建立后立即推送一次当前状态，之后每次阶段变化时推送；任务完成或失败后关闭连接。
+    每隔 SSE_KEEPALIVE_INTERVAL 秒重新读取一次任务状态，既作为心跳，也保证未收到事件时状态不会滞后
+
+    任务状态和事件只保存在接受该任务的进程内存中，仅支持单个工作进程部署（工作进程回收后由快照恢复）；
+    本进程中不存在的任务返回 404，前端随后回退为轮询 /status
+    """
+    if task_id not in processing_status:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    def format_event(status: Dict[str, Any]) -> str:
+        return f"data: {json.dumps(status, ensure_ascii=False)}\n\n"
+
+    async def event_stream():
+        queue = task_event_broker.subscribe(task_id)
+        try:
+            status = processing_status.get(task_id)
+            while status is not None:
+                yield format_event(status)
+                if status["status"] != "processing":
+                    break
+
+                try:
+                    status = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    status = processing_status.get(task_id)
+        finally:
+            task_event_broker.unsubscribe(task_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/download/{task_id}")
 async def download_task_files(task_id: str):
-    """下载任务ID对应的所有Excel文件（打包为ZIP）"""
-    import zipfile
+    """下载任务ID对应的所有Excel文件（打包为ZIP），所有模板的任务单都生成后才可下载"""
     import tempfile
     
-    # 根据任务ID查找对应的文件夹
-    outputs_dir = Path("outputs")
-    task_dirs = [d for d in outputs_dir.iterdir() 
-                if d.is_dir() and d.name.endswith(f"_{task_id}")]
+    status = processing_status.get(task_id)
+    if status is not None and (status["status"] == "processing" or status.get("regenerating")):
+        raise HTTPException(status_code=409, detail="文件尚未全部生成，可先通过 /download/{task_id}/{GM|GX} 下载已完成的文件")
     
-    if not task_dirs:
+    # 从任务清单中查找各模板任务单（任务可能由其他节点处理，文件从产物存储读取）
+    loop = asyncio.get_running_loop()
+    manifest = await loop.run_in_executor(None, load_task_manifest, task_id)
+    if not manifest or not manifest["artifacts"]:
         raise HTTPException(status_code=404, detail=f"任务 {task_id} 的文件不存在")
+    if any(artifact["status"] != "ready" for artifact in manifest["artifacts"].values()):
+        raise HTTPException(status_code=409, detail="文件尚未全部生成，可先通过 /download/{task_id}/{GM|GX} 下载已完成的文件")
+    customer_code = manifest["customer_code"]
     
-    # 使用找到的任务文件夹
-    task_dir = task_dirs[0]  # 应该只有一个匹配的文件夹
-    
-    # 检查是否有Excel文件
-    excel_files = list(task_dir.glob("*.xlsx"))
-    if not excel_files:
-        raise HTTPException(status_code=404, detail=f"任务 {task_id} 没有找到Excel文件")
-    
-    # 创建临时ZIP文件
+    # 创建临时ZIP文件，保持原始文件名
     with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as tmp_file:
-        with zipfile.ZipFile(tmp_file.name, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for file_path in excel_files:
-                # 将文件添加到ZIP中，保持原始文件名
-                zip_file.write(file_path, file_path.name)
-    
-    # 从文件夹名中提取客户号
-    customer_code = task_dir.name.split('_')[0]  # 提取客户号
+        pass
+    entries = [(artifact["key"], artifact["file_name"]) for artifact in manifest["artifacts"].values()]
+    try:
+        with metrics.track_stage("zip_build", customer_code=customer_code):
+            await loop.run_in_executor(None, build_store_zip, tmp_file.name, entries)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"任务 {task_id} 的文件不存在")
     
     # 返回ZIP文件
     return FileResponse(
@@ -236,6 +941,26 @@ async def download_task_files(task_id: str):
         media_type="application/zip"
     )
 
+@app.get("/download/{task_id}/{template_type}")
+async def download_task_artifact(task_id: str, template_type: str):
+    """单独下载某个模板（GM 广美 / GX 广线）的任务单，该文件保存后即可下载，无需等待整个任务完成"""
+    status = processing_status.get(task_id)
+    manifest = await asyncio.get_running_loop().run_in_executor(None, load_task_manifest, task_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    template_type = template_type.upper()
+    artifact = manifest["artifacts"].get(template_type)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail=f"任务 {task_id} 没有 {template_type} 任务单")
+    if artifact["status"] != "ready" or (status is not None and status.get("regenerating")):
+        raise HTTPException(status_code=409, detail=f"{TEMPLATE_TYPE_NAMES.get(template_type, template_type)}任务单尚未生成")
+    
+    return await artifact_response(
+        artifact["key"], artifact["file_name"],
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
 @app.get("/download/{task_id}")
 async def download_file(task_id: str):
     """下载生成的文件"""
@@ -265,6 +990,334 @@ async def download_file(task_id: str):
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
 
+def parse_task_order_nos(raw: str, file_names: List[str]) -> List[str]:
+    """
+    解析批量上传的任务单号
+
+    支持两种格式：
+    1. JSON 对象 {"文件名.pdf": "任务单号"}
+    2. JSON 数组，按PDF顺序一一对应（ZIP 内的PDF按文件名排序）
+
+    Returns:
+        与 file_names 顺序一致的任务单号列表
+    """
+    try:
+        parsed = json.loads(raw)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="task_order_nos 必须是 JSON 对象或数组")
+
+    if isinstance(parsed, list):
+        if len(parsed) != len(file_names):
+            raise HTTPException(status_code=400, detail=f"任务单号数量 ({len(parsed)}) 与PDF数量 ({len(file_names)}) 不一致")
+        return [str(order_no).strip() for order_no in parsed]
+
+    if isinstance(parsed, dict):
+        missing = [name for name in file_names if name not in parsed]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"以下PDF缺少任务单号: {', '.join(missing)}")
+        return [str(parsed[name]).strip() for name in file_names]
+
+    raise HTTPException(status_code=400, detail="task_order_nos 必须是 JSON 对象或数组")
+
+def extract_pdfs_from_zip(zip_path: Path, dest_dir: Path) -> List[Dict[str, Any]]:
+    """
+    从ZIP中分块解压PDF文件，同时校验大小、文件头并计算哈希
+
+    Returns:
+        [{'filename': 原文件名, 'path': 解压后的路径, 'size': 文件大小, 'sha256': 内容哈希}]，按ZIP内文件名排序
+    """
+    try:
+        zf = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="ZIP文件已损坏")
+
+    staged = []
+    with zf:
+        members = sorted(
+            (m for m in zf.infolist()
+             if not m.is_dir()
+             and "__MACOSX" not in m.filename
+             and not Path(m.filename).name.startswith(".")
+             and Path(m.filename).suffix.lower() in ALLOWED_PDF_EXTENSIONS),
+            key=lambda m: m.filename
+        )
+        if len(members) > MAX_BATCH_FILES:
+            raise HTTPException(status_code=400, detail=f"单个批次最多 {MAX_BATCH_FILES} 个PDF")
+
+        for index, member in enumerate(members):
+            filename = Path(member.filename).name
+            dest_path = dest_dir / f"{index:04d}.pdf"
+            hasher = hashlib.sha256()
+            size = 0
+            with zf.open(member) as src, open(dest_path, "wb") as dst:
+                first_chunk = True
+                while True:
+                    chunk = src.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if first_chunk:
+                        if PDF_MAGIC_BYTES not in chunk[:PDF_MAGIC_SEARCH_RANGE]:
+                            raise HTTPException(status_code=400, detail=f"ZIP中的文件 {filename} 不是有效的PDF文件")
+                        first_chunk = False
+                    size += len(chunk)
+                    if size > MAX_FILE_SIZE:
+                        raise HTTPException(status_code=413, detail=f"ZIP中的文件 {filename} 大小超过限制 ({MAX_FILE_SIZE // (1024 * 1024)}MB)")
+                    hasher.update(chunk)
+                    dst.write(chunk)
+            if size == 0:
+                raise HTTPException(status_code=400, detail=f"ZIP中的文件 {filename} 为空")
+
+            staged.append({"filename": filename, "path": dest_path, "size": size, "sha256": hasher.hexdigest()})
+
+    return staged
+
+@app.post("/batch/upload")
+async def upload_batch(
+    background_tasks: BackgroundTasks,
+    pdf_files: Optional[List[UploadFile]] = File(None),
+    zip_file: Optional[UploadFile] = File(None),
+    task_order_nos: str = Form(...),
+    order_date: str = Form(...),
+    delivery_date: str = Form(...),
+    customer_code: str = Form(...),
+    profile: bool = Form(False),
+    priority: str = Form("normal")
+):
+    """
+    批量上传同一客户的多个PO（多个PDF或一个包含PDF的ZIP）
+
+    每个PDF生成一个独立任务，可通过 /status/{task_id} 和 /download/{task_id} 单独查询下载；
+    客户模板只加载一次，整个批次共享，各PDF通过处理线程池并行处理
+    """
+    if not FEATURES.get("batch_processing", False):
+        raise HTTPException(status_code=404, detail="批量处理功能未开启")
+
+    if not pdf_files and zip_file is None:
+        raise HTTPException(status_code=400, detail="请上传PDF文件或包含PDF的ZIP文件")
+    priority_value = parse_priority(priority)
+
+    batch_id = str(uuid.uuid4())
+    batch_upload_dir = UPLOAD_DIR / f"batch_{batch_id}"
+    loop = asyncio.get_running_loop()
+    try:
+        # 以字典形式，根据客户号获取Excel模板路径
+        templates_2_path = get_excel_template_path(customer_code)
+
+        batch_upload_dir.mkdir(exist_ok=True)
+
+        # 1. 保存所有PDF到批次暂存目录
+        if zip_file is not None:
+            zip_path = batch_upload_dir / "batch.zip"
+            with metrics.track_stage("upload", customer_code):
+                await save_upload_file(zip_file, zip_path, MAX_BATCH_SIZE, {".zip"}, ZIP_MAGIC_BYTES)
+            staged = await loop.run_in_executor(None, extract_pdfs_from_zip, zip_path, batch_upload_dir)
+        else:
+            if len(pdf_files) > MAX_BATCH_FILES:
+                raise HTTPException(status_code=400, detail=f"单个批次最多 {MAX_BATCH_FILES} 个PDF")
+            staged = []
+            for index, upload in enumerate(pdf_files):
+                pdf_path = batch_upload_dir / f"{index:04d}.pdf"
+                with metrics.track_stage("upload", customer_code):
+                    pdf_file_info = await save_upload_file(upload, pdf_path)
+                staged.append({"filename": upload.filename, "path": pdf_path, **pdf_file_info})
+
+        if not staged:
+            raise HTTPException(status_code=400, detail="未找到任何PDF文件")
+
+        order_nos = parse_task_order_nos(task_order_nos, [item["filename"] for item in staged])
+
+        # 2. 模板中的客户货号只加载一次，整个批次共享
+        template_reference = await loop.run_in_executor(None, pdf_extractor.get_customer_codes_reference, templates_2_path)
+
+        # 3. 每个PDF建立独立任务，重复提交的PDF复用已有任务
+        batch_tasks = []
+        new_tasks = []
+        for item, order_no in zip(staged, order_nos):
+            fingerprint = compute_submission_fingerprint(item["sha256"], order_no, order_date, delivery_date, customer_code)
+            existing_task_id = find_existing_task(fingerprint)
+            if existing_task_id:
+                batch_tasks.append({"task_id": existing_task_id, "filename": item["filename"], "duplicate": True})
+                continue
+
+            task_id = str(uuid.uuid4())
+            task_upload_dir = UPLOAD_DIR / f"task_{task_id}"
+            task_upload_dir.mkdir(exist_ok=True)
+            pdf_path = task_upload_dir / "pdf_file.pdf"
+            shutil.move(str(item["path"]), str(pdf_path))
+
+            init_task_status(task_id, task_upload_dir, item, fingerprint, batch_id=batch_id, priority=priority,
+                             profiling=should_profile(profile))
+            batch_tasks.append({"task_id": task_id, "filename": item["filename"], "duplicate": False})
+            new_tasks.append((task_id, pdf_path, order_no, Path(item["filename"]).stem))
+
+        batch_status[batch_id] = {
+            "customer_code": customer_code,
+            "tasks": batch_tasks,
+            "created_time": datetime.now().isoformat()
+        }
+
+        background_tasks.add_task(
+            process_batch,
+            batch_id, new_tasks, templates_2_path, order_date, delivery_date, customer_code, template_reference,
+            priority_value
+        )
+
+        logger.info(f"批次 {batch_id} 已添加到后台处理队列，共 {len(batch_tasks)} 个PDF，新任务 {len(new_tasks)} 个")
+        return {
+            "batch_id": batch_id,
+            "status": "processing",
+            "total": len(batch_tasks),
+            "tasks": batch_tasks
+        }
+
+    except HTTPException as e:
+        logger.warning(f"批量上传被拒绝: {e.detail}")
+        raise
+    except Exception as e:
+        logger.error(f"批量上传失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"批量上传失败: {str(e)}")
+    finally:
+        # 暂存目录中的PDF已移动到各任务文件夹，剩余内容（ZIP等）直接删除
+        shutil.rmtree(batch_upload_dir, ignore_errors=True)
+
+async def process_batch(batch_id: str, new_tasks: List[tuple], templates: Dict[str, str],
+                        order_date: str, delivery_date: str, customer_code: str, template_reference,
+                        priority: int = 0):
+    """并行处理批次中的所有任务，并发数由调度器的全局和单客户上限限制"""
+    start_time = datetime.now()
+    await asyncio.gather(*[
+        process_files(task_id, pdf_path, templates, order_no, order_date, delivery_date, pdf_name, customer_code,
+                      template_reference, priority)
+        for task_id, pdf_path, order_no, pdf_name in new_tasks
+    ])
+    processing_duration = (datetime.now() - start_time).total_seconds()
+    logger.info(f"批次 {batch_id} 处理结束，共 {len(new_tasks)} 个任务，耗时: {processing_duration:.1f}秒")
+
+@app.get("/batch/status/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """获取批次的汇总进度及各任务状态"""
+    if batch_id not in batch_status:
+        raise HTTPException(status_code=404, detail="批次不存在")
+
+    batch = batch_status[batch_id]
+    counts = {"processing": 0, "completed": 0, "error": 0, "expired": 0}
+    tasks = []
+    for task in batch["tasks"]:
+        status = processing_status.get(task["task_id"])
+        state = status["status"] if status else "expired"
+        counts[state] = counts.get(state, 0) + 1
+        tasks.append({
+            **task,
+            "status": state,
+            "message": status["message"] if status else "任务已清理"
+        })
+
+    total = len(tasks)
+    return {
+        "batch_id": batch_id,
+        "customer_code": batch["customer_code"],
+        "status": "processing" if counts["processing"] else "completed",
+        "total": total,
+        "completed": counts["completed"],
+        "failed": counts["error"],
+        "processing": counts["processing"],
+        "progress": round((total - counts["processing"]) / total * 100, 1) if total else 100.0,
+        "created_time": batch["created_time"],
+        "tasks": tasks
+    }
+
+@app.get("/batch/download/{batch_id}")
+async def download_batch_files(batch_id: str):
+    """下载批次中所有已完成任务的Excel文件（合并为一个ZIP，每个PDF一个文件夹）"""
+    import tempfile
+
+    if batch_id not in batch_status:
+        raise HTTPException(status_code=404, detail="批次不存在")
+
+    batch = batch_status[batch_id]
+    entries = []
+    seen_task_ids = set()
+    for task in batch["tasks"]:
+        task_id = task["task_id"]
+        status = processing_status.get(task_id)
+        if task_id in seen_task_ids or not status or status["status"] != "completed":
+            continue
+        seen_task_ids.add(task_id)
+
+        folder = f"{Path(task['filename']).stem}_{task_id[:8]}"
+        entries.extend(
+            (artifact["key"], f"{folder}/{artifact['file_name']}")
+            for artifact in status.get("artifacts", {}).values() if artifact["status"] == "ready"
+        )
+
+    if not entries:
+        raise HTTPException(status_code=404, detail=f"批次 {batch_id} 暂无已完成的文件")
+
+    with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as tmp_file:
+        pass
+    with metrics.track_stage("zip_build", batch["customer_code"]):
+        await asyncio.get_running_loop().run_in_executor(None, build_store_zip, tmp_file.name, entries)
+
+    return FileResponse(
+        tmp_file.name,
+        filename=f"{batch['customer_code']}_{batch_id}_生产任务单.zip",
+        media_type="application/zip"
+    )
+
+@app.get("/admin/profile/{task_id}")
+async def download_task_profile(task_id: str, x_admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """下载任务的性能剖析结果（profile.prof / profile.txt / trace.json 打包为ZIP）"""
+    import tempfile
+
+    verify_admin_token(x_admin_token)
+
+    # 与 run_task 相同，剖析结果保存在任务的上传目录下（提前上传的任务为预解析目录）
+    status = processing_status.get(task_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    profile_dir = Path(status["upload_dir"]) / "profile"
+    artifacts = sorted(profile_dir.glob("*")) if profile_dir.exists() else []
+    if not artifacts:
+        raise HTTPException(status_code=404, detail=f"任务 {task_id} 没有性能剖析结果")
+
+    with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as tmp_file:
+        await asyncio.get_running_loop().run_in_executor(
+            None, build_zip, tmp_file.name, [(file_path, file_path.name) for file_path in artifacts]
+        )
+
+    return FileResponse(
+        tmp_file.name,
+        filename=f"{task_id}_profile.zip",
+        media_type="application/zip"
+    )
+
+@app.get("/admin/runtime")
+async def get_runtime_stats(x_admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """运行状态：事件循环延迟、队列深度、工作线程占用、内存和各状态任务数，供压测工具定期采样"""
+    verify_admin_token(x_admin_token)
+
+    task_counts: Dict[str, int] = {}
+    for status in list(processing_status.values()):
+        task_counts[status.get("status", "unknown")] = task_counts.get(status.get("status", "unknown"), 0) + 1
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "event_loop_lag": event_loop_monitor.snapshot(),
+        "queue_depth": metrics.queue_depth(),
+        "active_workers": metrics.active_workers(),
+        "max_workers": MAX_CONCURRENT_TASKS,
+        "scheduler": task_scheduler.stats(),
+        "pending_preparses": len(preparse_jobs),
+        "artifact_store": artifact_store.describe(),
+        "extraction_cache": extraction_cache is not None,
+        "llm_rate_limit": llm_rate_limiter.snapshot(),
+        "inference_profile": inference_profile.describe(),
+        "worker": worker_recycler.describe(),
+        "rss_bytes": current_rss_bytes(),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "tasks": task_counts,
+    }
+
 async def cleanup_expired_files():
     """清理过期的上传文件"""
     try:
@@ -290,28 +1343,150 @@ async def cleanup_expired_files():
             if upload_dir and Path(upload_dir).exists():
                 try:
                     shutil.rmtree(upload_dir)
+                    # 产物存储中的上传文件一并删除（本地存储根目录为应用目录时即为同一文件夹）
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, artifact_store.delete_prefix, store_key(upload_dir)
+                    )
                     logger.info(f"已清理任务 {task_id} 的上传文件夹: {upload_dir}")
                     cleanup_count += 1
                 except Exception as e:
                     logger.warning(f"清理任务 {task_id} 文件夹失败: {e}")
             
-            # 从状态中移除任务
+            # 从状态中移除任务，并移除指向该任务的去重索引
             del processing_status[task_id]
+            task_template_info.pop(task_id, None)
+            for index_key in [k for k, v in submission_index.items() if v == task_id]:
+                del submission_index[index_key]
             logger.info(f"已从状态中移除任务 {task_id}")
         
+        # 批次中的任务都已移除时，移除批次
+        for batch_id, batch in list(batch_status.items()):
+            if not any(task["task_id"] in processing_status for task in batch["tasks"]):
+                del batch_status[batch_id]
+                logger.info(f"已从状态中移除批次 {batch_id}")
+        
         if cleanup_count > 0:
             logger.info(f"本次清理完成，共清理 {cleanup_count} 个任务文件夹")
             
     except Exception as e:
         logger.error(f"文件清理过程中发生错误: {e}")
 
+def cleanup_abandoned_preparses():
+    """清理超过 PREPARSE_TTL 仍未被认领的预解析：取消尚未开始的解析并删除上传文件"""
+    for preparse_id, job in list(preparse_jobs.items()):
+        if not job.is_expired(PREPARSE_TTL) or not job.abandon():
+            continue
+        shutil.rmtree(job.upload_dir, ignore_errors=True)
+        del preparse_jobs[preparse_id]
+        logger.info(f"已清理未认领的预解析 {preparse_id}: {job.upload_dir}")
+
+def worker_idle() -> bool:
+    """没有排队或处理中的任务（包括预解析），也没有正在重新生成的任务"""
+    scheduler_stats = task_scheduler.stats()
+    if scheduler_stats["running"] or scheduler_stats["queued"]:
+        return False
+    return not any(status.get("status") == "processing" or status.get("regenerating")
+                   for status in list(processing_status.values()))
+
+async def drain_and_recycle(reason: str):
+    """
+    排空工作进程：上传接口已开始拒绝新任务，取消尚未开始的预解析，等待已接受的任务处理完成后
+    向本进程发送 SIGTERM，uvicorn 正常停止（执行 shutdown 事件保存任务状态）后由监督进程重新启动
+    """
+    logger.warning(f"工作进程开始排空，完成后回收: {reason}")
+    for job in list(preparse_jobs.values()):
+        job.abandon()
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + WORKER_DRAIN_TIMEOUT
+    while not worker_idle() and loop.time() < deadline:
+        await asyncio.sleep(WORKER_DRAIN_CHECK_INTERVAL)
+    if not worker_idle():
+        logger.error(f"排空超时（{WORKER_DRAIN_TIMEOUT}秒），未完成的任务将标记为失败")
+
+    logger.warning(f"工作进程排空完成，退出后由监督进程重新启动（常驻内存: {current_rss_bytes()} 字节）")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+def restore_status_snapshot():
+    """恢复上一个工作进程退出时保存的任务状态，回收或重启后仍可查询状态、下载和重新生成"""
+    snapshot = load_status_snapshot(STATUS_SNAPSHOT_FILE)
+    if not snapshot:
+        return
+    processing_status.update(snapshot.get("processing_status", {}))
+    submission_index.update(snapshot.get("submission_index", {}))
+    batch_status.update(snapshot.get("batch_status", {}))
+    task_template_info.update(snapshot.get("task_template_info", {}))
+    logger.info(f"已恢复 {len(processing_status)} 个任务的状态: {STATUS_SNAPSHOT_FILE}")
+
 @app.on_event("startup")
 async def startup_event():
     """应用启动时的初始化"""
+    restore_status_snapshot()
+    if worker_recycler.configured and not worker_recycler.supervised:
+        logger.warning("已配置 WORKER_MAX_TASKS / WORKER_MAX_RSS_MB，但未通过 supervisor.py 启动，不会回收工作进程")
     logger.info("应用启动，开始定时清理任务")
+    logger.info(f"CPU 推理配置: {json.dumps(inference_profile.describe(), ensure_ascii=False)}")
+    
+    # 处理线程通过事件循环推送进度事件
+    task_event_broker.bind_loop(asyncio.get_running_loop())
     
     # 启动定时清理任务
     asyncio.create_task(periodic_cleanup())
+    asyncio.create_task(periodic_preparse_cleanup())
+    
+    # 启动事件循环延迟采样
+    asyncio.create_task(event_loop_monitor.run())
+    
+    # 启动监控指标导出
+    if metrics.METRICS_ENABLED:
+        if metrics.start_metrics_server(METRICS_PORT):
+            logger.info(f"监控指标已在端口 {METRICS_PORT} 导出")
+        asyncio.create_task(periodic_disk_usage_update())
+    elif ENABLE_METRICS:
+        logger.warning("已开启 ENABLE_METRICS，但未安装 prometheus_client，监控指标不会导出")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    应用停止时保存任务状态，供重新启动的工作进程恢复；
+    仍未完成的任务无法在新进程中继续，标记为失败（允许重新提交），预解析无法再被认领，删除其文件
+    """
+    for status in processing_status.values():
+        if status.get("status") == "processing":
+            status.update(status="error", stage="error", message="服务重启，任务中断，请重新提交",
+                          progress=TASK_STAGES["error"][1])
+        status["regenerating"] = False
+    try:
+        save_status_snapshot(STATUS_SNAPSHOT_FILE, {
+            "processing_status": processing_status,
+            "submission_index": submission_index,
+            "batch_status": batch_status,
+            "task_template_info": task_template_info,
+        })
+        logger.info(f"已保存 {len(processing_status)} 个任务的状态: {STATUS_SNAPSHOT_FILE}")
+    except Exception as e:
+        logger.error(f"保存任务状态失败: {e}")
+
+    for job in preparse_jobs.values():
+        if job.abandon():
+            shutil.rmtree(job.upload_dir, ignore_errors=True)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 监控指标"""
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="监控指标未开启")
+    return Response(content=metrics.export_metrics(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+async def periodic_disk_usage_update():
+    """定期刷新数据目录的磁盘占用指标（遍历目录较慢，放到线程中执行）"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, metrics.update_disk_usage, [UPLOAD_DIR, OUTPUT_DIR, CACHE_DIR])
+        except Exception as e:
+            logger.error(f"刷新磁盘占用指标出错: {e}")
+        await asyncio.sleep(METRICS_DISK_USAGE_INTERVAL)
 
 async def periodic_cleanup():
     """定期执行清理任务"""
@@ -324,6 +1499,15 @@ async def periodic_cleanup():
             logger.error(f"定时清理任务出错: {e}")
             await asyncio.sleep(CLEANUP_ERROR_RETRY_INTERVAL)
 
+async def periodic_preparse_cleanup():
+    """定期清理放弃的预解析（间隔短于任务清理，避免未提交的PDF长期占用磁盘）"""
+    while True:
+        try:
+            cleanup_abandoned_preparses()
+        except Exception as e:
+            logger.error(f"清理预解析出错: {e}")
+        await asyncio.sleep(PREPARSE_CLEANUP_INTERVAL)
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+工作进程监督脚本
+
+监督进程持有监听端口，以 uvicorn --fd 方式启动工作进程（main:app）。工作进程达到回收条件
+（WORKER_MAX_TASKS / WORKER_MAX_RSS_MB）时排空已接受的任务后退出，监督进程立即启动新的工作进程；
+重启期间新连接在监听队列中等待新的工作进程接受，不会被拒绝。工作进程异常退出时等待片刻后重新启动
+
+用法:
+    python supervisor.py --host 0.0.0.0 --port 8000
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from config import HOST, LOG_FORMAT, LOG_LEVEL, PORT, SUPERVISOR_RESTART_DELAY
+from utils.worker_recycler import SUPERVISED_ENV
+
+logging.basicConfig(level=getattr(logging, LOG_LEVEL), format=LOG_FORMAT)
+logger = logging.getLogger("supervisor")
+
+LISTEN_BACKLOG = 2048  # 工作进程重启期间排队等待的连接数上限
+
+
+def create_listen_socket(host: str, port: int) -> socket.socket:
+    """创建由监督进程持有、传递给各代工作进程的监听端口"""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(LISTEN_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动工作进程，并在其回收或异常退出后重新启动")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--app", default="main:app", help="uvicorn 应用路径")
+    args = parser.parse_args()
+
+    sock = create_listen_socket(args.host, args.port)
+    command = [sys.executable, "-m", "uvicorn", args.app, "--fd", str(sock.fileno()),
+               "--log-level", LOG_LEVEL.lower()]
+    env = dict(os.environ, **{SUPERVISED_ENV: "1"})
+
+    stopping = False
+    worker = None
+
+    def stop(signum, frame):
+        # 监督进程收到停止信号时，让工作进程正常停止（保存任务状态）后不再重新启动
+        nonlocal stopping
+        stopping = True
+        if worker is not None and worker.poll() is None:
+            worker.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info(f"监督进程已启动，监听 {args.host}:{args.port}")
+    generation = 0
+    while not stopping:
+        generation += 1
+        started = time.monotonic()
+        # 工作进程使用独立的进程组，终端的 Ctrl+C 只发给监督进程，由监督进程转发停止信号
+        worker = subprocess.Popen(command, env=env, pass_fds=(sock.fileno(),), cwd=Path(__file__).parent,
+                                  start_new_session=True)
+        logger.info(f"第 {generation} 代工作进程已启动 (pid {worker.pid})")
+        exit_code = worker.wait()
+        if stopping:
+            break
+        uptime = time.monotonic() - started
+        # uvicorn 正常停止后以 0 退出，或重新发送收到的 SIGTERM（退出码为 -SIGTERM）
+        if exit_code in (0, -signal.SIGTERM):
+            logger.info(f"工作进程已回收 (pid {worker.pid}，运行 {uptime:.0f} 秒)，启动新的工作进程")
+        else:
+            logger.error(f"工作进程异常退出 (pid {worker.pid}，退出码 {exit_code}，运行 {uptime:.0f} 秒)，"
+                         f"{SUPERVISOR_RESTART_DELAY} 秒后重新启动")
+            time.sleep(SUPERVISOR_RESTART_DELAY)
+
+    sock.close()
+    logger.info("监督进程已停止")
+
+
+if __name__ == "__main__":
+    main()
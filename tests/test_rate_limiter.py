@@ -0,0 +1,124 @@
+"""SharedRateLimiter 令牌桶测试：补充、修正、暂停以及未设置额度时的行为"""
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from utils.rate_limiter import SharedRateLimiter
+
+
+class FakeClock:
+    """替代 time.time / time.monotonic / time.sleep，sleep 直接推进时间"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.slept = []
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class SharedRateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.state_path = Path(self._tmp.name) / "rate_limit.json"
+        self.clock = FakeClock()
+        patcher = mock.patch.multiple("utils.rate_limiter.time", time=self.clock.time,
+                                      monotonic=self.clock.time, sleep=self.clock.sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self._tmp.cleanup)
+
+    def limiter(self, rps: float = 0, tpm: float = 0) -> SharedRateLimiter:
+        return SharedRateLimiter(self.state_path, rps, tpm)
+
+    def state(self, limiter: SharedRateLimiter):
+        return limiter._update(lambda state, now: dict(state))
+
+    def test_acquire_from_full_bucket_does_not_wait(self):
+        limiter = self.limiter(rps=2, tpm=600)
+        self.assertEqual(limiter.acquire(100), 0)
+        state = self.state(limiter)
+        self.assertEqual(state["requests"], 1)
+        self.assertEqual(state["tokens"], 500)
+
+    def test_request_bucket_refills_over_time(self):
+        limiter = self.limiter(rps=1)
+        limiter.acquire()
+        # 桶已空，需等待 1 秒补充一个请求
+        self.assertAlmostEqual(limiter.acquire(), 1.0)
+        self.clock.now += 0.5
+        self.assertAlmostEqual(self.state(limiter)["requests"], 0.5)
+        self.clock.now += 10
+        # 补充不超过桶容量
+        self.assertAlmostEqual(self.state(limiter)["requests"], 1.0)
+
+    def test_token_bucket_waits_for_refill(self):
+        limiter = self.limiter(tpm=60)
+        limiter.acquire(60)
+        # 每秒补充 1 个 token，30 个 token 需等待 30 秒
+        self.assertAlmostEqual(limiter.acquire(30), 30.0)
+
+    def test_oversized_request_passes_when_bucket_full(self):
+        limiter = self.limiter(tpm=60)
+        self.assertEqual(limiter.acquire(1000), 0)
+        self.assertEqual(self.state(limiter)["tokens"], 60 - 1000)
+
+    def test_settle_refunds_and_charges_difference(self):
+        limiter = self.limiter(tpm=600)
+        limiter.acquire(300)
+        limiter.settle(300, 100)
+        self.assertEqual(self.state(limiter)["tokens"], 500)
+        limiter.settle(100, 700)
+        self.assertEqual(self.state(limiter)["tokens"], -100)
+        # 退回不超过桶容量
+        limiter.settle(1000, 0)
+        self.assertEqual(self.state(limiter)["tokens"], 600)
+
+    def test_pause_blocks_acquire(self):
+        limiter = self.limiter(rps=10)
+        limiter.pause(5)
+        self.assertAlmostEqual(limiter.acquire(), 5.0)
+        # 暂停期间每次最多睡眠 MAX_SLEEP_SECONDS，到期后重新检查
+        self.assertTrue(all(seconds <= 1.0 for seconds in self.clock.slept))
+
+    def test_pause_keeps_longest_deadline(self):
+        limiter = self.limiter(rps=10)
+        limiter.pause(10)
+        limiter.pause(2)
+        self.assertAlmostEqual(limiter.acquire(), 10.0)
+
+    def test_disabled_limiter_does_not_limit(self):
+        limiter = self.limiter()
+        self.assertFalse(limiter.enabled)
+        for _ in range(100):
+            self.assertEqual(limiter.acquire(10 ** 6), 0)
+        self.assertIsNone(limiter.snapshot())
+        # 未设置额度时不扣减，也不写状态文件
+        self.assertFalse(self.state_path.exists())
+
+    def test_disabled_limiter_honours_pause(self):
+        limiter = self.limiter()
+        limiter.pause(5)
+        self.assertAlmostEqual(limiter.acquire(), 5.0)
+        self.assertEqual(limiter.acquire(), 0)
+
+    def test_pause_is_shared_between_instances(self):
+        self.limiter(rps=1).pause(3)
+        self.assertAlmostEqual(self.limiter().acquire(), 3.0)
+
+    def test_corrupt_state_file_is_treated_as_full_bucket(self):
+        self.state_path.write_text("not json", encoding="utf-8")
+        limiter = self.limiter(rps=1, tpm=60)
+        self.assertEqual(limiter.acquire(10), 0)
+        self.assertEqual(self.state(limiter)["tokens"], 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
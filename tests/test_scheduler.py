@@ -0,0 +1,131 @@
+"""FairTaskScheduler 测试：客户间公平轮流、权重、优先级和并发上限"""
+
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from utils.scheduler import FairTaskScheduler
+
+
+class FairTaskSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=8)
+        self.addCleanup(self.executor.shutdown, wait=True)
+        self.order: List[str] = []
+        self._order_lock = threading.Lock()
+
+    def scheduler(self, max_concurrent: int = 1, max_per_customer: int = 8, weights=None) -> FairTaskScheduler:
+        return FairTaskScheduler(self.executor, max_concurrent, max_per_customer, weights)
+
+    def job(self, name: str, gate: Optional[threading.Event] = None):
+        """记录开始执行顺序的任务；提供 gate 时等待其放行后才结束"""
+        def run():
+            with self._order_lock:
+                self.order.append(name)
+            if gate is not None:
+                gate.wait(timeout=5)
+            return name
+        return run
+
+    def run_jobs(self, scheduler: FairTaskScheduler, jobs, gate: threading.Event, before_release=None):
+        """
+        按顺序提交 (任务名, 客户号, 优先级)，第一个任务阻塞到所有任务都已排队，
+        before_release 在放行前调用（可检查调度器状态）
+        """
+        async def main():
+            tasks = []
+            for index, (name, customer_code, priority) in enumerate(jobs):
+                func = self.job(name, gate if index == 0 else None)
+                tasks.append(asyncio.create_task(scheduler.run(name, customer_code, priority, func)))
+                await asyncio.sleep(0)
+            await asyncio.sleep(0.05)
+            if before_release:
+                before_release()
+            gate.set()
+            return await asyncio.gather(*tasks)
+        return asyncio.run(main())
+
+    def test_returns_job_result(self):
+        results = self.run_jobs(self.scheduler(), [("a0", "A", 0), ("a1", "A", 0)], threading.Event())
+        self.assertEqual(results, ["a0", "a1"])
+
+    def test_customers_take_turns(self):
+        # A 先提交一批，B 之后提交的任务不必排在整批之后
+        jobs = [(f"a{i}", "A", 0) for i in range(6)] + [("b0", "B", 0), ("b1", "B", 0)]
+        self.run_jobs(self.scheduler(), jobs, threading.Event())
+        self.assertEqual(self.order, ["a0", "a1", "b0", "a2", "b1", "a3", "a4", "a5"])
+
+    def test_weight_gives_larger_share(self):
+        jobs = [("z0", "Z", 0)] + [(f"a{i}", "A", 0) for i in range(4)] + [(f"b{i}", "B", 0) for i in range(4)]
+        self.run_jobs(self.scheduler(weights={"A": 2}), jobs, threading.Event())
+        first_six = self.order[1:7]
+        self.assertEqual(sum(name.startswith("a") for name in first_six), 4)
+        self.assertEqual(sum(name.startswith("b") for name in first_six), 2)
+
+    def test_priority_runs_before_other_customers(self):
+        jobs = [("a0", "A", 0), ("a1", "A", 0), ("b0", "B", 0), ("c_rush", "C", 10), ("p0", "P", -10)]
+        self.run_jobs(self.scheduler(), jobs, threading.Event())
+        self.assertEqual(self.order[1], "c_rush")
+        # 低优先级（预解析）排在所有普通任务之后
+        self.assertEqual(self.order[-1], "p0")
+
+    def test_priority_within_customer(self):
+        jobs = [("a0", "A", 0), ("a1", "A", 0), ("a_rush", "A", 10)]
+        self.run_jobs(self.scheduler(), jobs, threading.Event())
+        self.assertEqual(self.order, ["a0", "a_rush", "a1"])
+
+    def test_per_customer_cap(self):
+        scheduler = self.scheduler(max_concurrent=4, max_per_customer=2)
+        gate = threading.Event()
+        blocking = [(f"a{i}", "A", 0) for i in range(4)] + [("b0", "B", 0)]
+
+        async def main():
+            tasks = [asyncio.create_task(scheduler.run(name, code, priority, self.job(name, gate)))
+                     for name, code, priority in blocking]
+            await asyncio.sleep(0.05)
+            stats = scheduler.stats()
+            gate.set()
+            await asyncio.gather(*tasks)
+            return stats
+
+        stats = asyncio.run(main())
+        self.assertEqual(stats["customers"]["A"], {"queued": 2, "running": 2, "weight": 1.0})
+        # A 达到单客户上限时，B 的任务使用剩余的处理线程
+        self.assertEqual(stats["customers"]["B"]["running"], 1)
+        self.assertEqual(stats["running"], 3)
+
+    def test_global_cap(self):
+        scheduler = self.scheduler(max_concurrent=2)
+        captured = {}
+        jobs = [("a0", "A", 0), ("b0", "B", 0), ("c0", "C", 0), ("d0", "D", 0)]
+        # 只有第一个任务阻塞，第二个任务完成后第三个开始，因此检查时正在处理的任务数不超过 2
+        self.run_jobs(scheduler, jobs, threading.Event(), lambda: captured.update(scheduler.stats()))
+        self.assertLessEqual(captured["running"], 2)
+        self.assertEqual(sorted(self.order), ["a0", "b0", "c0", "d0"])
+        self.assertEqual(scheduler.stats()["running"], 0)
+
+    def test_job_exception_propagates_and_frees_slot(self):
+        scheduler = self.scheduler()
+
+        def fail():
+            raise RuntimeError("boom")
+
+        async def main():
+            with self.assertRaises(RuntimeError):
+                await scheduler.run("a0", "A", 0, fail)
+            return await scheduler.run("a1", "A", 0, self.job("a1"))
+
+        self.assertEqual(asyncio.run(main()), "a1")
+        self.assertEqual(scheduler.stats()["running"], 0)
+
+    def test_rejects_non_positive_weights(self):
+        for weight in (0, -1, float("nan")):
+            with self.assertRaises(ValueError):
+                self.scheduler(weights={"A": weight})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,292 @@
+"""
+产物存储模块
+上传的PDF、生成的任务单和抽取结果缓存统一通过产物存储读写，多个节点挂载同一共享目录或使用同一
+S3 兼容存储时，任意节点都可以提供任意任务的下载
+
+存储键为相对应用目录的路径（如 outputs/522_<任务ID>/xxx.xlsx），本地存储的根目录默认就是应用目录，
+此时存储键与原有文件路径一一对应，不产生额外复制
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import Iterator, List, Optional, Union
+
+from config import (
+    ARTIFACT_STORE, ARTIFACT_STORE_DIR, BASE_DIR, S3_BUCKET, S3_ENDPOINT_URL, S3_PREFIX, S3_REGION
+)
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+    BOTO3_AVAILABLE = True
+except ImportError:
+    BOTO3_AVAILABLE = False
+
+READ_CHUNK_SIZE = 1024 * 1024  # 流式读取分块大小（1MB）
+
+
+@dataclass
+class ArtifactInfo:
+    """存储对象的元信息"""
+    key: str
+    size: int
+    modified: float  # 最后修改时间（时间戳）
+
+
+def store_key(path: Union[str, Path]) -> str:
+    """本地路径 -> 存储键（相对应用目录的路径）"""
+    return Path(path).resolve().relative_to(BASE_DIR.resolve()).as_posix()
+
+
+def _check_key(key: str) -> str:
+    """存储键不能为绝对路径或包含 ..，避免访问存储根目录之外的文件"""
+    parts = PurePosixPath(key).parts
+    if not parts or key.startswith("/") or ".." in parts:
+        raise ValueError(f"非法的存储键: {key}")
+    return key
+
+
+class ArtifactStore:
+    """
+    产物存储接口
+
+    写入保证原子性：读取方要么读到完整的旧内容，要么读到完整的新内容；读取按块流式返回，不整体载入内存
+    """
+
+    def put_file(self, key: str, src_path: Union[str, Path]):
+        """上传本地文件"""
+        raise NotImplementedError
+
+    def put_bytes(self, key: str, data: bytes):
+        """写入一段数据"""
+        raise NotImplementedError
+
+    def get_bytes(self, key: str, max_age: Optional[float] = None) -> Optional[bytes]:
+        """读取全部内容，不存在或超过 max_age（秒）时返回 None，仅用于小对象（如缓存）"""
+        raise NotImplementedError
+
+    def iter_chunks(self, key: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        """流式读取，不存在时抛出 FileNotFoundError"""
+        raise NotImplementedError
+
+    def stat(self, key: str) -> Optional[ArtifactInfo]:
+        """对象元信息，不存在时返回 None"""
+        raise NotImplementedError
+
+    def list(self, prefix: str) -> List[ArtifactInfo]:
+        """列出前缀（目录）下的所有对象"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """删除对象，不存在时忽略"""
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str):
+        """删除前缀（目录）下的所有对象"""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """对象对应的本地文件路径（可直接用 FileResponse 返回），非本地存储返回 None"""
+        return None
+
+    def sub_store(self, prefix: str) -> "ArtifactStore":
+        """以 prefix 为根目录的子存储（如缓存使用 cache/ 前缀）"""
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+
+class LocalArtifactStore(ArtifactStore):
+    """
+    本地文件系统存储
+
+    根目录指向 NFS 等共享挂载时，即为多节点共享存储；写入采用 临时文件 + 原子替换
+    """
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / _check_key(key)
+
+    def _atomic_write(self, path: Path, write):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except Exception:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def put_file(self, key: str, src_path: Union[str, Path]):
+        path = self._path(key)
+        # 根目录为应用目录时，本地文件本身就是存储对象
+        if path.exists() and path.resolve() == Path(src_path).resolve():
+            return
+        with open(src_path, "rb") as src:
+            self._atomic_write(path, lambda f: shutil.copyfileobj(src, f, READ_CHUNK_SIZE))
+
+    def put_bytes(self, key: str, data: bytes):
+        self._atomic_write(self._path(key), lambda f: f.write(data))
+
+    def get_bytes(self, key: str, max_age: Optional[float] = None) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            if max_age and time.time() - path.stat().st_mtime > max_age:
+                return None
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def iter_chunks(self, key: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self._path(key), "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+
+    def stat(self, key: str) -> Optional[ArtifactInfo]:
+        try:
+            st = self._path(key).stat()
+        except OSError:
+            return None
+        return ArtifactInfo(key, st.st_size, st.st_mtime)
+
+    def list(self, prefix: str) -> List[ArtifactInfo]:
+        base = self._path(prefix)
+        if not base.is_dir():
+            return []
+        infos = []
+        for path in sorted(base.rglob("*")):
+            if path.is_file() and not path.name.endswith(".tmp"):
+                st = path.stat()
+                infos.append(ArtifactInfo(path.relative_to(self.root).as_posix(), st.st_size, st.st_mtime))
+        return infos
+
+    def delete(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+    def delete_prefix(self, prefix: str):
+        shutil.rmtree(self._path(prefix), ignore_errors=True)
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self._path(key)
+
+    def sub_store(self, prefix: str) -> "LocalArtifactStore":
+        return LocalArtifactStore(self._path(prefix))
+
+    def describe(self) -> str:
+        return f"local:{self.root}"
+
+
+class S3ArtifactStore(ArtifactStore):
+    """
+    S3 兼容对象存储（AWS S3、MinIO 等），访问凭证使用 boto3 的默认来源（AWS_ACCESS_KEY_ID 等环境变量）
+
+    S3 的对象在上传完成后才可见，写入天然是原子的；endpoint_url 指向本地 MinIO 即可在本机验证
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, client=None):
+        if client is None:
+            if not BOTO3_AVAILABLE:
+                raise ImportError("使用 S3 产物存储需要安装 boto3")
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def _key(self, key: str) -> str:
+        _check_key(key)
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _relative(self, object_key: str) -> str:
+        return object_key[len(self.prefix) + 1:] if self.prefix else object_key
+
+    @staticmethod
+    def _is_not_found(e: "ClientError") -> bool:
+        return e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def put_file(self, key: str, src_path: Union[str, Path]):
+        # upload_file 对大文件自动分块上传
+        self.client.upload_file(str(src_path), self.bucket, self._key(key))
+
+    def put_bytes(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def get_bytes(self, key: str, max_age: Optional[float] = None) -> Optional[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._is_not_found(e):
+                return None
+            raise
+        if max_age and time.time() - response["LastModified"].timestamp() > max_age:
+            response["Body"].close()
+            return None
+        return response["Body"].read()
+
+    def iter_chunks(self, key: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._is_not_found(e):
+                raise FileNotFoundError(key) from e
+            raise
+        body = response["Body"]
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def stat(self, key: str) -> Optional[ArtifactInfo]:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._is_not_found(e):
+                return None
+            raise
+        return ArtifactInfo(key, response["ContentLength"], response["LastModified"].timestamp())
+
+    def list(self, prefix: str) -> List[ArtifactInfo]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        infos = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix).rstrip("/") + "/"):
+            for obj in page.get("Contents", []):
+                infos.append(ArtifactInfo(self._relative(obj["Key"]), obj["Size"], obj["LastModified"].timestamp()))
+        return infos
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_prefix(self, prefix: str):
+        keys = [{"Key": self._key(info.key)} for info in self.list(prefix)]
+        # 单次最多删除 1000 个对象
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": keys[start:start + 1000]})
+
+    def sub_store(self, prefix: str) -> "S3ArtifactStore":
+        return S3ArtifactStore(self.bucket, self._key(prefix), client=self.client)
+
+    def describe(self) -> str:
+        return f"s3://{self.bucket}/{self.prefix}"
+
+
+def create_artifact_store(backend: str = ARTIFACT_STORE, root: Union[str, Path] = ARTIFACT_STORE_DIR,
+                          bucket: str = S3_BUCKET, prefix: str = S3_PREFIX,
+                          endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+                          region: Optional[str] = S3_REGION) -> ArtifactStore:
+    """按配置创建产物存储：local（本地或共享目录）/ s3（S3 兼容对象存储）"""
+    if backend == "local":
+        return LocalArtifactStore(root)
+    if backend == "s3":
+        if not bucket:
+            raise ValueError("使用 S3 产物存储需要配置 S3_BUCKET")
+        return S3ArtifactStore(bucket, prefix, endpoint_url, region)
+    raise ValueError(f"未知的产物存储类型 {backend}，可选: local, s3")
@@ -0,0 +1,167 @@
+"""
+客户货号索引模块
+将模板中的客户货号规范化后建立哈希索引，PO 中抽取的货号按 精确 -> 规范化 -> 模糊（可选） 的顺序匹配到模板货号，
+大 PO 对大模板也只需线性时间，并能给出未匹配货号的明确报告
+"""
+
+import difflib
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from rapidfuzz import fuzz, process as fuzz_process
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_code(value: Any) -> str:
+    """
+    规范化客户货号：全角转半角（NFKC）、去除所有空白、转大写
+
+    如 " ２３pc31 " 与 "23PC31" 规范化后相同
+    """
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFKC", str(value))
+    return _WHITESPACE.sub("", text).upper()
+
+
+@dataclass
+class CodeMatch:
+    """一个 PO 货号的匹配结果"""
+    po_code: str
+    code: str  # 模板中的原始货号
+    group: str  # 所属模板类型（GM / GX）
+    method: str  # exact / normalized / fuzzy
+    score: float = 100.0
+
+
+@dataclass
+class CodeResolution:
+    """一个 PO 中所有货号的匹配结果"""
+    pdf_info: Dict[str, Any]  # 货号已替换为模板货号的 PO 信息
+    groups: Dict[str, List[str]] = field(default_factory=dict)  # 模板类型 -> 属于该模板的模板货号
+    unmatched: List[str] = field(default_factory=list)
+    corrected: List[CodeMatch] = field(default_factory=list)  # 经规范化或模糊匹配修正的货号
+    ambiguous: List[str] = field(default_factory=list)  # 同时存在于多个模板的货号
+
+    def report(self) -> Dict[str, Any]:
+        """供任务状态展示的匹配报告"""
+        return {
+            "matched": sum(len(codes) for codes in self.groups.values()),
+            "unmatched": self.unmatched,
+            "ambiguous": self.ambiguous,
+            "corrected": [
+                {"po_code": m.po_code, "template_code": m.code, "method": m.method, "score": round(m.score, 1)}
+                for m in self.corrected
+            ],
+        }
+
+
+class CodeIndex:
+    """
+    模板货号索引
+
+    Args:
+        fuzzy_threshold: 模糊匹配的最低相似度（0~100），为 0 时不做模糊匹配。
+            模糊匹配可能把相近的货号匹配错，默认关闭，开启时匹配结果会记录在报告中
+    """
+
+    def __init__(self, fuzzy_threshold: float = 0):
+        self.fuzzy_threshold = fuzzy_threshold
+        self._exact: Dict[str, Tuple[str, str]] = {}
+        self._normalized: Dict[str, Tuple[str, str]] = {}
+        self._ambiguous_keys = set()
+
+    def add(self, codes: Iterable[Any], group: str):
+        """登记一组模板货号"""
+        for code in codes:
+            code = str(code).strip()
+            key = normalize_code(code)
+            if not key:
+                continue
+            existing = self._normalized.get(key)
+            if existing is not None and existing[1] != group:
+                self._ambiguous_keys.add(key)
+                continue
+            self._exact.setdefault(code, (code, group))
+            self._normalized.setdefault(key, (code, group))
+
+    @classmethod
+    def from_template_info(cls, template_2_info: Dict[str, Dict[str, Any]], fuzzy_threshold: float = 0) -> "CodeIndex":
+        """根据 {'GX': {'customer_codes': [...]}, 'GM': {...}} 建立索引（相同模板只建立一次）"""
+        template_key = tuple(
+            (template_type, tuple(info["customer_codes"])) for template_type, info in template_2_info.items()
+        )
+        return _build_template_index(template_key, fuzzy_threshold)
+
+    def is_ambiguous(self, code: Any) -> bool:
+        return normalize_code(code) in self._ambiguous_keys
+
+    def resolve(self, po_code: Any) -> Optional[CodeMatch]:
+        """匹配单个 PO 货号，未匹配时返回 None"""
+        po_code = str(po_code).strip()
+        if po_code in self._exact:
+            code, group = self._exact[po_code]
+            return CodeMatch(po_code, code, group, "exact")
+
+        key = normalize_code(po_code)
+        if key in self._normalized:
+            code, group = self._normalized[key]
+            return CodeMatch(po_code, code, group, "normalized")
+
+        if self.fuzzy_threshold > 0 and key:
+            best = self._fuzzy_lookup(key)
+            if best is not None:
+                best_key, score = best
+                code, group = self._normalized[best_key]
+                return CodeMatch(po_code, code, group, "fuzzy", score)
+        return None
+
+    def _fuzzy_lookup(self, key: str) -> Optional[Tuple[str, float]]:
+        """在规范化货号中查找最相近的一个"""
+        if RAPIDFUZZ_AVAILABLE:
+            result = fuzz_process.extractOne(key, self._normalized.keys(), scorer=fuzz.ratio,
+                                             score_cutoff=self.fuzzy_threshold)
+            return (result[0], result[1]) if result else None
+        matches = difflib.get_close_matches(key, self._normalized.keys(), n=1, cutoff=self.fuzzy_threshold / 100)
+        if not matches:
+            return None
+        return matches[0], difflib.SequenceMatcher(None, key, matches[0]).ratio() * 100
+
+    def resolve_pdf_info(self, raw_pdf_info: Dict[str, Any]) -> CodeResolution:
+        """
+        匹配 PO 中所有货号
+
+        匹配成功的货号替换为模板中的原始货号，后续按模板货号填写；未匹配的保持原样并记录在 unmatched 中
+        """
+        resolution = CodeResolution(pdf_info={"po_no": raw_pdf_info.get("po_no", ""), "product_info": []})
+        for item in raw_pdf_info["product_info"]:
+            po_code = str(item["cust_item_code"]).strip()
+            match = self.resolve(po_code)
+            new_item = dict(item)
+            if match is None:
+                resolution.unmatched.append(po_code)
+            elif self.is_ambiguous(match.code):
+                resolution.ambiguous.append(po_code)
+            else:
+                new_item["cust_item_code"] = match.code
+                resolution.groups.setdefault(match.group, []).append(match.code)
+                if match.method != "exact":
+                    resolution.corrected.append(match)
+            resolution.pdf_info["product_info"].append(new_item)
+        return resolution
+
+
+@lru_cache(maxsize=32)
+def _build_template_index(template_key: Tuple, fuzzy_threshold: float) -> CodeIndex:
+    index = CodeIndex(fuzzy_threshold)
+    for template_type, codes in template_key:
+        index.add(codes, template_type)
+    return index
@@ -1,12 +1,19 @@
 import json
 import asyncio
+import logging
 from openpyxl import load_workbook
 from pathlib import Path
 from typing import Dict, Any
 
 from openpyxl import load_workbook
 from openpyxl.styles import PatternFill
-from torch.autograd.graph import saved_tensors_hooks
+
+from config import CODE_FUZZY_MATCH_THRESHOLD, COMPACT_OUTPUT_CUSTOMERS, COMPACT_OUTPUT_MODE
+from utils.code_index import CodeIndex, CodeResolution, normalize_code
+from utils.metrics import track_stage
+from utils.workbook_compactor import COMPACT_MODES, compact_workbook
+
+logger = logging.getLogger(__name__)
 
 
 class ExcelProcessor:
@@ -22,8 +29,28 @@ class ExcelProcessor:
         }
     """
     
-    def __init__(self):
-        pass
+    def __init__(self, fuzzy_threshold: float = CODE_FUZZY_MATCH_THRESHOLD, compact_mode: str = COMPACT_OUTPUT_MODE,
+                 customer_compact_modes: Dict[str, str] = None):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.compact_mode = compact_mode
+        self.customer_compact_modes = COMPACT_OUTPUT_CUSTOMERS if customer_compact_modes is None else customer_compact_modes
+        for mode in [compact_mode, *self.customer_compact_modes.values()]:
+            if mode not in COMPACT_MODES:
+                raise ValueError(f"未知的精简模式 {mode}，可选: {', '.join(COMPACT_MODES)}")
+
+    def compact_mode_for(self, customer_code) -> str:
+        """客户使用的精简模式，未单独配置的客户使用默认模式"""
+        return self.customer_compact_modes.get(str(customer_code), self.compact_mode)
+
+    def resolve_codes(self, raw_pdf_info, template_2_info) -> CodeResolution:
+        """
+        将 PO 中的客户货号匹配到模板货号（哈希索引，相同模板只建立一次索引）
+
+        Returns:
+            CodeResolution：货号已替换为模板货号的 PO 信息、各模板包含的货号、未匹配/多模板重复/经修正的货号
+        """
+        index = CodeIndex.from_template_info(template_2_info, self.fuzzy_threshold)
+        return index.resolve_pdf_info(raw_pdf_info)
 
     def extract_tl_items_from_tl_sheet(self, wb):
         """
@@ -79,14 +106,18 @@ class ExcelProcessor:
         # 构造一个仅包含：本次采购商品货号 + 数量 + 生产任务单号 的信息，便于直接填入 excel 模板
         pdf_info = {}
         if tl_pdf_items:  # 存在 tl sheet，则 suffix 是 TL/BC
+            # 按规范化货号建立集合，逐个判断归属时为 O(1) 查找
+            tl_keys = {normalize_code(code) for code in tl_pdf_items}
+            bc_keys = {normalize_code(code) for code in bc_pdf_items or []}
             counter = 1
             for index, item in enumerate(raw_pdf_info['product_info']):
-                if item['cust_item_code'] in tl_pdf_items:
+                item_key = normalize_code(item['cust_item_code'])
+                if item_key in tl_keys:
                     pdf_info[item['cust_item_code']] = {
                         'quantity': item['quantity'],
                         'task_order_no': f"{prefix}({counter})TL"
                     }
-                elif item['cust_item_code'] in bc_pdf_items:
+                elif item_key in bc_keys:
                     pdf_info[item['cust_item_code']] = {
                         'quantity': item['quantity'],
                         'task_order_no': f"{prefix}({counter})BC"
@@ -111,13 +142,62 @@ class ExcelProcessor:
 
         return pdf_info, task_order_range
 
-    def process_GM_template(self, wb, raw_pdf_info, order_date, delivery_date, task_order_no, customer_code, output_dir, customer_codes, task_id, tl_pdf_items=None):
+    def process_GM_template(self, wb, raw_pdf_info, order_date, delivery_date, task_order_no, customer_code, output_dir, customer_codes, task_id, tl_pdf_items=None, template_type='GM'):
+        # template_type 仅用于监控指标的标签
+        with track_stage("workbook_fill", customer_code, template_type):
+            task_order_range, hidden_rows = self._fill_GM_template(wb, raw_pdf_info, order_date, delivery_date, task_order_no, customer_codes, tl_pdf_items)
+
+        # 精简输出：删除隐藏的产品工作表（及隐藏的行），减小文件体积和保存耗时
+        compact_mode = self.compact_mode_for(customer_code)
+        if compact_mode != "off":
+            with track_stage("workbook_compact", customer_code, template_type):
+                report = compact_workbook(wb, hidden_rows if compact_mode == "rows" else None)
+            logger.info(f"精简任务单 {customer_code}/{template_type}（{compact_mode}）：{report.describe()}")
+
+        # 生成保存路径（按客户号+时间戳分文件夹）
+        if output_dir is None:
+            output_dir = Path('.')
+        else:
+            output_dir = Path(output_dir)
+        
+        # 使用任务ID创建文件夹
+        customer_output_dir = output_dir / f"{customer_code}_{task_id}"
+        customer_output_dir.mkdir(parents=True, exist_ok=True)
+
+        # 生成文件名：任务单号_PO号_客户号
+        po_no = raw_pdf_info.get('po_no', '')
+        if po_no:
+            po_prefix = f"PO{po_no}"
+        else:
+            po_prefix = "PO"
+
+        if customer_code:
+            filename = f"{task_order_range}_{po_prefix}_{customer_code}.xlsx"
+        else:
+            # 如果客户号提取失败，使用原来的命名方式
+            filename = f"{task_order_range}_{po_prefix}.xlsx"
+
+        output_path = customer_output_dir / filename
+
+        with track_stage("workbook_save", customer_code, template_type):
+            wb.save(output_path)
+
+        return str(output_path)
+
+    def _fill_GM_template(self, wb, raw_pdf_info, order_date, delivery_date, task_order_no, customer_codes, tl_pdf_items=None):
+        """
+        填写主表（及 TL 表），隐藏未涉及的行和工作表
+
+        Returns:
+            (范围格式的任务单号, 各工作表中被隐藏的行号 {工作表: [行号]})
+        """
         # 将sheet的修改部分，高亮出来，创建高亮样式（黄色背景）
         formula_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
 
         # 获取主表
         main_sheet = wb['主表']
         modify_sheets = ['主表']
+        hidden_rows = {'主表': []}
 
         # 填写基本信息填写
         main_sheet['E1'] = order_date  # 制单日期
@@ -129,6 +209,8 @@ class ExcelProcessor:
         # 广美中一定不存在 TL 的情况。此时，tl_pdf_items 为 None
         # 广线中可能存在TL。如果有，TL 在 BC 前
         pdf_info, task_order_range = self.generate_task_order_no(raw_pdf_info, task_order_no, bc_pdf_items=customer_codes, tl_pdf_items=tl_pdf_items)
+        # 主表中的货号与 PO 货号按规范化后的货号匹配
+        pdf_info_by_key = {normalize_code(code): info for code, info in pdf_info.items()}
 
         # 请注意：遍历 row，到 总计的 row break
         exit_flag = False
@@ -140,12 +222,14 @@ class ExcelProcessor:
                     if product_name == "合计":
                         break
                     row_idx = row[0].row  # 获取当前行号
+                    # 先按整个单元格匹配，再按第一个词（货号后跟品名的情况）匹配
+                    product_info = pdf_info_by_key.get(normalize_code(row[0].value)) or pdf_info_by_key.get(normalize_code(product_name))
                     # 匹配到产品则进行修改，否则，则将改行进行隐藏
-                    if product_name in pdf_info:
+                    if product_info:
                         # 修改数量
-                        main_sheet[f"D{row_idx}"] = int(pdf_info[product_name]['quantity'])
+                        main_sheet[f"D{row_idx}"] = int(product_info['quantity'])
                         # 修改 任务单号
-                        main_sheet[f"G{row_idx}"] = pdf_info[product_name]['task_order_no']
+                        main_sheet[f"G{row_idx}"] = product_info['task_order_no']
                         main_sheet.row_dimensions[row_idx].hidden = False  # 该行一定不隐藏
                         modify_sheets.append(str(row[0].value))
                     else:
@@ -157,6 +241,7 @@ class ExcelProcessor:
                         # main_sheet[f"G{row_idx}"] = ''
                         # 改行 一定 隐藏
                         main_sheet.row_dimensions[row_idx].hidden = True
+                        hidden_rows['主表'].append(row_idx)
 
                 if row[0].value and "客户货号" in str(row[0].value):
                     exit_flag = True
@@ -180,8 +265,12 @@ class ExcelProcessor:
         # 如果存在 TL sheet，还需要对 TL sheet 进行修改
         if tl_pdf_items:
             # 本次从 PO 单中抽取的、属于 TL sheet 的单号
-            tl_customer_codes_from_po = [i['cust_item_code'] for i in raw_pdf_info['product_info'] if i['cust_item_code'] in tl_pdf_items]
+            tl_keys = {normalize_code(code) for code in tl_pdf_items}
+            tl_customer_codes_from_po = {
+                key for key in (normalize_code(i['cust_item_code']) for i in raw_pdf_info['product_info']) if key in tl_keys
+            }
             tl_sheet = wb["TL"]
+            hidden_rows['TL'] = []
 
             found_data_start = False
 
@@ -197,44 +286,18 @@ class ExcelProcessor:
                         if "封箱/打包方式" in cell_value:  # 结束信号
                             break
                         else:  # 数据行
-                            if cell_value in tl_customer_codes_from_po:
+                            if normalize_code(cell_value) in tl_customer_codes_from_po:
                                 tl_sheet.row_dimensions[row_idx].hidden = False  # 该行一定不隐藏
                             else:
                                 tl_sheet.row_dimensions[row_idx].hidden = True  # 隐藏
+                                hidden_rows['TL'].append(row_idx)
                 elif found_data_start:
                     break
 
             # 确保 sheet 'TL' 可见
             tl_sheet.sheet_state = "visible"
 
-        # 生成保存路径（按客户号+时间戳分文件夹）
-        if output_dir is None:
-            output_dir = Path('.')
-        else:
-            output_dir = Path(output_dir)
-        
-        # 使用任务ID创建文件夹
-        customer_output_dir = output_dir / f"{customer_code}_{task_id}"
-        customer_output_dir.mkdir(parents=True, exist_ok=True)
-
-        # 生成文件名：任务单号_PO号_客户号
-        po_no = raw_pdf_info.get('po_no', '')
-        if po_no:
-            po_prefix = f"PO{po_no}"
-        else:
-            po_prefix = "PO"
-
-        if customer_code:
-            filename = f"{task_order_range}_{po_prefix}_{customer_code}.xlsx"
-        else:
-            # 如果客户号提取失败，使用原来的命名方式
-            filename = f"{task_order_range}_{po_prefix}.xlsx"
-
-        output_path = customer_output_dir / filename
-
-        wb.save(output_path)
-
-        return str(output_path)
+        return task_order_range, hidden_rows
 
     def process_GX_template(self, raw_pdf_info, template_2_info, task_order_no, order_date, delivery_date, output_dir, pdf_name, customer_code, task_id):
         """
@@ -256,13 +319,14 @@ class ExcelProcessor:
         try:
             # 1. 加载Excel模板，注意使用 data_only=False 以保留公式
             excel_path = template_2_info['GX']['template_path']
-            wb = load_workbook(filename=excel_path, data_only=False)
+            with track_stage("template_load", customer_code, 'GX'):
+                wb = load_workbook(filename=excel_path, data_only=False)
 
             # 2. 检查是否存在TL工作表
             has_tl_sheet = 'TL' in wb.sheetnames
 
             if not has_tl_sheet:
-                output_path = self.process_GM_template(wb, raw_pdf_info, order_date, delivery_date, task_order_no, customer_code, output_dir, template_2_info['GX']['customer_codes'], task_id)
+                output_path = self.process_GM_template(wb, raw_pdf_info, order_date, delivery_date, task_order_no, customer_code, output_dir, template_2_info['GX']['customer_codes'], task_id, template_type='GX')
 
             else:
                 # 区分 TL 和 BC
@@ -272,9 +336,11 @@ class ExcelProcessor:
                 if not all_customer_codes_from_gx:
                     raise ValueError("未获得广线 TL sheet 中的客户货号，请检查！")
 
-                bc_items = [c for c in all_customer_codes_from_gx if c not in tl_items] if tl_items else all_customer_codes_from_gx
+                # 与货号索引相同，按规范化货号判断是否属于 TL，集合查找为 O(1)
+                tl_keys = {normalize_code(code) for code in tl_items or []}
+                bc_items = [c for c in all_customer_codes_from_gx if normalize_code(c) not in tl_keys] if tl_keys else all_customer_codes_from_gx
 
-                output_path = self.process_GM_template(wb, raw_pdf_info, order_date, delivery_date, task_order_no, customer_code, output_dir, bc_items, task_id, tl_pdf_items=tl_items)
+                output_path = self.process_GM_template(wb, raw_pdf_info, order_date, delivery_date, task_order_no, customer_code, output_dir, bc_items, task_id, tl_pdf_items=tl_items, template_type='GX')
 
             return output_path
             
@@ -282,7 +348,7 @@ class ExcelProcessor:
             raise Exception(f"处理广线模板失败: {e}")
 
     def process(self, raw_pdf_info, template_2_info, task_order_no, order_date, delivery_date, output_dir,
-                pdf_name, customer_code, task_id):
+                pdf_name, customer_code, task_id, artifact_callback=None, code_resolution=None):
         """
         将抽取后的信息填写入 Excel模板（支持单模板和双模板）
 
@@ -298,6 +364,8 @@ class ExcelProcessor:
             output_dir: 输出目录，默认 output 文件夹
             pdf_name: PDF文件名
             customer_code: 客户号，由前端输入
+            artifact_callback: 每个工作簿保存后调用 artifact_callback(模板类型, 文件路径)，便于先完成的文件提前下载
+            code_resolution: 已计算的货号匹配结果（resolve_codes 的返回值），为 None 时在此计算
 
         Returns:
             处理结果字典：
@@ -305,12 +373,19 @@ class ExcelProcessor:
             单模板 {'GX': 'path1'}
         """
         
+        # 0. PO 货号匹配到模板货号，之后统一使用模板中的写法
+        if code_resolution is None:
+            code_resolution = self.resolve_codes(raw_pdf_info, template_2_info)
+        raw_pdf_info = code_resolution.pdf_info
+
         # 1. 区分双模板还是单模板
         template_number = len(template_2_info)
 
         # 单模板，只有广线。但要考虑是否有TL的情况；如果没TL，就是上一版本的处理，有TL，还需要处理 TL sheet
         if template_number == 1:
             gx_output_path = self.process_GX_template(raw_pdf_info, template_2_info, task_order_no, order_date, delivery_date, output_dir, pdf_name, customer_code, task_id)
+            if artifact_callback:
+                artifact_callback('GX', gx_output_path)
 
             saved_path = {
                 'GX': gx_output_path
@@ -323,19 +398,16 @@ class ExcelProcessor:
             2. 为了复用代码，将 raw_pdf_info 中 product_info 中仅保留对应的产品信息（如数量）；将最新的 new_pdf_info 传入
             3. 广美的直接用上一版处理代码；广线的直接调 template_number == 1 的代码
             """
-            # 本次从 PO 中抽取的客户单号
-            all_customer_codes_from_po = [p['cust_item_code'] for p in raw_pdf_info['product_info']]
-            # 从 广线 模板中得到的所有客户单号
-            all_customer_codes_from_gx_template = template_2_info['GX']['customer_codes']
-            # 从 广美 模板中得到的所有客户单号
-            all_customer_codes_from_gm_template = template_2_info['GM']['customer_codes']
-            # 本次从 PO 中抽取的客户单号中有哪些属于 广美的产品
-            gm_customer_codes_from_po = [c for c in all_customer_codes_from_po if c in all_customer_codes_from_gm_template]
-            # 本次从 PO 中抽取的客户单号中有哪些属于 广线的产品
-            gx_customer_codes_from_po = [c for c in all_customer_codes_from_po if c in all_customer_codes_from_gx_template]
-
-            if len(gm_customer_codes_from_po) + len(gx_customer_codes_from_po) != len(raw_pdf_info['product_info']):
-                raise ValueError("再划分PO单中的商品属于 广线 还是 广美 时出错！")
+            # 货号索引已将 PO 中的每个货号归到 广美 / 广线
+            if code_resolution.unmatched or code_resolution.ambiguous:
+                details = []
+                if code_resolution.unmatched:
+                    details.append(f"广线、广美模板中均未找到: {', '.join(code_resolution.unmatched)}")
+                if code_resolution.ambiguous:
+                    details.append(f"同时存在于广线和广美模板: {', '.join(code_resolution.ambiguous)}")
+                raise ValueError(f"再划分PO单中的商品属于 广线 还是 广美 时出错！{'；'.join(details)}")
+            gm_customer_codes_from_po = set(code_resolution.groups.get('GM', []))
+            gx_customer_codes_from_po = set(code_resolution.groups.get('GX', []))
 
             # 仅保留 raw_pdf_info 中属于 广美的 客户单号，构造广美的 new_pdf_info，再传入 process_GM_template 方法
             new_pdf_info_from_gm = {
@@ -346,8 +418,11 @@ class ExcelProcessor:
                 ]
             }
             gm_template_path = template_2_info['GM']['template_path']
-            gm_wb = load_workbook(filename=gm_template_path, data_only=False)
+            with track_stage("template_load", customer_code, 'GM'):
+                gm_wb = load_workbook(filename=gm_template_path, data_only=False)
             gm_output_path = self.process_GM_template(gm_wb, new_pdf_info_from_gm, order_date, delivery_date, task_order_no, customer_code, output_dir, template_2_info['GM']['customer_codes'], task_id)
+            if artifact_callback:
+                artifact_callback('GM', gm_output_path)
 
             # 仅保留 raw_pdf_info 中属于 广线的 客户单号，构造广线的 new_pdf_info，在传入 process_GX_template 方法
             new_pdf_info_from_gx = {
@@ -359,6 +434,8 @@ class ExcelProcessor:
             }
             gx_output_path = self.process_GX_template(new_pdf_info_from_gx, template_2_info, task_order_no, order_date, delivery_date,
                                                output_dir, pdf_name, customer_code, task_id)
+            if artifact_callback:
+                artifact_callback('GX', gx_output_path)
 
             saved_path = {
                 'GX': gx_output_path,
@@ -0,0 +1,66 @@
+"""
+PDF抽取结果缓存模块
+以内容哈希为键，将 marker 解析结果和 AI 抽取结果缓存到产物存储（本地目录或共享存储），
+Web 服务与命令行批量处理共用同一缓存
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from utils.artifact_store import ArtifactStore, LocalArtifactStore
+
+
+class ExtractionCache:
+    """
+    基于产物存储的抽取结果缓存
+
+    缓存按命名空间分目录存放，例如：
+    - markdown：键为 PDF 内容哈希，值为 marker 解析出的文本（与模板无关）
+    - extraction：键为 PDF 内容哈希 + 参考货号 + 提示词的哈希，值为 AI 抽取结果
+
+    产物存储的写入是原子的，多个进程 / 节点同时读写同一缓存也不会读到半个文件
+    """
+
+    def __init__(self, cache_dir: Union[str, Path, ArtifactStore], ttl: Optional[int] = None):
+        """
+        Args:
+            cache_dir: 缓存目录，或缓存使用的产物存储（多节点共享缓存时）
+            ttl: 缓存有效期（秒），为 None 或 0 时永不过期
+        """
+        self.store = cache_dir if isinstance(cache_dir, ArtifactStore) else LocalArtifactStore(cache_dir)
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """将多个字符串组合为一个缓存键"""
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def file_sha256(file_path: Union[str, Path], chunk_size: int = 1024 * 1024) -> str:
+        """分块计算文件内容的 sha256"""
+        hasher = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    @staticmethod
+    def _key(namespace: str, key: str) -> str:
+        # 以键的前两位分子目录，避免单个目录文件过多
+        return f"{namespace}/{key[:2]}/{key}.json"
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """读取缓存，不存在、已过期或已损坏时返回 None"""
+        data = self.store.get_bytes(self._key(namespace, key), max_age=self.ttl)
+        if data is None:
+            return None
+        try:
+            return json.loads(data.decode("utf-8"))
+        except ValueError:
+            return None
+
+    def set(self, namespace: str, key: str, value: Any):
+        """写入缓存（原子写入）"""
+        self.store.put_bytes(self._key(namespace, key), json.dumps(value, ensure_ascii=False).encode("utf-8"))
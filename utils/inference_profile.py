@@ -0,0 +1,174 @@
+"""
+CPU 推理配置模块
+控制 marker（torch）推理的线程数、工作线程/进程绑定的 CPU 核心、页面渲染分辨率和模型批大小。
+多个任务同时解析 PDF 时，每个调用都会占满 torch 的默认线程池，核心被过度订阅反而整体变慢；
+按并发数分配线程和核心可以避免这种情况
+"""
+
+import itertools
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 预设：
+# - default：不做任何调整，使用 torch 和 marker 的默认值
+# - throughput：多个任务并发，每个工作线程分到 CPU核数/并发数 个线程并绑定独立核心，批大小和渲染分辨率较小
+# - latency：单个任务尽快完成，使用全部核心和较大的批大小
+PRESETS: Dict[str, Dict[str, Any]] = {
+    "default": {
+        "share_cores": False,
+        "pin_workers": False,
+        "marker_config": {},
+    },
+    "throughput": {
+        "share_cores": True,
+        "pin_workers": True,
+        "marker_config": {
+            "lowres_image_dpi": 72,
+            "highres_image_dpi": 150,
+            "layout_batch_size": 2,
+            "detection_batch_size": 2,
+            "recognition_batch_size": 16,
+            "table_rec_batch_size": 2,
+            "ocr_error_batch_size": 2,
+            "pdftext_workers": 1,
+        },
+    },
+    "latency": {
+        "share_cores": False,
+        "pin_workers": False,
+        "marker_config": {
+            "layout_batch_size": 8,
+            "detection_batch_size": 8,
+            "recognition_batch_size": 64,
+            "table_rec_batch_size": 8,
+            "ocr_error_batch_size": 8,
+        },
+    },
+}
+
+
+@dataclass
+class InferenceProfile:
+    """生效的推理配置"""
+    name: str
+    workers: int
+    cpu_count: int
+    torch_threads: Optional[int] = None  # None 表示使用 torch 默认值
+    interop_threads: Optional[int] = None
+    core_sets: List[List[int]] = field(default_factory=list)  # 每个工作线程/进程绑定的核心，空表示不绑定
+    marker_config: Dict[str, Any] = field(default_factory=dict)
+
+    def describe(self) -> Dict[str, Any]:
+        """用于启动日志和运行状态接口"""
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "cpu_count": self.cpu_count,
+            "torch_threads": self.torch_threads or "torch默认",
+            "interop_threads": self.interop_threads or "torch默认",
+            "core_sets": self.core_sets or "不绑定",
+            "marker_config": self.marker_config or "marker默认",
+        }
+
+
+def available_cpus() -> List[int]:
+    """当前进程可以使用的 CPU 核心（考虑容器 / taskset 限制）"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cores(cpus: List[int], workers: int) -> List[List[int]]:
+    """将核心平均分成 workers 份；核心数少于 workers 时多个工作线程共用核心"""
+    if workers <= len(cpus):
+        # 核心数不能整除时，前面几份各多分一个核心
+        size, remainder = divmod(len(cpus), workers)
+        bounds = [i * size + min(i, remainder) for i in range(workers + 1)]
+        return [cpus[bounds[i]:bounds[i + 1]] for i in range(workers)]
+    return [[cpus[i % len(cpus)]] for i in range(workers)]
+
+
+def build_inference_profile(name: str, workers: int, torch_threads: Optional[int] = None,
+                            pin_workers: Optional[bool] = None,
+                            marker_overrides: Optional[Dict[str, Any]] = None) -> InferenceProfile:
+    """
+    根据预设和覆盖项生成推理配置
+
+    Args:
+        name: 预设名称（default / throughput / latency）
+        workers: 同时执行 PDF 解析的工作线程或进程数
+        torch_threads: 覆盖每个工作线程的 torch 线程数
+        pin_workers: 覆盖是否将工作线程绑定到独立核心
+        marker_overrides: 覆盖 marker 配置（如 highres_image_dpi）
+    """
+    if name not in PRESETS:
+        raise ValueError(f"未知的推理配置 {name}，可选: {', '.join(PRESETS)}")
+    preset = PRESETS[name]
+    cpus = available_cpus()
+    workers = max(1, workers)
+
+    threads = torch_threads
+    if threads is None and preset["share_cores"]:
+        threads = max(1, len(cpus) // workers)
+    elif threads is None and name == "latency":
+        threads = len(cpus)
+
+    pin = preset["pin_workers"] if pin_workers is None else pin_workers
+    marker_config = {**preset["marker_config"], **(marker_overrides or {})}
+
+    return InferenceProfile(
+        name=name,
+        workers=workers,
+        cpu_count=len(cpus),
+        torch_threads=threads,
+        # 推理都在单个调用内串行执行，跨算子并行线程设为 1 即可
+        interop_threads=1 if threads else None,
+        core_sets=split_cores(cpus, workers) if pin and hasattr(os, "sched_setaffinity") else [],
+        marker_config=marker_config,
+    )
+
+
+def apply_torch_threads(profile: InferenceProfile):
+    """设置 torch 线程数，需要在加载模型、执行推理之前调用"""
+    if not profile.torch_threads:
+        return
+    import torch
+
+    torch.set_num_threads(profile.torch_threads)
+    if profile.interop_threads:
+        try:
+            torch.set_num_interop_threads(profile.interop_threads)
+        except RuntimeError:
+            # 已经执行过并行计算后不能再修改，保持当前值
+            logger.warning("torch 跨算子线程数已初始化，无法修改")
+
+
+def pin_current_worker(core_set: List[int]):
+    """将当前线程（Linux 下 pid=0 表示调用线程）或进程绑定到指定核心"""
+    if core_set and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, core_set)
+
+
+class WorkerPinner:
+    """
+    线程池 initializer：每个新工作线程依次绑定到下一组核心
+
+    用法：ThreadPoolExecutor(max_workers=n, initializer=WorkerPinner(profile))
+    """
+
+    def __init__(self, profile: InferenceProfile):
+        self.core_sets = profile.core_sets
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        if not self.core_sets:
+            return
+        with self._lock:
+            index = next(self._counter)
+        pin_current_worker(self.core_sets[index % len(self.core_sets)])
@@ -0,0 +1,198 @@
+"""
+监控指标模块
+基于 prometheus_client 导出各处理阶段耗时、缓存命中、LLM token 用量、错误数及队列/磁盘等运行指标。
+未开启 ENABLE_METRICS 或未安装 prometheus_client 时，所有记录函数均为空操作
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Union
+
+from config import ENABLE_METRICS
+from utils.profiler import span
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest, start_http_server
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    PROMETHEUS_AVAILABLE = False
+
+METRICS_ENABLED = ENABLE_METRICS and PROMETHEUS_AVAILABLE
+
+# 阶段耗时分桶：覆盖从毫秒级（JSON解析）到分钟级（OCR、大模板保存）
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+if METRICS_ENABLED:
+    STAGE_DURATION = Histogram(
+        "production_stage_duration_seconds",
+        "各处理阶段耗时（upload / marker_parse / llm_throttle / llm_call / json_parse / template_load / workbook_fill / workbook_compact / workbook_save / zip_build / regenerate）",
+        ["stage", "customer_code", "template_type"],
+        buckets=STAGE_BUCKETS,
+    )
+    STAGE_ERRORS = Counter(
+        "production_stage_errors_total",
+        "各处理阶段的错误数",
+        ["stage", "customer_code", "template_type"],
+    )
+    CACHE_REQUESTS = Counter(
+        "production_cache_requests_total",
+        "抽取结果缓存查询次数",
+        ["cache", "result"],
+    )
+    LLM_TOKENS = Counter(
+        "production_llm_tokens_total",
+        "LLM token 用量",
+        ["customer_code", "direction"],
+    )
+    QUEUE_DEPTH = Gauge("production_queue_depth", "等待处理的任务数")
+    ACTIVE_WORKERS = Gauge("production_active_workers", "正在处理任务的工作线程数")
+    DISK_USAGE = Gauge("production_disk_usage_bytes", "各数据目录占用的磁盘空间", ["directory"])
+    EVENT_LOOP_LAG = Gauge("production_event_loop_lag_seconds", "事件循环调度延迟（最近一次采样）")
+    PROCESS_RSS = Gauge("production_process_rss_bytes", "工作进程常驻内存（任务处理期间采样）")
+
+# 队列深度和工作线程数同时在进程内计数，未开启指标时运行状态接口也能读取
+_counter_lock = threading.Lock()
+_queue_depth = 0
+_active_workers = 0
+
+
+def start_metrics_server(port: int) -> bool:
+    """在独立端口启动指标导出服务，成功返回 True"""
+    if not METRICS_ENABLED:
+        return False
+    try:
+        start_http_server(port)
+        return True
+    except OSError as e:
+        # 多个工作进程时只有一个能绑定端口，其余进程仍可通过应用的 /metrics 导出
+        logger.warning(f"指标服务端口 {port} 启动失败: {e}")
+        return False
+
+
+def export_metrics() -> bytes:
+    """返回 Prometheus 文本格式的指标"""
+    if not METRICS_ENABLED:
+        return b""
+    return generate_latest()
+
+
+@contextmanager
+def track_stage(stage: str, customer_code: str = "", template_type: str = ""):
+    """
+    记录一个处理阶段的耗时，阶段内抛出异常时同时记录错误数；
+    当前任务开启了性能剖析时，同时在剖析时间线上记录该阶段
+    """
+    with span(stage, customer_code=customer_code, template_type=template_type):
+        if not METRICS_ENABLED:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            STAGE_ERRORS.labels(stage, customer_code, template_type).inc()
+            raise
+        finally:
+            STAGE_DURATION.labels(stage, customer_code, template_type).observe(time.perf_counter() - start)
+
+
+def record_error(stage: str, customer_code: str = "", template_type: str = ""):
+    """记录一次未以异常形式抛出的阶段错误（例如 LLM 接口返回失败状态）"""
+    if METRICS_ENABLED:
+        STAGE_ERRORS.labels(stage, customer_code, template_type).inc()
+
+
+def record_cache(cache: str, hit: bool):
+    """记录一次缓存查询"""
+    if METRICS_ENABLED:
+        CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_llm_tokens(customer_code: str, input_tokens: int, output_tokens: int):
+    """记录一次 LLM 调用的 token 用量"""
+    if METRICS_ENABLED:
+        LLM_TOKENS.labels(customer_code, "input").inc(input_tokens)
+        LLM_TOKENS.labels(customer_code, "output").inc(output_tokens)
+
+
+def _add_queue_depth(amount: int):
+    global _queue_depth
+    with _counter_lock:
+        _queue_depth += amount
+    if METRICS_ENABLED:
+        QUEUE_DEPTH.inc(amount)
+
+
+def _add_active_workers(amount: int):
+    global _active_workers
+    with _counter_lock:
+        _active_workers += amount
+    if METRICS_ENABLED:
+        ACTIVE_WORKERS.inc(amount)
+
+
+def inc_queue_depth(amount: int = 1):
+    _add_queue_depth(amount)
+
+
+def dec_queue_depth(amount: int = 1):
+    _add_queue_depth(-amount)
+
+
+def inc_active_workers():
+    _add_active_workers(1)
+
+
+def dec_active_workers():
+    _add_active_workers(-1)
+
+
+def queue_depth() -> int:
+    """当前等待处理的任务数"""
+    return _queue_depth
+
+
+def active_workers() -> int:
+    """当前正在处理任务的工作线程数"""
+    return _active_workers
+
+
+def record_event_loop_lag(lag: float):
+    """记录一次事件循环延迟采样（秒）"""
+    if METRICS_ENABLED:
+        EVENT_LOOP_LAG.set(lag)
+
+
+def set_process_rss(rss_bytes: int):
+    """记录一次进程常驻内存采样（字节）"""
+    if METRICS_ENABLED:
+        PROCESS_RSS.set(rss_bytes)
+
+
+def directory_size(path: Union[str, Path]) -> int:
+    """统计目录下所有文件的总大小（字节）"""
+    total = 0
+    for file_path in Path(path).rglob("*"):
+        try:
+            if file_path.is_file():
+                total += file_path.stat().st_size
+        except OSError:
+            # 统计过程中文件被清理
+            continue
+    return total
+
+
+def update_disk_usage(directories: Iterable[Path]) -> Dict[str, int]:
+    """刷新各数据目录的磁盘占用指标"""
+    usage = {Path(d).name: directory_size(d) for d in directories if Path(d).exists()}
+    if METRICS_ENABLED:
+        for name, size in usage.items():
+            DISK_USAGE.labels(name).set(size)
+    return usage
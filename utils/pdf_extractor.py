@@ -5,29 +5,71 @@ PDF信息提取模块
 """
 
 import json
+import logging
 import re
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, Optional, List, Union, Callable
 
-import dashscope
 from http import HTTPStatus
 from openpyxl import load_workbook
 
-from marker.converters.pdf import PdfConverter
-from marker.models import create_model_dict
-from marker.output import text_from_rendered
+# 模板货号读取、JSON 解析等静态方法不依赖 marker / dashscope，未安装时仍可使用（如基准测试中的纯计算用例）
+try:
+    import dashscope
+    DASHSCOPE_AVAILABLE = True
+except ImportError:
+    DASHSCOPE_AVAILABLE = False
 
+try:
+    from marker.converters.pdf import PdfConverter
+    from marker.models import create_model_dict
+    from marker.output import text_from_rendered
+    MARKER_AVAILABLE = True
+except ImportError:
+    MARKER_AVAILABLE = False
 
-dashscope.api_key = 'sk-349857a349fe47adb358f784c7860d6a'
+from config import (
+    AI_API_KEY, AI_API_URL, LLM_CHARS_PER_TOKEN, LLM_OUTPUT_TOKENS_ESTIMATE, LLM_RATE_LIMIT_STATE_FILE, LLM_RPS,
+    LLM_THROTTLE_BACKOFF, LLM_THROTTLE_RETRIES, LLM_TPM
+)
+from utils.extraction_cache import ExtractionCache
+from utils.inference_profile import InferenceProfile
+from utils.metrics import record_cache, record_error, record_llm_tokens, track_stage
+from utils.rate_limiter import SharedRateLimiter, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+if DASHSCOPE_AVAILABLE:
+    dashscope.api_key = AI_API_KEY or 'sk-349857a349fe47adb358f784c7860d6a'
+    # 可通过 AI_API_URL 指向其他兼容的服务地址（例如基准测试中的本地模拟服务）
+    if AI_API_URL:
+        dashscope.base_http_api_url = AI_API_URL
+
+# 本机所有工作线程和进程共用的 LLM 调用额度
+llm_rate_limiter = SharedRateLimiter(LLM_RATE_LIMIT_STATE_FILE, LLM_RPS, LLM_TPM)
+
+
+class LLMThrottledError(Exception):
+    """LLM 接口返回限流错误（超出 QPS / TPM 额度）"""
 
 class PDFExtractor:
     """PDF信息提取器"""
     
-    def __init__(self):
-        """初始化PDF提取器"""
+    def __init__(self, cache: Optional[ExtractionCache] = None, inference_profile: Optional[InferenceProfile] = None):
+        """
+        初始化PDF提取器
+
+        Args:
+            cache: 抽取结果缓存，为 None 时不使用缓存
+            inference_profile: CPU 推理配置，提供页面渲染分辨率和模型批大小；torch 线程数需在此之前通过 apply_torch_threads 设置
+        """
+        if not MARKER_AVAILABLE or not DASHSCOPE_AVAILABLE:
+            raise ImportError("PDF信息提取需要安装 marker-pdf 和 dashscope")
+        self.cache = cache
 
         self.converter = PdfConverter(
             artifact_dict=create_model_dict(),
+            config=dict(inference_profile.marker_config) if inference_profile else None,
         )
         # logger.info("pdf converter started")
         # 设计提示词提取 PO 中的 po_no 和 采购商品的货号、数量
@@ -89,6 +131,10 @@ class PDFExtractor:
             output_tokens = response['usage']['output_tokens']
             return output, input_tokens, output_tokens
 
+        elif response.status_code == HTTPStatus.TOO_MANY_REQUESTS or str(response.code).startswith('Throttling'):
+            # 限流错误由调用方等待后重试
+            raise LLMThrottledError(f"{response.code}: {response.message}")
+
         else:
             print('Request id: %s, Status code: %s, error code: %s, error message: %s' % (
                 response.request_id, response.status_code,
@@ -96,7 +142,8 @@ class PDFExtractor:
             ))
             return "{}", 0, 0
 
-    def extract_customer_codes_from_excel(self, excel_path: str) -> List[str]:
+    @staticmethod
+    def extract_customer_codes_from_excel(excel_path: str) -> List[str]:
         """
         从Excel 主表 中提取客户货号列表
         
@@ -154,11 +201,42 @@ class PDFExtractor:
         except Exception as e:
             raise Exception(f"从Excel文件 {excel_path} 提取客户货号失败: {e}")
 
-    def extract_info(self, parsed_pdf, customer_codes_reference: str = ""):
+    def extract_info(self, parsed_pdf, customer_codes_reference: str = "", customer_code: str = "", template_type: str = "",
+                     throttle_callback: Optional[Callable[[float], None]] = None):
         # 基于 qwen api,以提示词的方式抽取信息
         prompt = (f"{self.prompt}{customer_codes_reference}\n"
                   f"## 待处理采购订单：\n{parsed_pdf}")
-        raw_production_info, input_tokens, output_tokens = self.call_api(prompt)
+        # 调用前按估算用量占用额度，额度不足时排队等待；调用后按实际用量修正
+        estimated_tokens = estimate_tokens(prompt, LLM_CHARS_PER_TOKEN) + LLM_OUTPUT_TOKENS_ESTIMATE
+        throttle_seconds = 0.0
+        raw_production_info, input_tokens, output_tokens = "{}", 0, 0
+        for attempt in range(LLM_THROTTLE_RETRIES + 1):
+            with track_stage("llm_throttle", customer_code, template_type):
+                throttle_seconds += llm_rate_limiter.acquire(estimated_tokens)
+            try:
+                with track_stage("llm_call", customer_code, template_type):
+                    raw_production_info, input_tokens, output_tokens = self.call_api(prompt)
+            except LLMThrottledError as e:
+                llm_rate_limiter.settle(estimated_tokens, 0)
+                if attempt == LLM_THROTTLE_RETRIES:
+                    # 重试用尽时任务以限流失败结束，而不是当作抽取结果为空
+                    if throttle_callback:
+                        throttle_callback(throttle_seconds)
+                    record_error("llm_throttle", customer_code, template_type)
+                    raise LLMThrottledError(f"AI 接口限流，重试 {LLM_THROTTLE_RETRIES} 次后仍被拒绝，请稍后重新提交: {e}") from e
+                # 额度未配置、配置高于服务商实际额度或有其他机器共用账号时，所有进程暂停一段时间后重试，暂停时间逐次加倍
+                backoff = LLM_THROTTLE_BACKOFF * 2 ** attempt
+                logger.warning(f"AI 接口限流（第 {attempt + 1} 次），暂停 {backoff} 秒后重试: {e}")
+                llm_rate_limiter.pause(backoff)
+                continue
+            llm_rate_limiter.settle(estimated_tokens, input_tokens + output_tokens)
+            break
+        if throttle_callback:
+            throttle_callback(throttle_seconds)
+        if input_tokens == 0 and output_tokens == 0:
+            # call_api 请求失败时返回 "{}"，不会抛出异常
+            record_error("llm_call", customer_code, template_type)
+        record_llm_tokens(customer_code, input_tokens, output_tokens)
         # logger.info(f"raw_ai_result: {raw_production_info}")
         # logger.info(f"input_token_nums: {input_tokens}")
         # logger.info(f"output_token_nums: {output_tokens}")
@@ -197,22 +275,67 @@ class PDFExtractor:
             error_msg = f"JSON解析失败: {e.msg}\n错误位置: {e.pos}\n错误片段: {new_json_str[max(0, e.pos - 20):e.pos + 20]}"
             raise ValueError(error_msg) from e
 
-    def process(self, pdf_path, templates: Dict[str, str]):
+    def process(self, pdf_path, templates: Dict[str, str], template_reference=None, pdf_sha256: Optional[str] = None,
+                progress_callback: Optional[Callable[[str], None]] = None, customer_code: str = "",
+                pdf_markdown: Optional[str] = None, throttle_callback: Optional[Callable[[float], None]] = None):
         """
         pdf处理流程如下：
         1. 解析 pdf --> markdown
         2. ai extract raw_info
         3. raw info --> dict
+
+        template_reference 为 get_customer_codes_reference 的返回值；
+        批量处理同一客户的多个 PO 时传入，避免每个 PDF 重复加载模板
+
+        pdf_sha256 为 PDF 内容哈希（上传时已计算）；启用缓存时用作缓存键，
+        未传入时会重新读取文件计算
+
+        progress_callback 在进入各阶段时被调用，参数为阶段名：'parsing'、'extracting'
+
+        customer_code 仅用于监控指标的标签
+
+        pdf_markdown 为提前上传时已解析好的 markdown，传入时跳过 PDF 解析
+
+        throttle_callback 在 AI 调用完成后被调用，参数为因限流排队等待的秒数
         """
-        pdf_2_markdown = self.parse_pdf(pdf_path)
+        if progress_callback is None:
+            progress_callback = lambda stage: None
+        # 监控指标标签：客户号 + 模板类型（如 GM+GX）
+        stage_labels = {"customer_code": customer_code, "template_type": "+".join(sorted(templates))}
+
+        if self.cache is not None and pdf_sha256 is None:
+            pdf_sha256 = self.cache.file_sha256(pdf_path)
+
+        progress_callback("parsing")
+        if pdf_markdown is not None:
+            pdf_2_markdown = pdf_markdown
+        else:
+            pdf_2_markdown = self.parse_pdf_cached(pdf_path, pdf_sha256, **stage_labels)
 
         # 抽取模板中的客户货号，作为 AI 的 reference;
         # template_2_info 中包含模板的：位置+客户货号
-        customer_codes_reference, template_2_info = self.get_customer_codes_reference(templates)
+        if template_reference is None:
+            with track_stage("template_load", **stage_labels):
+                template_reference = self.get_customer_codes_reference(templates)
+        customer_codes_reference, template_2_info = template_reference
+
+        # 同一份 PDF + 同一套参考货号，直接复用之前的 AI 抽取结果
+        extraction_key = None
+        if self.cache is not None:
+            extraction_key = self.cache.make_key(pdf_sha256, customer_codes_reference, self.prompt)
+            cached_info = self.cache.get("extraction", extraction_key)
+            record_cache("extraction", cached_info is not None)
+            if cached_info is not None:
+                logger.info(f"AI 抽取结果命中缓存: {pdf_path}")
+                return cached_info, template_2_info
+
         # ai 抽取信息
-        product_info_str = self.extract_info(pdf_2_markdown, customer_codes_reference)
+        progress_callback("extracting")
+        product_info_str = self.extract_info(pdf_2_markdown, customer_codes_reference, **stage_labels,
+                                             throttle_callback=throttle_callback)
         # 解析 ai 的生成结果
-        po_product_info_dict = self.convert_json_2_dict(product_info_str)
+        with track_stage("json_parse", **stage_labels):
+            po_product_info_dict = self.convert_json_2_dict(product_info_str)
 
         # po_product_info_dict = {'po_no': '4647647606', 'product_info': [{'cust_item_code': '22YM05', 'quantity': 200}, {'cust_item_code': '22YM06', 'quantity': 200}, {'cust_item_code': '23PC31', 'quantity': 200}, {'cust_item_code': '23PC32', 'quantity': 280}, {'cust_item_code': '23PC34', 'quantity': 120}, {'cust_item_code': '23PC35', 'quantity': 200}, {'cust_item_code': '23PC37', 'quantity': 240}, {'cust_item_code': '23PC38', 'quantity': 300}, {'cust_item_code': '23PC39A', 'quantity': 300}, {'cust_item_code': '23PC40A', 'quantity': 1000}, {'cust_item_code': '23PC41', 'quantity': 200}, {'cust_item_code': '23PC43', 'quantity': 1000}, {'cust_item_code': '23PC96', 'quantity': 100}, {'cust_item_code': '450G83A', 'quantity': 100}, {'cust_item_code': '5RXF2A', 'quantity': 200}, {'cust_item_code': '5RXF3B', 'quantity': 100}, {'cust_item_code': '5RXF6A', 'quantity': 200}, {'cust_item_code': '5RXF7B', 'quantity': 100}, {'cust_item_code': '5RXF8B', 'quantity': 100}, {'cust_item_code': '5RXF9B', 'quantity': 100}, {'cust_item_code': '5RXG1A', 'quantity': 200}, {'cust_item_code': '5RXG2B', 'quantity': 100}, {'cust_item_code': '5RXG3A', 'quantity': 500}, {'cust_item_code': '5RXG4A', 'quantity': 112}, {'cust_item_code': '5RXG5A', 'quantity': 500}, {'cust_item_code': '5RXG6A', 'quantity': 112}, {'cust_item_code': '5RXG7A', 'quantity': 112}]}
         # template_2_info = {'GM': {'customer_codes': ['450G83A', '22YM06', '22YM05', '22YM07', '34NK65'], 'template_path': 'company_templates/522/522_广美_任务单.xlsx'}, 'GX': {'customer_codes': ['23PC31', '23PC32', '23PC33', '23PC34', '23PC35', '23PC36', '23PC37', '23PC38', '23PC39A', '23PC40A', '23PC41', '23PC42', '23PC43', '23PC44', '23PC45', '23PC46', '23PC95', '23PC96', '23PC97', '23PC98', '5RXF2A', '5RXF3B', '5RXF4B', '5RXF5A', '5RXF6A', '5RXF7B', '5RXF8B', '5RXF9B', '5RXG1A', '5RXG2B', '5RXG3A', '5RXG4A', '5RXG5A', '5RXG6A', '5RXG7A', '5RXG0'], 'template_path': 'company_templates/522/522_广线_任务单.xlsx'}}
@@ -221,9 +344,30 @@ class PDFExtractor:
         if not po_product_info_dict.get('product_info') or len(po_product_info_dict.get('product_info', [])) == 0:
             raise ValueError("AI 无法提取 PO 中的产品信息，请手动制作生产任务单。")
 
+        if extraction_key is not None:
+            self.cache.set("extraction", extraction_key, po_product_info_dict)
+
         return po_product_info_dict, template_2_info
 
-    def get_customer_codes_reference(self, templates: Dict[str, str]):
+    def parse_pdf_cached(self, pdf_path, pdf_sha256: Optional[str] = None, customer_code: str = "", template_type: str = ""):
+        """解析 pdf --> markdown，启用缓存时相同内容的 PDF 只解析一次"""
+        if self.cache is None or pdf_sha256 is None:
+            with track_stage("marker_parse", customer_code, template_type):
+                return self.parse_pdf(pdf_path)
+
+        cached_markdown = self.cache.get("markdown", pdf_sha256)
+        record_cache("markdown", cached_markdown is not None)
+        if cached_markdown is not None:
+            logger.info(f"PDF 解析结果命中缓存: {pdf_path}")
+            return cached_markdown
+
+        with track_stage("marker_parse", customer_code, template_type):
+            pdf_2_markdown = self.parse_pdf(pdf_path)
+        self.cache.set("markdown", pdf_sha256, pdf_2_markdown)
+        return pdf_2_markdown
+
+    @classmethod
+    def get_customer_codes_reference(cls, templates: Dict[str, str]):
         """
         获取excel中，客户货号，作为参考字符串，辅助AI进行抽取
         
@@ -239,16 +383,17 @@ class PDFExtractor:
         # 遍历所有模板路径
         for template_type, template_path in templates.items():
             # 从模板中得到 客户货号
-            customer_codes = self.extract_customer_codes_from_excel(template_path)
+            customer_codes = cls.extract_customer_codes_from_excel(template_path)
             all_customer_codes.extend(customer_codes)
             template_2_info[template_type] = {
                 'template_path': template_path,
                 'customer_codes': customer_codes,
             }
         
-        return self.format_reference_codes(all_customer_codes), template_2_info
+        return cls.format_reference_codes(all_customer_codes), template_2_info
 
-    def format_reference_codes(self, codes: List[str]) -> str:
+    @staticmethod
+    def format_reference_codes(codes: List[str]) -> str:
         """
         格式化参考货号字符串
         
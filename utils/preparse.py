@@ -0,0 +1,90 @@
+"""
+PDF 预解析模块
+用户选择 PDF 后立即上传并在后台解析为 markdown，填写表单的同时完成 OCR；
+提交表单时任务认领预解析结果，不再重复解析
+"""
+
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+
+class PreparseJob:
+    """
+    一次提前上传的 PDF 及其解析状态（解析在处理线程中执行，状态可跨线程读取）
+
+    状态流转：
+    - queued -> parsing -> parsed / error：预解析正常执行
+    - queued -> cancelled：解析开始前被任务接手或被清理，排队中的预解析执行时直接跳过
+    """
+
+    def __init__(self, preparse_id: str, upload_dir: Path, pdf_path: Path, file_name: str,
+                 pdf_file_info: Dict[str, Any], customer_code: str = ""):
+        self.preparse_id = preparse_id
+        self.upload_dir = upload_dir
+        self.pdf_path = pdf_path
+        self.file_name = file_name
+        self.pdf_file_info = pdf_file_info
+        self.customer_code = customer_code
+        self.created_at = time.time()
+        self.state = "queued"
+        self.parse_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self._markdown: Optional[str] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def run(self, parse: Callable[[], str]):
+        """在处理线程中执行解析；已被取消时直接返回"""
+        with self._lock:
+            if self.state != "queued":
+                return
+            self.state = "parsing"
+        start = time.perf_counter()
+        try:
+            self._markdown = parse()
+            self.state = "parsed"
+        except Exception as e:
+            self.error = str(e)
+            self.state = "error"
+        finally:
+            self.parse_seconds = time.perf_counter() - start
+            self._done.set()
+
+    def take_markdown(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        任务开始处理时调用
+
+        解析已开始时等待其完成并返回 markdown（解析失败或超时返回 None）；
+        尚未开始时取消预解析并返回 None，由任务自行解析，避免同一份 PDF 解析两次
+        """
+        with self._lock:
+            if self.state == "queued":
+                self.state = "cancelled"
+                return None
+        self._done.wait(timeout)
+        return self._markdown
+
+    def abandon(self) -> bool:
+        """过期清理时调用：取消尚未开始的解析；返回是否可以删除上传文件（正在解析时不可删除）"""
+        with self._lock:
+            if self.state == "parsing":
+                return False
+            if self.state == "queued":
+                self.state = "cancelled"
+            return True
+
+    def is_expired(self, ttl: float) -> bool:
+        return time.time() - self.created_at > ttl
+
+    def describe(self) -> Dict[str, Any]:
+        """供预解析状态接口返回"""
+        return {
+            "preparse_id": self.preparse_id,
+            "status": self.state,
+            "file_name": self.file_name,
+            "pdf_size": self.pdf_file_info["size"],
+            "parse_seconds": round(self.parse_seconds, 2) if self.parse_seconds is not None else None,
+            "error": self.error,
+        }
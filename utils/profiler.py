@@ -0,0 +1,143 @@
+"""
+任务性能剖析模块
+按需对单个任务开启 cProfile，并记录各处理阶段的 span 时间线，结果保存到任务目录下。
+未开启剖析的任务只有一次 ContextVar 读取的开销
+"""
+
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# 当前线程/上下文正在剖析的任务
+_current_profiler: contextvars.ContextVar = contextvars.ContextVar("task_profiler", default=None)
+
+# 同一进程中同时只能启用一个 cProfile（Python 3.12 起再启用会抛出 ValueError），同一时刻只剖析一个任务
+_profile_lock = threading.Lock()
+
+PROFILE_STATS_FILE = "profile.prof"
+PROFILE_REPORT_FILE = "profile.txt"
+TRACE_FILE = "trace.json"
+
+
+class TaskProfiler:
+    """
+    单个任务的性能剖析器
+
+    产物：
+    - profile.prof：cProfile 原始数据，可用 snakeviz / pstats 查看
+    - profile.txt：按累计耗时排序的函数列表
+    - trace.json：各阶段 span，Chrome Trace Event 格式，可在 chrome://tracing 或 Perfetto 中打开
+    """
+
+    def __init__(self, task_id: str, output_dir: Union[str, Path], report_limit: int = 60):
+        self.task_id = task_id
+        self.output_dir = Path(output_dir)
+        self.report_limit = report_limit
+        self._profile = cProfile.Profile()
+        self._spans: List[Dict[str, Any]] = []
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """记录一个阶段的起止时间"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._spans.append({
+                "name": name,
+                "ph": "X",
+                "ts": round((start - self._origin) * 1e6),
+                "dur": round((end - start) * 1e6),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": attrs,
+            })
+
+    def start(self):
+        self._origin = time.perf_counter()
+        self._profile.enable()
+
+    def stop(self) -> List[str]:
+        """停止剖析并写出产物，返回产物文件名列表"""
+        self._profile.disable()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        self._profile.dump_stats(str(self.output_dir / PROFILE_STATS_FILE))
+
+        report = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=report)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.report_limit)
+        (self.output_dir / PROFILE_REPORT_FILE).write_text(report.getvalue(), encoding="utf-8")
+
+        trace = {"traceEvents": self._spans, "metadata": {"task_id": self.task_id}}
+        with open(self.output_dir / TRACE_FILE, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False)
+
+        return [PROFILE_STATS_FILE, PROFILE_REPORT_FILE, TRACE_FILE]
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """在当前任务的剖析时间线上记录一个阶段；当前任务未开启剖析时为空操作"""
+    profiler: Optional[TaskProfiler] = _current_profiler.get()
+    if profiler is None:
+        yield
+        return
+    with profiler.span(name, **attrs):
+        yield
+
+
+@contextmanager
+def profile_task(task_id: str, output_dir: Union[str, Path], enabled: bool = True):
+    """
+    对一段处理流程开启剖析
+
+    需要在实际执行处理的线程中进入（cProfile 只剖析当前线程）。
+    yield 一个列表，退出时填入产物文件名；未开启时列表为空。
+    已有其他任务正在剖析，或剖析无法启动时，不剖析直接执行（记录警告），剖析出错不影响处理流程
+    """
+    artifacts: List[str] = []
+    if not enabled:
+        yield artifacts
+        return
+
+    if not _profile_lock.acquire(blocking=False):
+        logger.warning(f"已有其他任务正在剖析，任务 {task_id} 不做剖析")
+        yield artifacts
+        return
+
+    profiler = TaskProfiler(task_id, output_dir)
+    try:
+        profiler.start()
+    except ValueError as e:
+        # 调试器、coverage 等其他剖析工具已启用
+        _profile_lock.release()
+        logger.warning(f"任务 {task_id} 剖析无法启动，不做剖析: {e}")
+        yield artifacts
+        return
+
+    token = _current_profiler.set(profiler)
+    try:
+        with profiler.span("task", task_id=task_id):
+            yield artifacts
+    finally:
+        _current_profiler.reset(token)
+        try:
+            artifacts.extend(profiler.stop())
+        except Exception as e:
+            logger.warning(f"任务 {task_id} 剖析结果保存失败: {e}")
+        finally:
+            _profile_lock.release()
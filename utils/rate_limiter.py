@@ -0,0 +1,145 @@
+"""
+LLM 调用限流模块
+按 每秒请求数 和 每分钟 token 数 两个令牌桶控制对 LLM 接口的调用速率，令牌桶状态保存在本机文件中并用文件锁保护，
+同一台机器上的所有工作线程和进程（Web 服务、离线批量处理）共用同一额度。
+额度不足时调用方排队等待，而不是让请求被服务商限流后返回空结果
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from filelock import FileLock
+
+# 额度不足时单次最长等待时间（秒），到期后重新检查，期间可能有其他进程的修正或暂停
+MAX_SLEEP_SECONDS = 1.0
+
+
+class SharedRateLimiter:
+    """
+    跨进程共享的令牌桶限流器
+
+    - 请求桶：容量为 1 秒的请求数，按 requests_per_second 匀速补充
+    - token 桶：容量为 1 分钟的 token 数，按 tokens_per_minute / 60 每秒匀速补充
+
+    调用前按估算的 token 数扣减，调用后按实际用量修正（settle），估算偏差不会累积；
+    估算超过桶容量的单个请求在桶满时放行，避免永远等不到额度
+
+    Args:
+        state_path: 令牌桶状态文件，同一台机器上的进程需使用同一路径
+        requests_per_second: 每秒请求数上限，为 0 时不限制
+        tokens_per_minute: 每分钟 token 数上限，为 0 时不限制
+    """
+
+    def __init__(self, state_path: Union[str, Path], requests_per_second: float = 0, tokens_per_minute: float = 0):
+        self.state_path = Path(state_path)
+        self.requests_per_second = requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+        self.request_capacity = max(1.0, requests_per_second)
+        # 文件锁在进程之间互斥，线程锁在进程内的工作线程之间互斥
+        self._file_lock = FileLock(str(self.state_path) + ".lock")
+        self._thread_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_second > 0 or self.tokens_per_minute > 0
+
+    def _load(self, now: float) -> Dict[str, float]:
+        """读取令牌桶状态，文件不存在或已损坏时视为满桶"""
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            return {key: float(state[key]) for key in ("requests", "tokens", "updated", "blocked_until")}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {"requests": self.request_capacity, "tokens": self.tokens_per_minute, "updated": now,
+                    "blocked_until": 0.0}
+
+    def _save(self, state: Dict[str, float]):
+        tmp_path = self.state_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(state), encoding="utf-8")
+        os.replace(tmp_path, self.state_path)
+
+    def _refill(self, state: Dict[str, float], now: float):
+        elapsed = max(0.0, now - state["updated"])
+        state["requests"] = min(self.request_capacity, state["requests"] + elapsed * self.requests_per_second)
+        state["tokens"] = min(self.tokens_per_minute, state["tokens"] + elapsed * self.tokens_per_minute / 60)
+        state["updated"] = now
+
+    def _update(self, fn):
+        """在锁内读取、补充、修改并保存令牌桶状态，返回 fn 的返回值"""
+        with self._thread_lock, self._file_lock:
+            now = time.time()
+            state = self._load(now)
+            self._refill(state, now)
+            result = fn(state, now)
+            self._save(state)
+            return result
+
+    def _try_acquire(self, tokens: float) -> float:
+        """尝试扣减额度：成功返回 0，否则返回还需等待的秒数"""
+        if not self.enabled:
+            # 未设置额度时只检查暂停时间，不写回状态文件
+            with self._thread_lock, self._file_lock:
+                now = time.time()
+                return max(0.0, self._load(now)["blocked_until"] - now)
+
+        def acquire(state: Dict[str, float], now: float) -> float:
+            wait = max(0.0, state["blocked_until"] - now)
+            if self.requests_per_second > 0 and state["requests"] < 1:
+                wait = max(wait, (1 - state["requests"]) / self.requests_per_second)
+            if self.tokens_per_minute > 0:
+                needed = min(tokens, self.tokens_per_minute)
+                if state["tokens"] < needed:
+                    wait = max(wait, (needed - state["tokens"]) * 60 / self.tokens_per_minute)
+            if wait > 0:
+                return wait
+            if self.requests_per_second > 0:
+                state["requests"] -= 1
+            if self.tokens_per_minute > 0:
+                state["tokens"] -= tokens
+            return 0.0
+        return self._update(acquire)
+
+    def acquire(self, tokens: float = 0) -> float:
+        """等待到有足够额度后扣减，返回等待的秒数；未设置额度时仍会等待 pause() 设置的暂停结束"""
+        start = time.monotonic()
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return time.monotonic() - start
+            time.sleep(min(wait, MAX_SLEEP_SECONDS))
+
+    def settle(self, estimated_tokens: float, actual_tokens: float):
+        """调用完成后按实际 token 用量修正（多退少补，可以为负，之后的调用会等待补足）"""
+        if self.tokens_per_minute <= 0 or actual_tokens == estimated_tokens:
+            return
+
+        def settle(state: Dict[str, float], now: float):
+            state["tokens"] = min(self.tokens_per_minute, state["tokens"] - (actual_tokens - estimated_tokens))
+        self._update(settle)
+
+    def pause(self, seconds: float):
+        """服务商仍返回限流错误时，所有进程暂停调用 seconds 秒（未设置额度时同样生效）"""
+        def pause(state: Dict[str, float], now: float):
+            state["blocked_until"] = max(state["blocked_until"], now + seconds)
+        self._update(pause)
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """当前剩余额度，供运行状态接口展示；未开启限流时返回 None"""
+        if not self.enabled:
+            return None
+        state = self._update(lambda state, now: dict(state))
+        return {
+            "requests_per_second": self.requests_per_second,
+            "tokens_per_minute": self.tokens_per_minute,
+            "available_requests": round(state["requests"], 2),
+            "available_tokens": round(state["tokens"]),
+            "paused_seconds": round(max(0.0, state["blocked_until"] - state["updated"]), 1),
+        }
+
+
+def estimate_tokens(text: str, chars_per_token: float) -> int:
+    """按字符数估算 prompt 的 token 数"""
+    return int(len(text) / chars_per_token) + 1
@@ -0,0 +1,126 @@
+"""
+运行状态监控模块
+采样事件循环调度延迟和进程内存占用，供运行状态接口和压测工具读取
+"""
+
+import asyncio
+import itertools
+import os
+import resource
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from utils import metrics
+
+
+def current_rss_bytes() -> Optional[int]:
+    """当前进程的常驻内存（字节），仅 Linux 可读取，其他平台返回 None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes() -> int:
+    """进程启动以来的峰值常驻内存（字节）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 下单位为 KB，macOS 下为字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class EventLoopLagMonitor:
+    """
+    事件循环延迟监控
+
+    定期 sleep 固定间隔，实际唤醒时间与预期的差值即为事件循环被阻塞的时长。
+    上传、状态查询等接口的延迟会随该值一起上升
+    """
+
+    def __init__(self, interval: float = 0.5, window: int = 120):
+        self.interval = interval
+        self._samples = deque(maxlen=window)
+        self._max_lag = 0.0
+
+    async def run(self):
+        """在事件循环中持续采样，作为后台任务启动"""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self._samples.append(lag)
+            self._max_lag = max(self._max_lag, lag)
+            metrics.record_event_loop_lag(lag)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """最近窗口内的延迟统计（毫秒）"""
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0, "last_ms": None, "mean_ms": None, "p99_ms": None, "max_ms": None,
+                    "max_since_start_ms": None}
+        return {
+            "samples": len(samples),
+            "last_ms": round(self._samples[-1] * 1000, 2),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p99_ms": round(samples[min(len(samples) - 1, int(0.99 * len(samples)))] * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2),
+            "max_since_start_ms": round(self._max_lag * 1000, 2),
+        }
+
+
+class TaskMemoryTracker:
+    """
+    任务内存采样
+
+    有任务在处理时，后台线程按固定间隔采样进程常驻内存，记录每个任务运行期间的峰值。
+    任务在同一进程的多个线程中并发执行，记录的是任务运行期间整个进程的峰值，而非任务单独占用的内存
+    """
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._peaks: Dict[int, int] = {}
+        self._ids = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            rss = current_rss_bytes()
+            if rss is None:
+                continue
+            metrics.set_process_rss(rss)
+            with self._lock:
+                for token, peak in self._peaks.items():
+                    if rss > peak:
+                        self._peaks[token] = rss
+
+    def _ensure_sampler(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sample, name="memory-sampler", daemon=True)
+            self._thread.start()
+
+    @contextmanager
+    def track(self) -> Iterator[Dict[str, Optional[int]]]:
+        """
+        记录代码块运行期间的内存，代码块结束后 yield 的字典中填入
+        rss_start_bytes / rss_peak_bytes / rss_end_bytes（无法读取内存的平台均为 None）
+        """
+        usage: Dict[str, Optional[int]] = {"rss_start_bytes": current_rss_bytes()}
+        token = next(self._ids)
+        with self._lock:
+            self._ensure_sampler()
+            self._peaks[token] = usage["rss_start_bytes"] or 0
+        try:
+            yield usage
+        finally:
+            usage["rss_end_bytes"] = current_rss_bytes()
+            with self._lock:
+                peak = self._peaks.pop(token)
+            usage["rss_peak_bytes"] = (
+                max(peak, usage["rss_end_bytes"]) if usage["rss_end_bytes"] is not None else None
+            )
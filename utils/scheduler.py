@@ -0,0 +1,175 @@
+"""
+任务调度模块
+按客户分队列，在客户之间按权重公平分配处理线程，同时支持加急优先级、单客户并发上限和全局并发上限。
+某个客户一次提交大批量 PO 时，其他客户的单个任务不必排在整批之后
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+@dataclass(order=True)
+class ScheduledJob:
+    """排队中的任务，按 (-优先级, 提交顺序) 排序"""
+    sort_key: tuple
+    task_id: str = field(compare=False)
+    customer_code: str = field(compare=False)
+    priority: int = field(compare=False)
+    func: Callable[[], Any] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    submitted_at: float = field(compare=False)
+
+
+@dataclass
+class CustomerQueue:
+    """单个客户的排队任务和调度状态"""
+    weight: float = 1.0
+    jobs: List[ScheduledJob] = field(default_factory=list)
+    running: int = 0
+    # 虚拟时间：已分配的处理份额 / 权重，越小越优先
+    virtual_time: float = 0.0
+
+
+class FairTaskScheduler:
+    """
+    公平调度器（在事件循环中使用）
+
+    调度规则：
+    1. 优先级高的任务（如加急单）先于所有普通任务
+    2. 同一优先级内，选择虚拟时间最小的客户；每分配一个任务，该客户的虚拟时间增加 1/权重
+    3. 正在处理的任务数达到全局上限，或某客户达到单客户上限时，暂不分配（该客户的任务继续排队）
+
+    Args:
+        executor: 实际执行任务的线程池
+        max_concurrent: 全局并发上限
+        max_per_customer: 单个客户的并发上限
+        customer_weights: 客户权重，未配置的客户权重为 1；权重必须大于 0
+        default_task_seconds: 还没有完成任务时，估算等待时间使用的单任务耗时
+        on_queue_change: 排队情况变化后调用 on_queue_change({任务ID: 排队信息})
+    """
+
+    def __init__(self, executor: Executor, max_concurrent: int, max_per_customer: int,
+                 customer_weights: Optional[Dict[str, float]] = None, default_task_seconds: float = 60.0,
+                 on_queue_change: Optional[Callable[[Dict[str, Dict[str, Any]]], None]] = None):
+        invalid_weights = {code: weight for code, weight in (customer_weights or {}).items() if not weight > 0}
+        if invalid_weights:
+            raise ValueError(f"客户权重必须大于 0: {invalid_weights}")
+        self.executor = executor
+        self.max_concurrent = max_concurrent
+        self.max_per_customer = max_per_customer
+        self.customer_weights = customer_weights or {}
+        self.on_queue_change = on_queue_change
+        self._customers: Dict[str, CustomerQueue] = {}
+        self._running = 0
+        self._sequence = itertools.count()
+        # 单任务耗时的指数滑动平均，用于估算等待时间
+        self._avg_task_seconds = default_task_seconds
+
+    async def run(self, task_id: str, customer_code: str, priority: int, func: Callable[[], Any]):
+        """提交任务并等待其执行完成，返回 func 的返回值"""
+        loop = asyncio.get_running_loop()
+        customer = self._customers.get(customer_code)
+        if customer is None:
+            customer = self._customers[customer_code] = CustomerQueue(
+                weight=float(self.customer_weights.get(customer_code, 1.0))
+            )
+        if not customer.jobs and customer.running == 0:
+            # 客户重新开始提交时，从当前最小虚拟时间起步，不能用空闲期间“攒下”的份额插队
+            customer.virtual_time = max(customer.virtual_time, self._min_virtual_time())
+
+        job = ScheduledJob((-priority, next(self._sequence)), task_id, customer_code, priority, func,
+                           loop.create_future(), time.monotonic())
+        heapq.heappush(customer.jobs, job)
+        self._dispatch()
+        return await job.future
+
+    def _min_virtual_time(self) -> float:
+        active = [c.virtual_time for c in self._customers.values() if c.jobs or c.running]
+        return min(active) if active else 0.0
+
+    def _next_customer(self) -> Optional[CustomerQueue]:
+        """选出下一个分配处理线程的客户"""
+        candidates = [
+            c for c in self._customers.values()
+            if c.jobs and c.running < self.max_per_customer
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda c: (c.jobs[0].sort_key[0], c.virtual_time, c.jobs[0].sort_key[1]))
+
+    def _dispatch(self):
+        """在并发上限内，把排队任务分配到线程池"""
+        while self._running < self.max_concurrent:
+            customer = self._next_customer()
+            if customer is None:
+                break
+            job = heapq.heappop(customer.jobs)
+            customer.running += 1
+            customer.virtual_time += 1.0 / customer.weight
+            self._running += 1
+            asyncio.ensure_future(self._execute(job, customer))
+        self._notify_queue_change()
+
+    async def _execute(self, job: ScheduledJob, customer: CustomerQueue):
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        try:
+            result = await loop.run_in_executor(self.executor, job.func)
+            if not job.future.done():
+                job.future.set_result(result)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self._avg_task_seconds = 0.8 * self._avg_task_seconds + 0.2 * (time.monotonic() - start)
+            customer.running -= 1
+            self._running -= 1
+            if not customer.jobs and customer.running == 0:
+                del self._customers[job.customer_code]
+            self._dispatch()
+
+    def queue_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        所有排队任务的预计排队位置和等待时间
+
+        按调度规则推算出队顺序：每个客户第 k 个排队任务的虚拟时间为 当前虚拟时间 + k / 权重。
+        单客户并发上限未计入，结果为估算值
+        """
+        projected = []
+        for customer in self._customers.values():
+            for k, job in enumerate(sorted(customer.jobs)):
+                projected.append((job.sort_key[0], customer.virtual_time + k / customer.weight, job.sort_key[1], job))
+        projected.sort(key=lambda item: item[:3])
+
+        # 有空闲线程时第一批任务无需等待当前任务完成
+        free_slots = max(0, self.max_concurrent - self._running)
+        snapshot = {}
+        for position, (_, _, _, job) in enumerate(projected):
+            waves = 0 if position < free_slots else math.ceil((position - free_slots + 1) / self.max_concurrent)
+            snapshot[job.task_id] = {
+                "queue_position": position + 1,
+                "estimated_wait_seconds": round(waves * self._avg_task_seconds, 1),
+            }
+        return snapshot
+
+    def _notify_queue_change(self):
+        if self.on_queue_change:
+            self.on_queue_change(self.queue_snapshot())
+
+    def stats(self) -> Dict[str, Any]:
+        """各客户的排队数和处理中任务数"""
+        return {
+            "running": self._running,
+            "queued": sum(len(c.jobs) for c in self._customers.values()),
+            "avg_task_seconds": round(self._avg_task_seconds, 1),
+            "customers": {
+                code: {"queued": len(c.jobs), "running": c.running, "weight": c.weight}
+                for code, c in self._customers.items()
+            },
+        }
@@ -0,0 +1,57 @@
+"""
+任务进度事件模块
+处理线程在任务阶段变化时发布事件，SSE 连接订阅后实时推送给前端
+"""
+
+import asyncio
+from typing import Any, Dict, Optional, Set
+
+
+class TaskEventBroker:
+    """
+    任务进度事件广播器
+
+    publish 可在任意线程调用（后台处理运行在线程池中），
+    事件通过 call_soon_threadsafe 投递到事件循环，再分发给订阅该任务的所有队列
+    """
+
+    def __init__(self, max_queue_size: int = 100):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._max_queue_size = max_queue_size
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """绑定事件循环（应用启动时调用）"""
+        self._loop = loop
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        """订阅任务事件，返回接收事件的队列"""
+        queue = asyncio.Queue(maxsize=self._max_queue_size)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        """取消订阅"""
+        queues = self._subscribers.get(task_id)
+        if not queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[task_id]
+
+    def publish(self, task_id: str, event: Dict[str, Any]):
+        """发布任务事件（线程安全），没有订阅者时直接丢弃"""
+        if self._loop is None or self._loop.is_closed() or task_id not in self._subscribers:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch, task_id, event)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def _dispatch(self, task_id: str, event: Dict[str, Any]):
+        for queue in list(self._subscribers.get(task_id, ())):
+            if queue.full():
+                # 消费过慢时丢弃最旧的事件，只保证最新状态送达
+                queue.get_nowait()
+            queue.put_nowait(event)
@@ -0,0 +1,38 @@
+"""
+客户模板查找模块
+根据客户号定位 company_templates 下的广美/广线模板，Web 服务与命令行批量处理共用
+"""
+
+from pathlib import Path
+from typing import Dict
+
+
+def get_excel_template_path(customer_code: str) -> Dict[str, str]:
+    """
+    根据客户号获取Excel模板路径
+    
+    Args:
+        customer_code: 客户号
+        
+    Returns:
+        模板字典 {'GX': 'path1', 'GM': 'path2'} 或 {'GX': 'path1'}
+        
+    Raises:
+        ValueError: 当客户号对应的模板目录不存在或没有找到有效模板时
+    """
+    template_dir = Path("company_templates") / customer_code
+    
+    if not template_dir.exists():
+        raise ValueError(f"客户号 {customer_code} 对应的模板目录不存在")
+    
+    templates = {}
+    for file_path in template_dir.glob("*.xlsx"):
+        if "广美" in file_path.name:
+            templates['GM'] = str(file_path)
+        elif "广线" in file_path.name:
+            templates['GX'] = str(file_path)
+    
+    if not templates:
+        raise ValueError(f"客户号 {customer_code} 对应的模板目录中没有找到有效的模板文件")
+    
+    return templates
@@ -0,0 +1,439 @@
+"""
+工作簿精简模块
+生成任务单时，PO 未涉及的产品工作表和主表 / TL 行只是被隐藏，仍然随文件一起保存。
+精简模式下物理删除这些隐藏的工作表和行，同时保证保留内容中的公式引用仍然有效：
+- 工作表：只删除没有被保留内容（单元格公式、数据验证、条件格式、定义名称、图表）直接或间接引用的隐藏工作表
+- 行：先改写所有指向该工作表的引用中的行号，再删除行；存在无法安全改写的引用时，该工作表的行保持隐藏、不删除
+"""
+
+import bisect
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from openpyxl.formula import Tokenizer
+from openpyxl.formula.tokenizer import Token
+from openpyxl.worksheet.formula import ArrayFormula
+
+COMPACT_MODES = ("off", "sheets", "rows")
+
+# 地址中的一端：列（可选）+ 行（可选），如 A1、$A$1、A、5
+_ENDPOINT = re.compile(r"^(\$?[A-Za-z]{1,3})?(\$?)(\d+)?$")
+# INDIRECT 的引用无法静态分析；其余函数的结果依赖行号或相对位置，删除行后结果会变化
+_INDIRECT_FUNCTION = re.compile(r"\bINDIRECT\(", re.IGNORECASE)
+_ROW_SENSITIVE_FUNCTIONS = re.compile(r"\b(?:ROW|OFFSET|ADDRESS|CELL)\(", re.IGNORECASE)
+
+
+class UnsafeReference(Exception):
+    """删除行后无法保持有效的引用；sheet 为 None 时表示涉及所有工作表"""
+
+    def __init__(self, sheet: Optional[str], reason: str):
+        super().__init__(reason)
+        self.sheet = sheet
+        self.reason = reason
+
+
+@dataclass
+class CompactReport:
+    """精简结果"""
+    removed_sheets: List[str] = field(default_factory=list)
+    removed_rows: Dict[str, int] = field(default_factory=dict)  # 工作表 -> 删除的行数
+    skipped_rows: Dict[str, str] = field(default_factory=dict)  # 工作表 -> 行未删除的原因
+
+    def describe(self) -> str:
+        parts = [f"删除工作表 {len(self.removed_sheets)} 个"]
+        parts.extend(f"{sheet} 删除 {count} 行" for sheet, count in self.removed_rows.items())
+        parts.extend(f"{sheet} 保留隐藏行（{reason}）" for sheet, reason in self.skipped_rows.items())
+        return "，".join(parts)
+
+
+class RowMapper:
+    """删除行后的行号映射"""
+
+    def __init__(self, deleted_rows: Iterable[int]):
+        self.deleted = sorted(set(deleted_rows))
+        self._deleted_set = set(self.deleted)
+
+    def is_deleted(self, row: int) -> bool:
+        return row in self._deleted_set
+
+    def shift(self, row: int) -> int:
+        """未删除的行在删除后的行号"""
+        return row - bisect.bisect_left(self.deleted, row)
+
+    def next_kept(self, row: int) -> int:
+        while row in self._deleted_set:
+            row += 1
+        return row
+
+    def prev_kept(self, row: int) -> int:
+        while row in self._deleted_set:
+            row -= 1
+        return row
+
+    def runs(self) -> List[Tuple[int, int]]:
+        """连续的删除行，(起始行, 行数)，从下往上排列"""
+        runs = []
+        for row in self.deleted:
+            if runs and runs[-1][0] + runs[-1][1] == row:
+                runs[-1][1] += 1
+            else:
+                runs.append([row, 1])
+        return [(start, count) for start, count in reversed(runs)]
+
+
+def split_sheet(ref: str) -> Tuple[Optional[str], str]:
+    """'Sheet 1'!A1 -> ('Sheet 1', 'A1')；没有工作表前缀时工作表为 None"""
+    if "!" not in ref:
+        return None, ref
+    sheet, _, address = ref.rpartition("!")
+    if sheet.startswith("'") and sheet.endswith("'"):
+        sheet = sheet[1:-1].replace("''", "'")
+    return sheet, address
+
+
+def _tokenize(formula: str) -> Optional[Tokenizer]:
+    try:
+        return Tokenizer(formula if formula.startswith("=") else f"={formula}")
+    except Exception:
+        return None
+
+
+def _range_tokens(tokenizer: Tokenizer) -> Iterator[Token]:
+    for token in tokenizer.items:
+        if token.type == Token.OPERAND and token.subtype == Token.RANGE:
+            yield token
+
+
+def _referenced_sheets(formula: str, sheet_names: List[str]) -> Optional[Set[str]]:
+    """公式引用的工作表；无法解析时返回 None"""
+    tokenizer = _tokenize(formula)
+    if tokenizer is None:
+        return None
+    sheets = set()
+    for token in _range_tokens(tokenizer):
+        sheet, _ = split_sheet(token.value)
+        if sheet is None or sheet.startswith("["):
+            continue
+        if ":" in sheet and sheet not in sheet_names:
+            # 三维引用 Sheet1:Sheet3!A1，包含两端之间的所有工作表
+            first, _, last = sheet.partition(":")
+            if first in sheet_names and last in sheet_names:
+                start, end = sorted((sheet_names.index(first), sheet_names.index(last)))
+                sheets.update(sheet_names[start:end + 1])
+            continue
+        sheets.add(sheet)
+    return sheets
+
+
+def _chart_formulas(charts) -> Iterator[str]:
+    """图表数据系列引用的区域"""
+    for chart in charts:
+        for series in getattr(chart, "series", []):
+            for attr in ("val", "cat", "xVal", "yVal", "tx"):
+                source = getattr(series, attr, None)
+                for ref_attr in ("numRef", "strRef"):
+                    ref = getattr(source, ref_attr, None)
+                    if ref is not None and ref.f:
+                        yield ref.f
+
+
+def _cell_formulas(ws, skip_rows: Optional[RowMapper] = None) -> Iterator[Tuple[object, str]]:
+    """工作表中的公式单元格 (单元格, 公式)，跳过 skip_rows 中将被删除的行"""
+    for row in ws.iter_rows():
+        for cell in row:
+            value = cell.value
+            if skip_rows is not None and skip_rows.is_deleted(cell.row):
+                continue
+            if isinstance(value, ArrayFormula):
+                yield cell, value.text
+            elif isinstance(value, str) and value.startswith("="):
+                yield cell, value
+
+
+def _auxiliary_formulas(ws) -> Iterator[str]:
+    """数据验证、条件格式、定义名称和图表中的公式"""
+    for validation in ws.data_validations.dataValidation:
+        for formula in (validation.formula1, validation.formula2):
+            if formula:
+                yield formula
+    for conditional in ws.conditional_formatting:
+        for rule in conditional.rules:
+            yield from rule.formula or []
+    for defined_name in ws.defined_names.values():
+        yield defined_name.attr_text
+    yield from _chart_formulas(ws._charts)
+
+
+def removable_sheets(wb) -> List[str]:
+    """没有被可见内容直接或间接引用的隐藏工作表（veryHidden 工作表由模板作者有意隐藏，不删除）"""
+    sheet_names = wb.sheetnames
+    sheets = {ws.title: ws for ws in wb.worksheets}
+    hidden = {title for title, ws in sheets.items() if ws.sheet_state == "hidden"}
+
+    # 可见工作表、图表页和工作簿级定义名称引用的工作表是必须保留的起点
+    roots = [title for title in sheet_names if title not in hidden]
+    root_formulas = [defined_name.attr_text for defined_name in wb.defined_names.values()]
+    for chartsheet in wb.chartsheets:
+        root_formulas.extend(_chart_formulas(chartsheet._charts))
+    for formula in root_formulas:
+        referenced = _referenced_sheets(formula, sheet_names)
+        if referenced is None:
+            return []
+        roots.extend(referenced)
+
+    keep = set()
+    pending = [title for title in roots if title in sheet_names]
+    while pending:
+        title = pending.pop()
+        if title in keep:
+            continue
+        keep.add(title)
+        ws = sheets.get(title)
+        if ws is None:
+            continue
+        formulas = [formula for _, formula in _cell_formulas(ws)]
+        formulas.extend(_auxiliary_formulas(ws))
+        for formula in formulas:
+            referenced = _referenced_sheets(formula, sheet_names)
+            if referenced is None:
+                # 公式无法解析时不确定引用了哪些工作表，保留所有工作表
+                return []
+            pending.extend(referenced - keep)
+    return [title for title in sheet_names if title in hidden and title not in keep]
+
+
+def remove_sheets(wb, titles: List[str]):
+    """删除工作表，并保证活动工作表仍然有效"""
+    if not titles:
+        return
+    active = wb.active
+    for title in titles:
+        wb.remove(wb[title])
+    if active is None or active.title in titles:
+        visible = [index for index, ws in enumerate(wb.worksheets) if ws.sheet_state == "visible"]
+        wb.active = visible[0] if visible else 0
+    else:
+        wb.active = wb.worksheets.index(active)
+    for view in wb.views:
+        view.firstSheet = 0
+
+
+def _remap_address(address: str, sheet: str, mapper: RowMapper) -> str:
+    """改写一个地址中的行号；引用被删除的单元格或区域内的行全部被删除时抛出 UnsafeReference"""
+    endpoints = address.split(":")
+    matches = [_ENDPOINT.match(endpoint) for endpoint in endpoints]
+    if len(endpoints) > 2 or any(match is None for match in matches):
+        raise UnsafeReference(sheet, f"无法解析的引用 {address}")
+    rows = [match.group(3) for match in matches]
+    if all(row is None for row in rows):
+        # 整列引用 A:A，不受删除行影响
+        return address
+    if any(row is None for row in rows):
+        raise UnsafeReference(sheet, f"无法解析的引用 {address}")
+
+    rows = [int(row) for row in rows]
+    if len(endpoints) == 1:
+        if mapper.is_deleted(rows[0]):
+            raise UnsafeReference(sheet, f"引用了被删除的单元格 {address}")
+        new_rows = [mapper.shift(rows[0])]
+    else:
+        top, bottom = min(rows), max(rows)
+        first, last = mapper.next_kept(top), mapper.prev_kept(bottom)
+        if first > last:
+            raise UnsafeReference(sheet, f"引用的区域 {address} 将被全部删除")
+        new_top, new_bottom = mapper.shift(first), mapper.shift(last)
+        new_rows = [new_top, new_bottom] if rows[0] <= rows[1] else [new_bottom, new_top]
+
+    return ":".join(
+        f"{match.group(1) or ''}{match.group(2)}{new_row}" for match, new_row in zip(matches, new_rows)
+    )
+
+
+def rewrite_formula(formula: str, host_sheet: Optional[str], mappers: Dict[str, RowMapper]) -> str:
+    """
+    按删除行后的行号改写公式中指向 mappers 中工作表的引用
+
+    host_sheet 为公式所在工作表（不带工作表前缀的地址指向该工作表），定义名称等不属于任何工作表时为 None
+    """
+    has_prefix = formula.startswith("=")
+    tokenizer = _tokenize(formula)
+    if tokenizer is None:
+        raise UnsafeReference(None, "无法解析的公式")
+    if _INDIRECT_FUNCTION.search(formula):
+        raise UnsafeReference(None, "公式中使用了 INDIRECT")
+
+    changed = False
+    for token in _range_tokens(tokenizer):
+        sheet, address = split_sheet(token.value)
+        if sheet is not None and ":" in sheet and sheet not in mappers:
+            if any(name in sheet.split(":") for name in mappers):
+                raise UnsafeReference(None, f"三维引用 {token.value}")
+            continue
+        target = host_sheet if sheet is None else sheet
+        mapper = mappers.get(target)
+        if mapper is None:
+            continue
+        if sheet is None and _ENDPOINT.match(address.split(":")[0]) is None:
+            # 不带工作表前缀、也不是地址的操作数为定义名称，定义名称单独改写
+            continue
+        if _ROW_SENSITIVE_FUNCTIONS.search(formula):
+            raise UnsafeReference(target, "公式中使用了依赖行号的函数（ROW / OFFSET 等）")
+        new_address = _remap_address(address, target, mapper)
+        if new_address != address:
+            token.value = token.value[:len(token.value) - len(address)] + new_address
+            changed = True
+
+    if host_sheet in mappers and _ROW_SENSITIVE_FUNCTIONS.search(formula):
+        raise UnsafeReference(host_sheet, "公式中使用了依赖行号的函数（ROW / OFFSET 等）")
+    if not changed:
+        return formula
+    rendered = tokenizer.render()
+    return rendered if has_prefix else rendered[1:]
+
+
+def _range_bounds(ref: str) -> Iterator[Tuple[int, int]]:
+    """'A1:C5 E7' -> (1, 5), (7, 7)"""
+    for part in str(ref).split():
+        rows = [int(row) for row in re.findall(r"\d+", split_sheet(part)[1])]
+        if rows:
+            yield min(rows), max(rows)
+
+
+def _structure_issue(ws, mapper: RowMapper) -> Optional[str]:
+    """工作表中会随删除行错位、且不做改写的结构；返回原因，没有时返回 None"""
+    first_deleted = mapper.deleted[0]
+    if ws.tables:
+        return "包含表格"
+    if ws._images or ws._charts:
+        return "包含图片或图表"
+    if ws._hyperlinks:
+        return "包含超链接"
+    for conditional in ws.conditional_formatting:
+        if any(bottom >= first_deleted for _, bottom in _range_bounds(conditional.sqref)):
+            return "删除行以下存在条件格式"
+    for validation in ws.data_validations.dataValidation:
+        if any(bottom >= first_deleted for _, bottom in _range_bounds(validation.sqref)):
+            return "删除行以下存在数据验证"
+    if ws.auto_filter.ref and any(bottom >= first_deleted for _, bottom in _range_bounds(ws.auto_filter.ref)):
+        return "删除行以下存在筛选"
+    for merged in ws.merged_cells.ranges:
+        if any(mapper.is_deleted(row) for row in range(merged.min_row, merged.max_row + 1)):
+            return f"合并单元格 {merged.coord} 包含被删除的行"
+    return None
+
+
+def _check_references(wb, mappers: Dict[str, RowMapper]):
+    """检查删除 mappers 中的行后，所有引用能否保持有效；不能时抛出 UnsafeReference"""
+    for ws in wb.worksheets:
+        for _, formula in _cell_formulas(ws, mappers.get(ws.title)):
+            rewrite_formula(formula, ws.title, mappers)
+        for defined_name in ws.defined_names.values():
+            rewrite_formula(defined_name.attr_text, ws.title, mappers)
+        # 条件格式、数据验证中的相对引用相对于其应用区域，引用了要删除行的工作表时不做改写
+        auxiliary = [rule_formula for conditional in ws.conditional_formatting
+                     for rule in conditional.rules for rule_formula in rule.formula or []]
+        auxiliary.extend(formula for validation in ws.data_validations.dataValidation
+                         for formula in (validation.formula1, validation.formula2) if formula)
+        auxiliary.extend(_chart_formulas(ws._charts))
+        for formula in auxiliary:
+            referenced = _referenced_sheets(formula, wb.sheetnames)
+            if referenced is None:
+                raise UnsafeReference(None, "无法解析的条件格式 / 数据验证公式")
+            for sheet in referenced & mappers.keys():
+                raise UnsafeReference(sheet, f"被 {ws.title} 的条件格式 / 数据验证 / 图表引用")
+    for defined_name in wb.defined_names.values():
+        rewrite_formula(defined_name.attr_text, None, mappers)
+    for chartsheet in wb.chartsheets:
+        for formula in _chart_formulas(chartsheet._charts):
+            for sheet in (_referenced_sheets(formula, wb.sheetnames) or set(mappers)) & mappers.keys():
+                raise UnsafeReference(sheet, "被图表页引用")
+
+
+def _apply_row_removal(wb, mappers: Dict[str, RowMapper]):
+    """改写引用后删除行（调用前需已通过 _check_references）"""
+    for ws in wb.worksheets:
+        for cell, formula in _cell_formulas(ws, mappers.get(ws.title)):
+            new_formula = rewrite_formula(formula, ws.title, mappers)
+            if new_formula == formula:
+                continue
+            if isinstance(cell.value, ArrayFormula):
+                cell.value.text = new_formula
+            else:
+                cell.value = new_formula
+        for defined_name in ws.defined_names.values():
+            defined_name.attr_text = rewrite_formula(defined_name.attr_text, ws.title, mappers)
+    for defined_name in wb.defined_names.values():
+        defined_name.attr_text = rewrite_formula(defined_name.attr_text, None, mappers)
+
+    for title, mapper in mappers.items():
+        ws = wb[title]
+        # 打印区域和打印标题
+        if ws.print_area:
+            ws.print_area = [
+                _remap_address(split_sheet(area)[1].replace("$", ""), title, mapper)
+                for area in ws.print_area.split(",")
+            ]
+        if ws.print_title_rows:
+            ws.print_title_rows = _remap_address(ws.print_title_rows.replace("$", ""), title, mapper)
+
+        # 删除行以下的合并单元格整体上移
+        for merged in ws.merged_cells.ranges:
+            offset = mapper.shift(merged.min_row) - merged.min_row
+            if offset:
+                merged.shift(row_shift=offset)
+
+        # 行高、隐藏状态等行属性随行号移动
+        dimensions = [(row, dim) for row, dim in ws.row_dimensions.items() if not mapper.is_deleted(row)]
+        for start, count in mapper.runs():
+            ws.delete_rows(start, count)
+        ws.row_dimensions.clear()
+        for row, dim in dimensions:
+            dim.index = mapper.shift(row)
+            ws.row_dimensions[dim.index] = dim
+
+
+def remove_rows(wb, rows_by_sheet: Dict[str, Iterable[int]], report: CompactReport):
+    """删除各工作表中的指定行；引用无法安全改写的工作表保留原样，原因记录在 report 中"""
+    mappers = {}
+    for title, rows in rows_by_sheet.items():
+        mapper = RowMapper(rows)
+        if title not in wb.sheetnames or not mapper.deleted:
+            continue
+        issue = _structure_issue(wb[title], mapper)
+        if issue:
+            report.skipped_rows[title] = issue
+            continue
+        mappers[title] = mapper
+
+    # 逐个排除存在不安全引用的工作表，直到剩余工作表的引用都能改写
+    while mappers:
+        try:
+            _check_references(wb, mappers)
+            break
+        except UnsafeReference as e:
+            excluded = list(mappers) if e.sheet is None or e.sheet not in mappers else [e.sheet]
+            for title in excluded:
+                report.skipped_rows[title] = e.reason
+                del mappers[title]
+
+    if mappers:
+        _apply_row_removal(wb, mappers)
+        for title, mapper in mappers.items():
+            report.removed_rows[title] = len(mapper.deleted)
+
+
+def compact_workbook(wb, rows_by_sheet: Optional[Dict[str, Iterable[int]]] = None) -> CompactReport:
+    """
+    精简工作簿：删除未被引用的隐藏工作表；rows_by_sheet 不为空时再删除各工作表中的指定行（通常为被隐藏的行）
+
+    Returns:
+        CompactReport：删除的工作表、各工作表删除的行数以及未删除行的原因
+    """
+    report = CompactReport()
+    titles = removable_sheets(wb)
+    remove_sheets(wb, titles)
+    report.removed_sheets = titles
+    if rows_by_sheet:
+        remove_rows(wb, rows_by_sheet, report)
+    return report
@@ -0,0 +1,102 @@
+"""
+工作进程回收模块
+长时间运行的工作进程中，torch 内存分配器缓存和 openpyxl 大模板产生的对象会使常驻内存持续增长。
+处理任务数或常驻内存超过阈值时，工作进程进入排空状态：不再接受新任务，已接受的任务处理完成后退出，
+由监督进程（supervisor.py）重新启动一个新的工作进程。任务状态在退出时保存，新进程启动时恢复
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from utils.runtime_monitor import current_rss_bytes
+
+# 监督进程启动工作进程时设置该环境变量；没有监督进程时回收会让服务直接停止，因此不启用
+SUPERVISED_ENV = "WORKER_SUPERVISED"
+
+
+class WorkerRecycler:
+    """
+    回收判断（在事件循环中使用）
+
+    每个任务结束后调用 task_finished()，任务数达到 max_tasks 或常驻内存超过 max_rss_bytes 时开始排空；
+    阈值为 0 表示不按该条件回收
+
+    Args:
+        max_tasks: 处理多少个任务后回收
+        max_rss_bytes: 任务结束后常驻内存超过该值时回收
+        supervised: 是否由监督进程启动（默认读取 WORKER_SUPERVISED 环境变量）
+    """
+
+    def __init__(self, max_tasks: int = 0, max_rss_bytes: int = 0, supervised: Optional[bool] = None):
+        self.max_tasks = max_tasks
+        self.max_rss_bytes = max_rss_bytes
+        self.supervised = os.getenv(SUPERVISED_ENV) == "1" if supervised is None else supervised
+        self.tasks_finished = 0
+        self.drain_reason: Optional[str] = None
+        self.drain_started: Optional[float] = None
+
+    @property
+    def configured(self) -> bool:
+        return self.max_tasks > 0 or self.max_rss_bytes > 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.configured and self.supervised
+
+    @property
+    def draining(self) -> bool:
+        return self.drain_reason is not None
+
+    def task_finished(self) -> Optional[str]:
+        """记录一个任务结束；需要开始排空时返回原因，否则（包括已在排空中）返回 None"""
+        self.tasks_finished += 1
+        if not self.enabled or self.draining:
+            return None
+        reason = None
+        if self.max_tasks and self.tasks_finished >= self.max_tasks:
+            reason = f"已处理 {self.tasks_finished} 个任务"
+        else:
+            rss = current_rss_bytes()
+            if self.max_rss_bytes and rss is not None and rss > self.max_rss_bytes:
+                reason = f"常驻内存 {rss / 1024 / 1024:.0f}MB 超过 {self.max_rss_bytes / 1024 / 1024:.0f}MB"
+        if reason:
+            self.start_draining(reason)
+        return reason
+
+    def start_draining(self, reason: str):
+        self.drain_reason = reason
+        self.drain_started = time.monotonic()
+
+    def describe(self) -> Dict[str, Any]:
+        """供运行状态接口展示"""
+        return {
+            "enabled": self.enabled,
+            "supervised": self.supervised,
+            "max_tasks": self.max_tasks,
+            "max_rss_bytes": self.max_rss_bytes,
+            "tasks_finished": self.tasks_finished,
+            "draining": self.draining,
+            "drain_reason": self.drain_reason,
+            "drain_seconds": round(time.monotonic() - self.drain_started, 1) if self.drain_started else None,
+        }
+
+
+def save_status_snapshot(path: Union[str, Path], state: Dict[str, Any]):
+    """保存任务状态快照（临时文件 + 原子替换，无法 JSON 序列化的值保存为字符串）"""
+    path = Path(path)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(state, ensure_ascii=False, default=str), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def load_status_snapshot(path: Union[str, Path]) -> Dict[str, Any]:
+    """读取任务状态快照，不存在或已损坏时返回空字典（快照保留到下次保存时覆盖，新进程异常退出时不会丢失）"""
+    path = Path(path)
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}